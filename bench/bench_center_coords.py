@@ -0,0 +1,60 @@
+"""
+Compare center_coords against the original (complex-number based) implementation.
+Run from the repository root:
+    python -m bench.bench_center_coords
+"""
+import timeit
+
+import numpy as np
+
+from src.lib import center_coords
+
+
+def center_coords_reference(ship_position, ship_heading, asteroid_positions, map_size):
+    # The original implementation, kept here as the baseline
+    center = map_size / 2
+    offset = center - ship_position
+    ship_position = ship_position.copy() + offset
+    centered_asteroids = np.mod(asteroid_positions + offset, map_size)
+    centered_asteroids -= ship_position
+    z = centered_asteroids[:, 0] + 1j * centered_asteroids[:, 1]
+    rho, phi = np.abs(z), np.angle(z)
+    phi -= ship_heading
+    phi = np.mod(phi, 2 * np.pi)
+    return np.stack([rho, phi], axis=-1)
+
+
+def time_call(fn, repeat=5):
+    # Pick a number of iterations that takes roughly 0.1s, then report the best per-call time
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, number // 2)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    rng = np.random.default_rng(0)
+    map_size = np.array([1000., 800.])
+    ship_position = np.array([900., 50.])
+    ship_heading = 1.
+
+    print(f'{"asteroids":>10} {"reference":>12} {"float64":>12} {"float64+out":>12} {"float32+out":>12}')
+    for n in [10, 100, 1000, 10_000]:
+        asteroid_positions = rng.uniform(0, 1, size=(n, 2)) * map_size
+        out64, work64 = np.empty((n, 2)), np.empty((n, 2))
+        out32, work32 = np.empty((n, 2), dtype=np.float32), np.empty((n, 2), dtype=np.float32)
+        asteroid_positions32 = asteroid_positions.astype(np.float32)
+
+        timings = [
+            time_call(lambda: center_coords_reference(ship_position, ship_heading, asteroid_positions, map_size)),
+            time_call(lambda: center_coords(ship_position, ship_heading, asteroid_positions, map_size)),
+            time_call(lambda: center_coords(ship_position, ship_heading, asteroid_positions, map_size,
+                                            out=out64, work=work64)),
+            time_call(lambda: center_coords(ship_position, ship_heading, asteroid_positions32, map_size,
+                                            out=out32, work=work32)),
+        ]
+        print(f'{n:>10} ' + ' '.join(f'{t * 1e6:>10.1f}us' for t in timings))
+
+
+if __name__ == '__main__':
+    main()
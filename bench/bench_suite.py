@@ -0,0 +1,172 @@
+"""
+Throughput of the observation and env hot paths, across asteroid counts and map sizes.
+Results are written to JSON, so that runs (e.g. before and after a change to the radar code) can be compared.
+Run from the repository root:
+    python -m bench.bench_suite --out before.json
+    ... make some changes ...
+    python -m bench.bench_suite --out after.json --compare before.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from bench.bench_center_coords import time_call
+from src import testing
+from src.envs.radar_env import get_reward
+from src.lib import ParsedState, center_coords, parse_game_state
+from src.observation import DEFAULT_FORECAST_FRAMES, DEFAULT_RADAR_ZONES, ObservationEngine
+from src.radar import get_radar
+
+ASTEROID_COUNTS = [10, 100, 1000, 10_000]
+MAP_SIZES = [(1000, 800), (4000, 3000)]
+BENCHMARKS = ['center_coords', 'get_radar', 'parse_game_state', 'observe', 'get_reward', 'env_step']
+# Anything this much slower than the baseline gets flagged by --compare
+DEFAULT_THRESHOLD = 1.1
+
+
+def make_game_state(n, map_size, seed=0):
+    # The shared fake game state, with the ship in the middle of the map, so every run sees the same layout
+    game_state = testing.make_game_state(n, seed=seed, map_size=map_size)
+    game_state['ships'][0].update(position=(map_size[0] / 2, map_size[1] / 2), heading=90., velocity=(3., -2.),
+                                  speed=np.hypot(3., -2.))
+    return game_state
+
+
+def make_benchmarks(n, map_size, with_env=True):
+    """
+    :param with_env: If False, don't build a RadarEnv (which is slow to set up) for env_step
+    :return: A dict of benchmark name -> zero-argument function, all sharing one game state
+    """
+    game_state = make_game_state(n, map_size)
+    ship = game_state['ships'][0]
+    ship_position = np.array(ship['position'], dtype=np.float64)
+    ship_heading = np.radians(ship['heading'])
+    asteroid_positions = np.array([asteroid['position'] for asteroid in game_state['asteroids']]).reshape(-1, 2)
+    asteroid_radii = np.array([asteroid['radius'] for asteroid in game_state['asteroids']])
+    map_size_array = np.array(map_size, dtype=np.float64)
+    centered = center_coords(ship_position, ship_heading, asteroid_positions, map_size_array)
+    # Built once, like the env and controllers do, so only the per-frame work is timed
+    engine = ObservationEngine(DEFAULT_RADAR_ZONES, forecast_frames=DEFAULT_FORECAST_FRAMES)
+    state = ParsedState(n)
+
+    return {
+        'center_coords': lambda: center_coords(ship_position, ship_heading, asteroid_positions, map_size_array),
+        'get_radar': lambda: get_radar(centered, asteroid_radii, DEFAULT_RADAR_ZONES),
+        'parse_game_state': lambda: parse_game_state(ship, game_state, out=state),
+        'observe': lambda: engine.observe(game_state),
+        'get_reward': lambda: get_reward(game_state),
+        'env_step': make_env_step(n, map_size) if with_env else None,
+    }
+
+
+def make_env_step(n, map_size):
+    """
+    :return: A function which takes one RadarEnv step (resetting whenever the episode ends), or None if the env can't
+             be built -- RadarEnv needs the modified Kessler game, see the README.
+    """
+    from kesslergame import Scenario
+    from src.envs import RadarEnv
+    try:
+        env = RadarEnv(Scenario(num_asteroids=n, map_size=map_size, time_limit=float('inf')))
+        env.reset(seed=0)
+    except AttributeError as exp:
+        print(f'Skipping env_step: {exp}', file=sys.stderr)
+        return None
+    action = np.zeros(2, dtype=np.float32)
+
+    def step():
+        _, _, terminated, truncated, _ = env.step(action)
+        if terminated or truncated:
+            env.reset()
+    return step
+
+
+def run(asteroid_counts, map_sizes, only=None, repeat=5):
+    results = []
+    for map_size in map_sizes:
+        for n in asteroid_counts:
+            for name, fn in make_benchmarks(n, map_size, with_env=not only or 'env_step' in only).items():
+                if fn is None or (only and name not in only):
+                    continue
+                seconds = time_call(fn, repeat=repeat)
+                results.append({'name': name, 'asteroids': n, 'map_size': list(map_size), 'seconds': seconds})
+                print(f'{name:>18} {n:>7} {str(map_size):>14} {seconds * 1e6:>12.1f}us {1 / seconds:>12.0f}/s')
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Print the speed of each result relative to the baseline run.
+    :return: The number of benchmarks which got slower by more than the threshold
+    """
+    def key(result):
+        return result['name'], result['asteroids'], tuple(result['map_size'])
+    baseline = {key(result): result['seconds'] for result in baseline['results']}
+
+    regressions = 0
+    print(f'\n{"benchmark":>18} {"n":>7} {"map":>14} {"speedup":>10}')
+    for result in results:
+        if key(result) not in baseline:
+            continue
+        ratio = result['seconds'] / baseline[key(result)]
+        flag = ''
+        if ratio > threshold:
+            regressions += 1
+            flag = '  <-- slower'
+        print(f'{result["name"]:>18} {result["asteroids"]:>7} {str(tuple(result["map_size"])):>14} '
+              f'{1 / ratio:>9.2f}x{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='A JSON file from an earlier run, to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='With --compare, flag anything this many times slower than the baseline')
+    parser.add_argument('--asteroids', type=int, nargs='+', default=ASTEROID_COUNTS)
+    parser.add_argument('--map-sizes', type=int, nargs='+', metavar='W H',
+                        help='Pairs of map width and height, e.g. --map-sizes 1000 800 4000 3000')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='Only run these benchmarks')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    map_sizes = MAP_SIZES
+    if args.map_sizes:
+        if len(args.map_sizes) % 2:
+            parser.error('--map-sizes takes pairs of width and height')
+        map_sizes = list(zip(args.map_sizes[::2], args.map_sizes[1::2]))
+
+    results = run(args.asteroids, map_sizes, only=args.only, repeat=args.repeat)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'metadata': metadata(), 'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import hashlib
+import os
+
+import numpy as np
+
+from src.radar import DEFAULT_RADAR_SECTORS, RadarGeometry
+
+DEFAULT_MAX_RADIUS = 32  # The biggest Kessler asteroid (size 4)
+DEFAULT_RHO_STEP = 2
+DEFAULT_PHI_STEPS = 32
+DEFAULT_RADIUS_STEP = 4  # Kessler's radii are multiples of 8, so these land exactly on the grid
+DEFAULT_SAMPLES = 512
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'kessler-radar')
+# Bump this whenever the table layout or the way it's built changes, so stale cached tables aren't used
+TABLE_VERSION = 1
+
+
+class CoverageTable:
+    """
+    Exact(-ish) radar coverage: how much of each asteroid's area falls in each radar zone, instead of putting its
+    whole area in the zone holding its center (see get_radar).
+
+    Working out the circle/annulus/sector intersections for every asteroid, every frame, would be far too slow, so this
+    is a lookup table, built once per radar layout. The sectors all have the same shape, so the coverage only depends
+    on the distance to the asteroid (rho), where in its sector the asteroid's center is (the phi offset), and its
+    radius.
+    The table holds, on a grid of those three, the fraction of the disc in each ring and in each sector relative to the
+    center's sector. Lookups interpolate between the grid points, for all asteroids at once, and only the asteroids
+    which actually cross the edge of a zone are looked up at all.
+    """
+
+    def __init__(self, geometry, table, rho_step, radius_step):
+        """
+        Use build() or load_or_build() instead.
+        :param table: A (rho, phi offset, radius, rings, relative sectors) array of area fractions
+        """
+        self.geometry = geometry
+        self.table = table
+        self.rho_step = rho_step
+        self.phi_step = geometry.sector_width / (table.shape[1] - 1)
+        self.radius_step = radius_step
+        self.max_rho = rho_step * (table.shape[0] - 1)
+        self.max_radius = radius_step * (table.shape[2] - 1)
+        # (rho, phi offset, radius) flattened into one axis, so each lookup is a single take()
+        self._flat = np.ascontiguousarray(table, dtype=np.float64).reshape(-1, geometry.n_zones)
+        # Ring i lies between _edges[i] and _edges[i+1]. The center and infinity aren't edges anything can cross.
+        self._edges = np.concatenate([[-np.inf], geometry.radar_zones, [np.inf]])
+
+    @classmethod
+    def build(cls, geometry, max_radius=DEFAULT_MAX_RADIUS, rho_step=DEFAULT_RHO_STEP, phi_steps=DEFAULT_PHI_STEPS,
+              radius_step=DEFAULT_RADIUS_STEP, samples=DEFAULT_SAMPLES):
+        """
+        Build the table by sampling each disc at evenly spread points. Takes a few seconds, so prefer load_or_build.
+        :param geometry: The RadarGeometry to build the table for
+        :param max_radius: The biggest asteroid radius to support. Bigger asteroids are treated as this size.
+        :param rho_step: The grid spacing in rho (distance units)
+        :param phi_steps: The number of grid steps across one sector
+        :param radius_step: The grid spacing in asteroid radius (distance units)
+        :param samples: The number of points each disc is sampled at
+        """
+        n_radius = int(np.ceil(max_radius / radius_step)) + 1
+        # Past the outer ring (plus the biggest radius), nothing can overlap the radar any more
+        n_rho = int(np.ceil((geometry.outer_radius + radius_step * (n_radius - 1)) / rho_step)) + 2
+        rhos = rho_step * np.arange(n_rho)
+        offsets = np.linspace(0, geometry.sector_width, phi_steps + 1)
+        radii = radius_step * np.arange(n_radius)
+
+        # A sunflower spiral spreads the sample points evenly over the unit disc, each standing for an equal area
+        k = np.arange(samples) + 0.5
+        golden_angle = np.pi * (3 - np.sqrt(5))
+        unit_points = np.sqrt(k / samples)[:, None] * np.stack([np.cos(k * golden_angle), np.sin(k * golden_angle)], 1)
+
+        table = np.zeros((n_rho, len(offsets), n_radius, geometry.n_rings, geometry.n_sectors), dtype=np.float32)
+        # The center is placed `offset` into sector 0, i.e. undo the shift that geometry.bin applies
+        center_phis = offsets - geometry.sector_offset
+        for i, rho in enumerate(rhos):
+            # (offsets, radii, samples) points, in cartesian coordinates relative to the reference point
+            centers = rho * np.stack([np.cos(center_phis), np.sin(center_phis)], axis=-1)
+            points = centers[:, None, None, :] + radii[None, :, None, None] * unit_points[None, None]
+            ring, sector = geometry.bin(np.hypot(points[..., 0], points[..., 1]),
+                                        np.arctan2(points[..., 1], points[..., 0]))
+            inside = ring < geometry.n_rings
+            # Count the samples in each (ring, sector), for every (offset, radius) cell at once
+            cells = np.arange(len(offsets) * n_radius).reshape(len(offsets), n_radius, 1)
+            bins = (cells * geometry.n_zones + ring * geometry.n_sectors + sector)[inside]
+            counts = np.bincount(bins, minlength=len(offsets) * n_radius * geometry.n_zones)
+            table[i] = counts.reshape(len(offsets), n_radius, geometry.n_rings, geometry.n_sectors) / samples
+        return cls(geometry, table, rho_step, radius_step)
+
+    @classmethod
+    def load_or_build(cls, geometry, cache_dir=DEFAULT_CACHE_DIR, **build_kwargs):
+        """
+        Load the table for this radar layout from the cache directory, or build it (and cache it) if it isn't there.
+        :param build_kwargs: See build()
+        """
+        settings = dict(max_radius=DEFAULT_MAX_RADIUS, rho_step=DEFAULT_RHO_STEP, phi_steps=DEFAULT_PHI_STEPS,
+                        radius_step=DEFAULT_RADIUS_STEP, samples=DEFAULT_SAMPLES)
+        settings.update(build_kwargs)
+        key = repr((TABLE_VERSION, geometry.radar_zones.tolist(), geometry.n_sectors, sorted(settings.items())))
+        path = os.path.join(cache_dir, f'coverage-{hashlib.sha1(key.encode()).hexdigest()[:16]}.npy')
+        if os.path.exists(path):
+            return cls(geometry, np.load(path), settings['rho_step'], settings['radius_step'])
+
+        coverage = cls.build(geometry, **settings)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first, so another process never sees half a table
+        tmp_path = f'{path}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, coverage.table)
+        os.replace(tmp_path, path)
+        return coverage
+
+    def fractions(self, rho, offset, radii):
+        """
+        :param rho: An (N,) array of asteroid distances
+        :param offset: An (N,) array of how far (in radians) each asteroid's center is into its sector
+        :param radii: An (N,) array of asteroid radii
+        :return: An (N, rings, sectors) array of the fraction of each asteroid's area in each ring and relative sector.
+                 Relative sector k of an asteroid is k sectors counter-clockwise of the one holding its center.
+        """
+        n_rho, n_phi, n_radius = self.table.shape[:3]
+        # Bilinear in rho and phi. The radius is rounded to the nearest grid point instead, which halves the work, and
+        # is exact for Kessler's asteroids (whose radii are all on the grid).
+        rho_position = np.clip(rho / self.rho_step, 0, n_rho - 1)
+        i = np.minimum(rho_position.astype(np.intp), n_rho - 2)
+        wi = (rho_position - i)[:, None]
+        phi_position = np.clip(offset / self.phi_step, 0, n_phi - 1)
+        j = np.minimum(phi_position.astype(np.intp), n_phi - 2)
+        wj = (phi_position - j)[:, None]
+        k = np.clip(np.rint(radii / self.radius_step), 0, n_radius - 1).astype(np.intp)
+
+        base = (i * n_phi + j) * n_radius + k
+        fractions = np.empty((len(rho), self.geometry.n_zones))
+        corner = np.empty_like(fractions)
+        self._flat.take(base, axis=0, out=fractions)
+        fractions *= (1 - wi) * (1 - wj)
+        for step, weight in ((n_radius, (1 - wi) * wj), (n_phi * n_radius, wi * (1 - wj)),
+                             ((n_phi + 1) * n_radius, wi * wj)):
+            self._flat.take(base + step, axis=0, out=corner)
+            corner *= weight
+            fractions += corner
+        fractions = fractions.reshape((len(rho),) + self.geometry.shape)
+        # Anything past the end of the table can't reach the radar at all
+        fractions[rho > self.max_rho] = 0
+        return fractions
+
+    def radar_batch(self, centered_asteroids, asteroid_radii, valid=None, out=None):
+        """
+        The exact-coverage version of get_radar_batch: each asteroid's area is split over all the zones it overlaps.
+        Overlapping asteroids are still simply summed, and each zone is capped at 1.
+        :param centered_asteroids: A (B,n,2) numpy array of asteroid positions in polar (rho, phi) format
+        :param asteroid_radii: A (B,n) numpy array of asteroid radii
+        :param valid: Optional, a (B,n) boolean array. False entries (e.g. padding) are ignored.
+        :param out: Optional, a (B, rings, sectors) array to write the radars into
+        :return: A (B, rings, sectors) numpy array of radars
+        """
+        geometry = self.geometry
+        batch_size, n = centered_asteroids.shape[:2]
+        rho = centered_asteroids[..., 0].reshape(-1)
+        phi = centered_asteroids[..., 1].reshape(-1)
+        radii = np.broadcast_to(asteroid_radii, (batch_size, n)).reshape(-1)
+        batch_index = np.repeat(np.arange(batch_size), n)
+        if valid is not None:
+            valid = valid.reshape(-1)
+            rho, phi, radii, batch_index = rho[valid], phi[valid], radii[valid], batch_index[valid]
+
+        ring, sector = geometry.bin(rho, phi)
+        offset = np.mod(phi + geometry.sector_offset, 2 * np.pi) - sector * geometry.sector_width
+        areas = np.pi * radii * radii
+
+        # Most asteroids sit entirely inside one zone (or entirely outside the radar), and are binned whole, exactly
+        # like get_radar_batch. Only the ones crossing a ring edge or a sector edge need the table.
+        ring_gap = np.minimum(rho - self._edges[ring], self._edges[ring + 1] - rho)
+        angle_gap = np.minimum(offset, geometry.sector_width - offset)
+        sector_gap = np.where(angle_gap < 0.5 * np.pi, rho * np.sin(angle_gap), rho)
+        split = (ring_gap < radii) | (sector_gap < radii)
+        whole = ~split & (ring < geometry.n_rings)
+        whole_bins = (batch_index * geometry.n_zones + ring * geometry.n_sectors + sector)[whole]
+
+        fractions = self.fractions(rho[split], offset[split], radii[split])
+        # Turn each relative sector into an absolute one, then let bincount do the summing for both kinds
+        absolute = (sector[split, None] + np.arange(geometry.n_sectors)) % geometry.n_sectors
+        split_bins = (batch_index[split, None, None] * geometry.n_zones
+                      + np.arange(geometry.n_rings)[None, :, None] * geometry.n_sectors + absolute[:, None, :])
+        split_areas = fractions * areas[split, None, None]
+
+        total_areas = np.bincount(np.concatenate([whole_bins, split_bins.ravel()]),
+                                  weights=np.concatenate([areas[whole], split_areas.ravel()]),
+                                  minlength=batch_size * geometry.n_zones)
+
+        radar_info = np.divide(total_areas.reshape((batch_size,) + geometry.shape), geometry.zone_areas[:, None],
+                               out=out)
+        np.minimum(radar_info, 1, out=radar_info)
+        return radar_info
+
+
+def get_radar_exact(centered_asteroids, asteroid_radii, radar_zones=None, n_sectors=DEFAULT_RADAR_SECTORS,
+                    cache_dir=DEFAULT_CACHE_DIR):
+    """
+    One-off, exact-coverage version of get_radar (with the table loaded from, or built into, the cache). Anything that
+    runs every frame should keep a CoverageTable instead.
+    """
+    coverage = CoverageTable.load_or_build(RadarGeometry(radar_zones, n_sectors), cache_dir=cache_dir)
+    centered_asteroids = np.asarray(centered_asteroids, dtype=np.float64).reshape(1, -1, 2)
+    return coverage.radar_batch(centered_asteroids, np.asarray(asteroid_radii, dtype=np.float64)[None])[0]
@@ -1,3 +1,4 @@
 from .radar_env import RadarEnv
+from .scenario_pool import ScenarioPool
 
-__all__ = ['RadarEnv']
+__all__ = ['RadarEnv', 'ScenarioPool']
@@ -4,101 +4,242 @@ from gymnasium import spaces
 from kesslergame import TrainerEnvironment, KesslerController
 from typing import Dict, Tuple
 from collections import deque
-from src.lib import center_coords
-from src.radar import get_radar
+from src.lib import AsteroidColumns, relative_offsets
+from src.observation import DEFAULT_FORECAST_FRAMES, DEFAULT_RADAR_ZONES, ObservationEngine
+from src.envs.scenario_pool import ScenarioPool
+from src.envs.timing import DEFAULT_TIMING_WINDOW, StepTimer
+from src.radar import DEFAULT_RADAR_SECTORS
 
 THRUST_SCALE, TURN_SCALE = 480.0, 180.0
 SHIP_MAX_SPEED = 240
-DEFAULT_RADAR_ZONES = [100, 250, 400]
-DEFAULT_FORECAST_FRAMES = 30
+# "caller" is everything between two steps, e.g. policy inference and the training algorithm
+TIMING_PHASES = ['caller', 'simulate', 'extract', 'observe', 'reward']
 
 
 class RadarEnv(gym.Env):
     def __init__(self, scenario, radar_zones=None,
-                 forecast_frames=DEFAULT_FORECAST_FRAMES):
+                 forecast_frames=DEFAULT_FORECAST_FRAMES, n_sectors=DEFAULT_RADAR_SECTORS, spatial_index=False,
+                 profile=False, profile_window=DEFAULT_TIMING_WINDOW, action_repeat=1, repeat_reward='sum',
+                 flatten_obs=False, copy_obs=True, n_ships=1, exact_coverage=False, ttc_horizon=None,
+                 track_asteroids=False, features=None, radar_normalization='slice'):
+        """
+        :param scenario: The Kessler Scenario to play, or a ScenarioPool to pick a scenario from on every reset. With a
+                         pool, reset(seed=...) is reproducible, and reset(options={'scenario_index': i}) plays a
+                         specific scenario from the pool.
+        :param profile: If True, time each phase of every step. The last step's timings go in the info dict as
+                        info['timing'], the rolling statistics at the end of each episode as info['timing_summary'],
+                        and at any time from timing_summary().
+        :param profile_window: How many recent steps the rolling statistics cover
+        :param action_repeat: Play each action for this many frames. Only the last frame is observed, which cuts both
+                              the observation cost and the number of policy calls by about this much.
+        :param repeat_reward: How to combine the rewards of the repeated frames: 'sum' adds up the reward of every
+                              frame, while 'final' takes the reward of the last frame times the number of frames
+                              (cheaper, since the frames in between aren't looked at at all).
+        :param flatten_obs: If True, the observation is a single flat float32 array instead of a dict (see
+                            ObservationEngine)
+        :param copy_obs: By default, each observation is a fresh copy. If False, the observation arrays are the env's
+                         own float32 buffers, which the next step overwrites -- only turn this off if the caller copies
+                         the observations before stepping again (like the vector envs and replay buffers do).
+        :param n_ships: The number of ships to control (the scenario needs at least this many). With more than one,
+                        the actions are (ships, 2), and the observations and rewards get a leading (ships,) axis --
+                        all of the ships are observed together, in one pass over the asteroids.
+        :param exact_coverage: If True, the radars split each asteroid over every zone it overlaps (see
+                               ObservationEngine)
+        :param ttc_horizon: If given, add the per-sector time-to-collision channel (see ObservationEngine). Pass
+                            forecast_frames=None to use it instead of the forecast.
+        :param track_asteroids: If True, self.asteroids is an AsteroidTracker, so each asteroid keeps the same ID for
+                                the whole episode (e.g. for history-based rewards or features)
+        :param features: Optional, which features to observe, e.g. ["radar", "nearest"] (see ObservationEngine).
+                         Only those are computed.
+        :param radar_normalization: 'slice' or 'legacy', see zone_areas. 'legacy' reproduces the features of the
+                                    models in src/examples/out.
+        """
+        if action_repeat < 1:
+            raise ValueError(f'action_repeat must be at least 1, got {action_repeat}')
+        if repeat_reward not in ('sum', 'final'):
+            raise ValueError(f"repeat_reward must be 'sum' or 'final', got {repeat_reward}")
+        self.action_repeat = action_repeat
+        self.repeat_reward = repeat_reward
         if radar_zones is None:
             self.radar_zones = DEFAULT_RADAR_ZONES
         else:
             self.radar_zones = radar_zones
         self.forecast_frames = forecast_frames
 
-        self.controller = DummyController()
+        self.copy_obs = copy_obs
+        self.engine = ObservationEngine(self.radar_zones, n_sectors=n_sectors, forecast_frames=forecast_frames,
+                                        spatial_index=spatial_index, dtype=np.float32, flatten=flatten_obs,
+                                        exact_coverage=exact_coverage, ttc_horizon=ttc_horizon,
+                                        track_asteroids=track_asteroids, features=features,
+                                        radar_normalization=radar_normalization)
+        self.asteroids = self.engine.asteroids
+        self.n_ships = n_ships
+        self.controllers = [DummyController() for _ in range(n_ships)]
+        self.controller = self.controllers[0]
         self.kessler_game = TrainerEnvironment()
+        self.scenario_pool = None
+        self.scenario_index = None
+        if isinstance(scenario, ScenarioPool):
+            self.scenario_pool = scenario
+            self.scenario_index, scenario = 0, scenario[0]
         self.scenario = scenario
-        self.game_generator = self.kessler_game.run_step(scenario=self.scenario, controllers=[self.controller])
+        self.game_generator = self.kessler_game.run_step(scenario=self.scenario, controllers=self.controllers)
 
-        self.observation_space = spaces.Dict(
-            {
-                # Radar: Density of asteroids in each zone
-                "radar": spaces.Box(low=0, high=1, shape=(3, 4)),
-                "forecast": spaces.Box(low=0, high=1, shape=(3, 4)),
-            }
-        )
-        self.action_space = spaces.Box(low=-1, high=1, shape=(2,))
+        if n_ships == 1:
+            self.observation_space = self.engine.observation_space
+            self.action_space = spaces.Box(low=-1, high=1, shape=(2,))
+        else:
+            self.observation_space = self.engine.ship_observation_space(n_ships)
+            self.action_space = spaces.Box(low=-1, high=1, shape=(n_ships, 2))
+
+        # The raw state of the latest frame, e.g. for recording
+        self.game_state = None
+
+        # When profiling is off, the only cost is an `is not None` check per phase
+        self.timer = StepTimer(TIMING_PHASES, profile_window) if profile else None
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed, options=options)
-        self.game_generator = self.kessler_game.run_step(scenario=self.scenario, controllers=[self.controller])
+        if self.scenario_pool is not None:
+            if options and 'scenario_index' in options:
+                self.scenario_index = options['scenario_index']
+                self.scenario = self.scenario_pool[self.scenario_index]
+            else:
+                self.scenario_index, self.scenario = self.scenario_pool.sample(self.np_random)
+        self.game_generator = self.kessler_game.run_step(scenario=self.scenario, controllers=self.controllers)
         score, perf_list, game_state = next(self.game_generator)
-        obs = get_obs(game_state, forecast_frames=self.forecast_frames, radar_zones=self.radar_zones)
-        return obs, self._get_info()
+        self.game_state = game_state
+        self.engine.reset()
+        self.engine.update(game_state)
+        obs = self._observe(game_state)
+        if self.timer is not None:
+            # The time spent resetting shouldn't count towards the caller's time
+            self.timer.start()
+        return self._copy(obs), self._get_info()
 
     def step(self, action):
-        thrust, turn_rate, fire, drop_mine = action[0] * THRUST_SCALE, action[1] * TURN_SCALE, False, False
-        self.controller.action_queue.append(tuple([thrust, turn_rate, fire, drop_mine]))
-        try:
-            score, perf_list, game_state = next(self.game_generator)
-            terminated = False
-        except StopIteration as exp:
-            score, perf_list, game_state = list(exp.args[0])
-            terminated = True
-        obs = get_obs(game_state, forecast_frames=self.forecast_frames, radar_zones=self.radar_zones)
-        reward = get_reward(game_state)
-        return obs, reward, terminated, False, self._get_info()
-
-    def _get_info(self):
-        return {}
-
-
-def get_obs(game_state, forecast_frames, radar_zones):
-    ship = game_state['ships'][0]
-    ship_position = np.array(ship['position'], dtype=np.float64)
-    ship_heading = np.radians(ship['heading'])
-    ship_velocity = np.array(ship['velocity'], dtype=np.float64)
-    ship_speed = np.array([ship['speed']])
-
-    asteroids = game_state['asteroids']
-    asteroid_positions = np.array([asteroid['position'] for asteroid in asteroids], dtype=np.float64)
-    asteroid_velocity = np.array([asteroid['velocity'] for asteroid in asteroids], dtype=np.float64)
-    asteroid_radii = np.array([asteroid['radius'] for asteroid in asteroids])
-    map_size = np.array(game_state['map_size'])
-
-    ship_future_position = ship_position + (forecast_frames * ship_velocity)
-    asteroid_future_positions = asteroid_positions + (forecast_frames * asteroid_velocity)
-
-    centered_asteroids = center_coords(ship_position, ship_heading, asteroid_positions, map_size)
-    centered_future_asteroids = center_coords(ship_future_position, ship_heading, asteroid_future_positions, map_size)
-
-    radar = get_radar(centered_asteroids, asteroid_radii, radar_zones)
-    forecast = get_radar(centered_future_asteroids, asteroid_radii, radar_zones)
-
-    obs = {
-        "radar": radar,
-        "forecast": forecast,
-    }
-
-    return obs
-
-
-def get_reward(game_state):
+        timer = self.timer
+        if timer is not None:
+            timer.mark('caller')
+        ship_actions = []
+        for thrust, turn_rate in np.reshape(action, (self.n_ships, 2)):
+            thrust, turn_rate, fire, drop_mine = thrust * THRUST_SCALE, turn_rate * TURN_SCALE, False, False
+            ship_actions.append(tuple([thrust, turn_rate, fire, drop_mine]))
+
+        reward, frames, terminated = 0., 0, False
+        while frames < self.action_repeat and not terminated:
+            # One action per frame, so nothing is left over in the queue if the game ends early
+            for controller, ship_action in zip(self.controllers, ship_actions):
+                controller.action_queue.append(ship_action)
+            try:
+                score, perf_list, game_state = next(self.game_generator)
+            except StopIteration as exp:
+                score, perf_list, game_state = list(exp.args[0])
+                terminated = True
+            frames += 1
+            self.game_state = game_state
+            if timer is not None:
+                timer.mark('simulate')
+
+            last_frame = frames == self.action_repeat or terminated
+            if not last_frame and self.repeat_reward != 'sum':
+                continue
+            # The engine extracts the asteroids once, and the reward shares them
+            self.engine.update(game_state)
+            if timer is not None:
+                timer.mark('extract')
+            if last_frame:
+                # Only the final frame is ever observed
+                obs = self._observe(game_state)
+                if timer is not None:
+                    timer.mark('observe')
+            frame_reward = self._reward(game_state)
+            if timer is not None:
+                timer.mark('reward')
+            if self.repeat_reward == 'sum':
+                reward += frame_reward
+            else:
+                # Same scale as the sum, without looking at the frames in between
+                reward = frames * frame_reward
+        return self._copy(obs), reward, terminated, False, self._get_info(episode_end=terminated)
+
+    def timing_summary(self):
+        """
+        :return: The rolling timing statistics of each phase of a step (see StepTimer.summary), or None if this env
+                 isn't profiling.
+        """
+        if self.timer is None:
+            return None
+        return self.timer.summary()
+
+    def _observe(self, game_state):
+        # The asteroids have already been extracted by engine.update()
+        if self.n_ships == 1:
+            return self.engine.observe(game_state, update=False)
+        return self.engine.observe_ships(game_state, game_state['ships'][:self.n_ships], update=False)
+
+    def _reward(self, game_state):
+        if self.n_ships == 1:
+            return get_reward(game_state, asteroids=self.asteroids, index=self.engine.index)
+        return get_ship_rewards(game_state, asteroids=self.asteroids, index=self.engine.index,
+                                ship_states=game_state['ships'][:self.n_ships])
+
+    def _copy(self, obs):
+        if not self.copy_obs:
+            return obs
+        if isinstance(obs, dict):
+            return {key: value.copy() for key, value in obs.items()}
+        return obs.copy()
+
+    def _get_info(self, episode_end=False):
+        info = {}
+        if self.scenario_pool is not None:
+            info['scenario_index'] = self.scenario_index
+        if self.timer is not None:
+            info['timing'] = dict(self.timer.last)
+            if episode_end:
+                info['timing_summary'] = self.timer.summary()
+        return info
+
+
+def get_obs(game_state, forecast_frames, radar_zones, asteroids=None, features=None):
+    """
+    One-off version of RadarEnv's observation. Anything that runs every frame should keep an ObservationEngine instead.
+    :param asteroids: Optional, an AsteroidColumns which has already been updated for this frame.
+    :param features: Optional, which features to observe (see ObservationEngine)
+    """
+    engine = ObservationEngine(radar_zones, forecast_frames=forecast_frames, features=features)
+    if asteroids is not None:
+        engine.asteroids = asteroids
+    return engine.observe(game_state, update=asteroids is None)
+
+
+def get_reward(game_state, asteroids=None, index=None):
     # It seems best if the majority of the reward comes from simply staying alive,
     # and let reinforcement learning figure out how best to actually do that.
     # However, we do want to "gently" guide the ship to sparse areas -- if any exist.
-    ship = game_state['ships'][0]
-    ship_position = np.array(ship['position'], dtype=np.float64)
-    asteroids = game_state['asteroids']
-    asteroid_positions = np.array([asteroid['position'] for asteroid in asteroids], dtype=np.float64)
-    dist = np.min(np.linalg.norm(asteroid_positions - ship_position, axis=1))
+    return get_ship_rewards(game_state, asteroids, index, ship_states=game_state['ships'][:1])[0]
+
+
+def get_ship_rewards(game_state, asteroids=None, index=None, ship_states=None):
+    """
+    get_reward for several ships at once, sharing one pass over the asteroids.
+    :param ship_states: Optional, the ships to compute the reward for. Default: every ship in the game state.
+    :return: An (M,) array, the reward of each ship
+    """
+    if ship_states is None:
+        ship_states = game_state['ships']
+    ship_positions = np.array([ship['position'] for ship in ship_states], dtype=np.float64).reshape(-1, 2)
+    if index is not None:
+        # The spatial index (if there is one) already knows which asteroids are close by
+        dist = np.array([index.nearest(ship_position)[1][0] for ship_position in ship_positions])
+    else:
+        if asteroids is None:
+            asteroids = AsteroidColumns().update(game_state['asteroids'])
+        # Remember the map wraps around, so the nearest asteroid might be on the "other side"
+        # Every ship against every asteroid at once: (ships, n, 2)
+        offsets = relative_offsets(ship_positions[:, None, :], asteroids.positions, game_state['map_size'])
+        dist = np.sqrt(np.min(np.einsum('ijk,ijk->ij', offsets, offsets), axis=1))
     return np.sqrt(dist)
 
 
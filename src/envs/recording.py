@@ -0,0 +1,41 @@
+import gymnasium as gym
+
+from src.trajectory import DEFAULT_CHUNK_FRAMES, TrajectoryWriter
+
+
+class RecordingWrapper(gym.Wrapper):
+    """
+    Records the raw game state of every frame of a RadarEnv (see TrajectoryWriter), so the observations can be
+    recomputed later for any radar configuration with a TrajectoryReader, instead of re-running the simulation.
+    """
+
+    def __init__(self, env, path, chunk_frames=DEFAULT_CHUNK_FRAMES, **writer_kwargs):
+        """
+        :param env: A RadarEnv (or a wrapper around one)
+        :param path: The directory to record into, see TrajectoryWriter
+        """
+        super().__init__(env)
+        self.writer = TrajectoryWriter(path, chunk_frames=chunk_frames, **writer_kwargs)
+        self._recorded_frames = False
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        if self._recorded_frames:
+            self.writer.end_episode()
+        self._record()
+        return obs, info
+
+    def step(self, action):
+        result = self.env.step(action)
+        self._record()
+        return result
+
+    def close(self):
+        self.writer.close()
+        super().close()
+
+    def _record(self):
+        # The env has already pulled the asteroids out of this frame, so share them instead of extracting them again
+        env = self.env.unwrapped
+        self.writer.append(env.game_state, asteroids=env.asteroids)
+        self._recorded_frames = True
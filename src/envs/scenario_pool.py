@@ -0,0 +1,61 @@
+import numpy as np
+from kesslergame import Scenario
+
+DEFAULT_POOL_SIZE = 64
+
+
+class ScenarioPool:
+    """
+    A fixed set of pre-generated Scenarios, each with its own explicit asteroid layout and seed.
+    Give one to a RadarEnv instead of a single Scenario: every reset() then just picks a scenario from the pool, so
+    nothing is generated at reset time, and reset(seed=...) always picks (and replays) the same episode.
+    The pool is plain data, so it's cheap to send to vector env workers -- each worker draws from the same pool.
+    """
+
+    def __init__(self, scenarios):
+        """
+        :param scenarios: A list of Scenarios. To reproduce episodes exactly, each should have explicit asteroid_states
+                          and a seed (see generate).
+        """
+        if not scenarios:
+            raise ValueError('A ScenarioPool needs at least one scenario')
+        self.scenarios = list(scenarios)
+
+    @classmethod
+    def generate(cls, size=DEFAULT_POOL_SIZE, num_asteroids=10, map_size=(1000, 800), seed=0, asteroid_size=4,
+                 **scenario_kwargs):
+        """
+        Generate a pool of random asteroid layouts. The whole pool is determined by the seed.
+        The asteroids are drawn the same way Kessler draws them for Scenario(num_asteroids=...): uniform positions and
+        directions, and a uniform speed up to the maximum for their size.
+        :param size: The number of scenarios
+        :param asteroid_size: The size of every asteroid, from 1 to 4
+        :param scenario_kwargs: Anything else to pass to every Scenario, e.g. ship_states or time_limit
+        """
+        rng = np.random.default_rng(seed)
+        max_speed = 60.0 * (2.0 + (4.0 - asteroid_size) / 4.0)
+        scenarios = []
+        for i in range(size):
+            positions = rng.uniform(0, 1, size=(num_asteroids, 2)) * map_size
+            angles = rng.uniform(0, 360, size=num_asteroids)
+            speeds = rng.uniform(0, max_speed, size=num_asteroids)
+            asteroid_states = [{'position': (x, y), 'angle': angle, 'speed': speed, 'size': asteroid_size}
+                               for (x, y), angle, speed in zip(positions.tolist(), angles.tolist(), speeds.tolist())]
+            # The game seeds python's random from the scenario, which covers anything else it randomizes
+            scenarios.append(Scenario(name=f'pool-{seed}-{i}', asteroid_states=asteroid_states, map_size=map_size,
+                                      seed=int(rng.integers(2 ** 31)), **scenario_kwargs))
+        return cls(scenarios)
+
+    def sample(self, np_random):
+        """
+        :param np_random: A numpy Generator, e.g. the env's np_random
+        :return: (index, scenario) of a random scenario from the pool
+        """
+        index = int(np_random.integers(len(self.scenarios)))
+        return index, self.scenarios[index]
+
+    def __getitem__(self, index):
+        return self.scenarios[index]
+
+    def __len__(self):
+        return len(self.scenarios)
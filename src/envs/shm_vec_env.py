@@ -0,0 +1,222 @@
+import multiprocessing as mp
+from typing import Callable, List
+
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.env_util import is_wrapped
+from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv
+from stable_baselines3.common.vec_env.util import dict_to_obs, obs_space_info
+
+
+class ShmVecEnv(VecEnv):
+    """
+    Runs N environments in subprocesses, like stable-baselines' SubprocVecEnv. The difference is that each worker
+    writes its observations, rewards and done flags straight into arrays in shared memory, so the only thing sent over
+    the pipes each step is a tiny "step" command and the (usually empty) info dict.
+
+    The Kessler simulation is pure python, so one environment pins one core -- to use the whole machine, use about
+    one environment per (physical) core.
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gym.Env]], start_method=None, copy_obs=True):
+        """
+        :param env_fns: One function per environment, which builds the environment. These get pickled (with
+                        cloudpickle) and sent to the workers.
+        :param start_method: The multiprocessing start method. Defaults to 'forkserver' where available.
+        :param copy_obs: By default, observations are copied out of the shared buffers before being returned, since the
+                         next step overwrites them. Only turn this off if the caller copies the observations
+                         itself before stepping again.
+        """
+        self.waiting = False
+        self.closed = False
+        self.copy_obs = copy_obs
+        n_envs = len(env_fns)
+
+        # The shared buffers have to exist before the workers start, so peek at the spaces with a throwaway env.
+        probe = env_fns[0]()
+        observation_space, action_space = probe.observation_space, probe.action_space
+        probe.close()
+
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+        ctx = mp.get_context(start_method)
+
+        self.keys, shapes, dtypes = obs_space_info(observation_space)
+        specs = {
+            'actions': ((n_envs,) + action_space.shape, action_space.dtype),
+            'rewards': ((n_envs,), np.float64),
+            'terminated': ((n_envs,), np.bool_),
+            'truncated': ((n_envs,), np.bool_),
+        }
+        for key in self.keys:
+            specs[('obs', key)] = ((n_envs,) + shapes[key], dtypes[key])
+            # SB3 wants the last observation of an episode in the info dict, but the worker auto-resets.
+            specs[('terminal_obs', key)] = ((n_envs,) + shapes[key], dtypes[key])
+        self._raw_buffers = {name: (ctx.RawArray('b', max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)),
+                                    shape, dtype)
+                             for name, (shape, dtype) in specs.items()}
+        self._buffers = _as_arrays(self._raw_buffers)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for index, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn), index, self._raw_buffers, self.keys)
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        super().__init__(n_envs, observation_space, action_space)
+
+    def step_async(self, actions):
+        self._buffers['actions'][:] = np.asarray(actions).reshape(self._buffers['actions'].shape)
+        for remote in self.remotes:
+            remote.send(('step', None))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        infos, self.reset_infos = zip(*results)
+
+        dones = self._buffers['terminated'] | self._buffers['truncated']
+        for env_idx in np.flatnonzero(dones):
+            infos[env_idx]['terminal_observation'] = dict_to_obs(
+                self.observation_space,
+                {key: self._buffers[('terminal_obs', key)][env_idx].copy() for key in self.keys})
+
+        return self._get_obs(), self._buffers['rewards'].copy(), dones, list(infos)
+
+    def reset(self):
+        for env_idx, remote in enumerate(self.remotes):
+            remote.send(('reset', (self._seeds[env_idx], self._options[env_idx])))
+        self.reset_infos = [remote.recv() for remote in self.remotes]
+        # Seeds and options are only used once
+        self._reset_seeds()
+        self._reset_options()
+        return self._get_obs()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def get_images(self):
+        for remote in self.remotes:
+            remote.send(('render', None))
+        return [remote.recv() for remote in self.remotes]
+
+    def has_attr(self, attr_name):
+        return all(self._call('has_attr', attr_name, None))
+
+    def get_attr(self, attr_name, indices=None):
+        return self._call('get_attr', attr_name, indices)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._call('set_attr', (attr_name, value), indices)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._call('env_method', (method_name, method_args, method_kwargs), indices)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._call('is_wrapped', wrapper_class, indices)
+
+    def _call(self, cmd, data, indices):
+        target_remotes = [self.remotes[i] for i in self._get_indices(indices)]
+        for remote in target_remotes:
+            remote.send((cmd, data))
+        return [remote.recv() for remote in target_remotes]
+
+    def _get_obs(self):
+        obs = {key: self._buffers[('obs', key)] for key in self.keys}
+        if self.copy_obs:
+            obs = {key: value.copy() for key, value in obs.items()}
+        return dict_to_obs(self.observation_space, obs)
+
+
+def make_shm_vec_env(env_fn, n_envs, monitor=True, start_method=None):
+    """
+    Like stable-baselines' make_vec_env, but for the shared-memory vector env.
+    :param env_fn: A function which builds a single environment, e.g. lambda: RadarEnv(scenario)
+    :param n_envs: The number of environments (i.e. worker processes)
+    :param monitor: If True, wrap each environment with a Monitor, so episode rewards and lengths get logged.
+    """
+    def make_env():
+        env = env_fn()
+        if monitor:
+            env = Monitor(env)
+        return env
+    return ShmVecEnv([make_env for _ in range(n_envs)], start_method=start_method)
+
+
+def _as_arrays(raw_buffers):
+    return {name: np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            for name, (raw, shape, dtype) in raw_buffers.items()}
+
+
+def _worker(remote, parent_remote, env_fn_wrapper, index, raw_buffers, keys):
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    buffers = _as_arrays(raw_buffers)
+    obs_buffers = [(buffers[('obs', key)][index], key) for key in keys]
+    terminal_buffers = [(buffers[('terminal_obs', key)][index], key) for key in keys]
+    action = buffers['actions'][index]
+
+    def write_obs(targets, observation):
+        for target, key in targets:
+            target[...] = observation if key is None else observation[key]
+
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                observation, reward, terminated, truncated, info = env.step(action.copy())
+                buffers['rewards'][index] = reward
+                buffers['terminated'][index] = terminated
+                buffers['truncated'][index] = truncated
+                info['TimeLimit.truncated'] = truncated and not terminated
+                reset_info = {}
+                if terminated or truncated:
+                    write_obs(terminal_buffers, observation)
+                    observation, reset_info = env.reset()
+                write_obs(obs_buffers, observation)
+                remote.send((info, reset_info))
+            elif cmd == 'reset':
+                seed, options = data
+                observation, reset_info = env.reset(seed=seed, **({'options': options} if options else {}))
+                write_obs(obs_buffers, observation)
+                remote.send(reset_info)
+            elif cmd == 'render':
+                remote.send(env.render())
+            elif cmd == 'close':
+                env.close()
+                remote.close()
+                break
+            elif cmd == 'env_method':
+                method = env.get_wrapper_attr(data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == 'get_attr':
+                remote.send(env.get_wrapper_attr(data))
+            elif cmd == 'has_attr':
+                try:
+                    env.get_wrapper_attr(data)
+                    remote.send(True)
+                except AttributeError:
+                    remote.send(False)
+            elif cmd == 'set_attr':
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == 'is_wrapped':
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f'`{cmd}` is not implemented in the worker')
+        except (EOFError, KeyboardInterrupt):
+            break
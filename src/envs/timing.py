@@ -0,0 +1,57 @@
+import time
+from collections import deque
+
+import numpy as np
+
+DEFAULT_TIMING_WINDOW = 1000
+
+
+class StepTimer:
+    """
+    Rolling timings of each phase of an env step, on the monotonic clock.
+    Call mark(phase) at the end of each phase: it records the time since the previous mark (or start()), so the phases
+    of a step just follow each other, with no extra bookkeeping. Only the last `window` samples of each phase are kept.
+    """
+
+    def __init__(self, phases, window=DEFAULT_TIMING_WINDOW):
+        """
+        :param phases: The names of the phases, in order
+        :param window: How many of the most recent samples to keep (per phase) for the statistics
+        """
+        self.phases = list(phases)
+        self.samples = {phase: deque(maxlen=window) for phase in self.phases}
+        self.last = {}
+        self._time = None
+
+    def start(self):
+        self._time = time.perf_counter()
+
+    def mark(self, phase):
+        """
+        Record the time since the last mark (or start()) as one sample of this phase. Does nothing if never started.
+        """
+        now = time.perf_counter()
+        if self._time is not None:
+            self.last[phase] = now - self._time
+            self.samples[phase].append(self.last[phase])
+        self._time = now
+
+    def summary(self):
+        """
+        :return: A dict of phase -> {'count', 'mean', 'p50', 'p99'} over the recent samples, in seconds.
+                 Phases with no samples yet are left out.
+        """
+        stats = {}
+        for phase in self.phases:
+            if not self.samples[phase]:
+                continue
+            samples = np.fromiter(self.samples[phase], dtype=np.float64)
+            p50, p99 = np.percentile(samples, [50, 99])
+            stats[phase] = {'count': len(samples), 'mean': samples.mean(), 'p50': p50, 'p99': p99}
+        return stats
+
+    def clear(self):
+        for samples in self.samples.values():
+            samples.clear()
+        self.last = {}
+        self._time = None
@@ -0,0 +1,203 @@
+"""
+Evaluate saved models over a grid of scenarios, in parallel. From the repository root, e.g.:
+    python -m src.evaluation out/5k out/50k --asteroids 10 30 --map-sizes 600 600 1000 800 --seeds 5
+"""
+import argparse
+import itertools
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from kesslergame import Scenario
+from stable_baselines3 import PPO
+
+from src.envs import RadarEnv
+
+
+def scenario_grid(num_asteroids=(10,), map_sizes=((1000, 800),), seeds=(0,), **scenario_kwargs):
+    """
+    Every combination of asteroid count, map size and seed, as a list of Scenario keyword arguments.
+    (Keyword arguments rather than Scenario objects, so they're cheap to send to the worker processes.)
+    :param scenario_kwargs: Anything else to pass to every Scenario, e.g. time_limit
+    """
+    return [dict(scenario_kwargs, num_asteroids=n, map_size=tuple(map_size), seed=seed)
+            for n, map_size, seed in itertools.product(num_asteroids, map_sizes, seeds)]
+
+
+def run_episode(model, env, deterministic=True):
+    """
+    Play one episode of the env with the model.
+    :return: A dict with the total reward, the number of steps, the survival time (in game seconds, if the env keeps
+             its game state) and the number of steps per (wall clock) second.
+    """
+    obs, _ = env.reset()
+    total_reward, steps, done = 0., 0, False
+    start = time.perf_counter()
+    while not done:
+        action, _ = model.predict(obs, deterministic=deterministic)
+        obs, reward, terminated, truncated, _ = env.step(action)
+        total_reward += reward
+        steps += 1
+        done = terminated or truncated
+    seconds = time.perf_counter() - start
+
+    game_state = getattr(env.unwrapped, 'game_state', None)
+    return {
+        'reward': total_reward,
+        'steps': steps,
+        'survival_time': game_state['time'] if game_state is not None else np.nan,
+        'steps_per_second': steps / seconds if seconds > 0 else np.nan,
+    }
+
+
+def evaluate_episode(checkpoint, scenario_kwargs, model_class=PPO, env_kwargs=None):
+    """
+    Load a checkpoint and play one episode of a scenario with it. This is what each worker process runs.
+    :return: The run_episode results, along with the checkpoint and scenario they belong to
+    """
+    model = _load_model(checkpoint, model_class)
+    env = RadarEnv(Scenario(**scenario_kwargs), **(env_kwargs or {}))
+    try:
+        result = run_episode(model, env)
+    finally:
+        env.close()
+    return dict(result, checkpoint=checkpoint, scenario=scenario_kwargs)
+
+
+def evaluate_checkpoints(checkpoints, scenarios, n_workers=None, model_class=PPO, env_kwargs=None):
+    """
+    Play one episode of every scenario with every checkpoint, spread over a pool of processes.
+    :param checkpoints: The paths of saved models, e.g. ["out/5k", "out/50k"]
+    :param scenarios: A list of Scenario keyword arguments, e.g. from scenario_grid
+    :param n_workers: The number of worker processes. Default: one per CPU. If 0, everything runs in this process.
+    :param env_kwargs: Optional, keyword arguments for RadarEnv, e.g. the radar_zones the models were trained with
+    :return: The report (see summarize), and the list of per-episode results
+    """
+    tasks = list(itertools.product(checkpoints, scenarios))
+    if n_workers == 0:
+        results = [evaluate_episode(checkpoint, scenario, model_class, env_kwargs) for checkpoint, scenario in tasks]
+    else:
+        with _make_pool(n_workers) as pool:
+            futures = [pool.submit(evaluate_episode, checkpoint, scenario, model_class, env_kwargs)
+                       for checkpoint, scenario in tasks]
+            results = [future.result() for future in futures]
+    return summarize(results), results
+
+
+def summarize(results):
+    """
+    Aggregate per-episode results into one row per checkpoint.
+    :return: A dict of checkpoint -> {'episodes', 'reward_mean', 'reward_var', 'survival_time_mean',
+             'survival_time_var', 'steps_per_second_mean'}
+    """
+    report = {}
+    for checkpoint in dict.fromkeys(result['checkpoint'] for result in results):
+        episodes = [result for result in results if result['checkpoint'] == checkpoint]
+        rewards = np.array([episode['reward'] for episode in episodes])
+        survival_times = np.array([episode['survival_time'] for episode in episodes])
+        report[checkpoint] = {
+            'episodes': len(episodes),
+            'reward_mean': rewards.mean(),
+            'reward_var': rewards.var(),
+            'survival_time_mean': survival_times.mean(),
+            'survival_time_var': survival_times.var(),
+            'steps_per_second_mean': np.mean([episode['steps_per_second'] for episode in episodes]),
+        }
+    return report
+
+
+def print_report(report):
+    print(f'{"checkpoint":>20} {"episodes":>9} {"reward":>18} {"survival (s)":>18} {"steps/s":>10}')
+    for checkpoint, row in report.items():
+        print(f'{checkpoint:>20} {row["episodes"]:>9} '
+              f'{row["reward_mean"]:>9.2f} ±{np.sqrt(row["reward_var"]):>7.2f} '
+              f'{row["survival_time_mean"]:>9.2f} ±{np.sqrt(row["survival_time_var"]):>7.2f} '
+              f'{row["steps_per_second_mean"]:>10.0f}')
+
+
+class AsyncEvaluator:
+    """
+    Evaluates checkpoints in the background, so training doesn't have to wait for the evaluation episodes.
+    Save a checkpoint, submit() it, and carry on training; collect the reports with poll() (or wait()) later.
+    """
+
+    def __init__(self, scenarios, n_workers=None, model_class=PPO, env_kwargs=None):
+        """
+        See evaluate_checkpoints for the parameters. Leave a few cores free for training itself!
+        """
+        self.scenarios = scenarios
+        self.model_class = model_class
+        self.env_kwargs = env_kwargs
+        self.pool = _make_pool(n_workers)
+        self.pending = {}
+
+    def submit(self, checkpoint):
+        """
+        Start evaluating a checkpoint. The checkpoint must already be saved to disk.
+        """
+        self.pending[checkpoint] = [self.pool.submit(evaluate_episode, checkpoint, scenario, self.model_class,
+                                                     self.env_kwargs)
+                                    for scenario in self.scenarios]
+
+    def poll(self):
+        """
+        :return: The report (see summarize) of every checkpoint which has finished since the last call, without waiting
+        """
+        finished = [checkpoint for checkpoint, futures in self.pending.items() if all(f.done() for f in futures)]
+        return self._collect(finished)
+
+    def wait(self):
+        """
+        :return: The report of every checkpoint still pending, once they have all finished
+        """
+        return self._collect(list(self.pending))
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _collect(self, checkpoints):
+        results = [future.result() for checkpoint in checkpoints for future in self.pending.pop(checkpoint)]
+        return summarize(results)
+
+
+@lru_cache(maxsize=4)
+def _load_model(checkpoint, model_class):
+    # Each worker plays many episodes, so only load each checkpoint once per process
+    return model_class.load(checkpoint, device='cpu')
+
+
+def _make_pool(n_workers):
+    # Same as ShmVecEnv: forking a process that has already started threads (e.g. torch) is asking for trouble
+    start_method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context(start_method))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('checkpoints', nargs='+')
+    parser.add_argument('--asteroids', type=int, nargs='+', default=[10])
+    parser.add_argument('--map-sizes', type=int, nargs='+', default=[1000, 800], metavar='W H',
+                        help='Pairs of map width and height')
+    parser.add_argument('--seeds', type=int, default=10, help='The number of seeds (i.e. episodes) per scenario')
+    parser.add_argument('--time-limit', type=float, default=60, help='In game seconds')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    if len(args.map_sizes) % 2:
+        parser.error('--map-sizes takes pairs of width and height')
+
+    scenarios = scenario_grid(args.asteroids, list(zip(args.map_sizes[::2], args.map_sizes[1::2])),
+                              range(args.seeds), time_limit=args.time_limit)
+    report, _ = evaluate_checkpoints(args.checkpoints, scenarios, n_workers=args.workers)
+    print_report(report)
+
+
+if __name__ == '__main__':
+    main()
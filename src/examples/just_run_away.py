@@ -2,7 +2,7 @@ import numpy as np
 
 from kesslergame import KesslerController, KesslerGame, Scenario
 from typing import Dict, Tuple
-from src.lib import parse_game_state
+from src.lib import AsteroidColumns, ParsedState, parse_game_state
 
 
 # This is an example of a simple, but "somewhat" intelligent controller:
@@ -10,14 +10,23 @@ from src.lib import parse_game_state
 # - If the asteroid is "in front" of the ship, try to turn towards it and move backwards
 # - Otherwise, the asteroid is "behind" the ship, so turn away from it and move forwards
 class OnlyRunController(KesslerController):
+    def __init__(self):
+        # Reused every frame, so we don't allocate new asteroid arrays each time
+        self.asteroids = AsteroidColumns()
+        # Likewise, parse_game_state refills this every frame
+        self.state = ParsedState()
+
     def actions(self, ship_state: Dict, game_state: Dict) -> Tuple[float, float, bool, bool]:
         # Parse the game state
-        state = parse_game_state(ship_state, game_state)
-
-        # Polar coordinates make it easy to identify the nearest asteroid, and the relative angle!
-        nearest_asteroid_idx = np.argmin(state['asteroids']['polar_positions'][:, 0])
-        asteroid_distance = state['asteroids']['polar_positions'][nearest_asteroid_idx, 0]
-        asteroid_angle = state['asteroids']['polar_positions'][nearest_asteroid_idx, 1]
+        self.asteroids.update(game_state['asteroids'])
+        # Only the polar coordinates are needed, so skip the forecasts and closest approaches
+        state = parse_game_state(ship_state, game_state, asteroids=self.asteroids, out=self.state,
+                                 fields=['polar_positions'])
+
+        # Polar coordinates make it easy to get the distance, and the relative angle! With only a handful of
+        # asteroids, checking every one of them is cheaper than building a spatial index.
+        nearest = np.argmin(state.polar_positions[:, 0])
+        asteroid_distance, asteroid_angle = state.polar_positions[nearest]
 
         # The thrust should be a number between -480 and 480, with negative meaning backwards.
         # The closer the asteroid is, the more quickly we should try to move!
@@ -1,7 +1,12 @@
+from itertools import chain
+
 import numpy as np
 
+ASTEROID_COLUMNS = 5  # x, y, vx, vy, radius
+
 
-def center_coords(ship_position, ship_heading, asteroid_positions, map_size):
+def center_coords(ship_position, ship_heading, asteroid_positions, map_size, out=None, work=None, dtype=np.float64,
+                  offsets=None):
     """
     Given a ship's position and heading, find the polar coordinates of all asteroids relative to the ship.
     For sample usage, check the unit tests!
@@ -10,6 +15,12 @@ def center_coords(ship_position, ship_heading, asteroid_positions, map_size):
                         Note that kessler-lib uses degrees, convert before calling.
     :param asteroid_positions: An (n,2) numpy array of the asteroid (x,y) positions
     :param map_size: A (2,) numpy array of the map size in (x, y) units
+    :param out: Optional, an (n,2) array to write the result into. Its dtype is used for all the math.
+    :param work: Optional, an (n,2) scratch array of the same dtype. Its contents are overwritten.
+                 Pass both out and work to avoid allocating anything.
+    :param dtype: The dtype to compute in, if out isn't given. np.float32 is faster, at the cost of some precision.
+    :param offsets: Optional, an (n,2) array of the same dtype, to keep the cartesian offsets from the ship to each
+                    asteroid in (see relative_offsets), for anything else that needs them, e.g. time_to_collision.
     :return: An (n,2) numpy array of the asteroid (rho, phi) positions relative to the ship.
              An angle of 0 indicates the asteroid is directly in front of the ship.
              The angle will always be within the range [0, 2pi)
@@ -17,74 +28,421 @@ def center_coords(ship_position, ship_heading, asteroid_positions, map_size):
                             "in front" of the ship, is **also** behind the ship at a different distance. This function
                             will only return the position with the smallest rho-value (i.e. closest to the ship), which
                             may not correspond to the visual position you might see at first-glance due to the wrapping.
-
+             The ship position and heading can also be batched, e.g. a (K,1,2) ship position and (K,1) heading with
+             (K,n,2) asteroid positions gives a (K,n,2) result.
     """
-    # I'm not confident this is the most efficient solution! But seems to work.
-    # Move the ship to the center of the map
-    center = map_size / 2
-    offset = center - ship_position
-    ship_position = ship_position.copy() + offset
+    if out is None:
+        out = np.empty(_broadcast_shape(ship_position, asteroid_positions), dtype=dtype)
+    if work is None:
+        work = np.empty_like(out)
+    rho, phi = out[..., 0], out[..., 1]
+    if offsets is None:
+        # The offsets aren't needed afterwards, so they can double as the scratch space
+        offsets = work
+        scratch, wrap_scratch = work[..., 1], work[..., 0]
+    else:
+        scratch = wrap_scratch = work[..., 0]
+    x, y = offsets[..., 0], offsets[..., 1]
 
-    # Offset everything by the same amount, and adjust anything that's now "out of bounds"
-    centered_asteroids = np.mod(asteroid_positions + offset, map_size)
+    relative_offsets(ship_position, asteroid_positions, map_size, out=offsets, scratch=rho)
 
-    # The ship is in the middle now, so the shortest path from ship <--> asteroid can never wrap around edges
-    # Now get the coordinates of each asteroid relative to the ship (i.e. the center)
-    centered_asteroids -= ship_position
-
-    # Convert cartesian coordinates to polar
-    rho, phi = c2p(centered_asteroids[:, 0], centered_asteroids[:, 1])
+    # Convert cartesian coordinates to polar (working on real arrays, rather than going through complex numbers)
+    np.arctan2(y, x, out=phi)
+    np.multiply(x, x, out=rho)
+    np.multiply(y, y, out=scratch)
+    rho += scratch
+    np.sqrt(rho, out=rho)
 
     # Rotate everything relative to the ship's heading, keep in range [0, 2pi)
     phi -= ship_heading
-    phi = np.mod(phi, 2 * np.pi)
-
-    return np.stack([rho, phi], axis=-1)
-
-
-def parse_game_state(ship_state, game_state, forecast_seconds=1):
-    ship_position = np.array(ship_state['position'], dtype=np.float64)
-    ship_heading = np.radians(ship_state['heading'])
-    ship_velocity = np.array(ship_state['velocity'], dtype=np.float64)
-    ship_speed = np.array([ship_state['speed']])
-
-    asteroids = game_state['asteroids']
-    asteroid_positions = np.array([asteroid['position'] for asteroid in asteroids], dtype=np.float64)
-    asteroid_velocity = np.array([asteroid['velocity'] for asteroid in asteroids], dtype=np.float64)
-    asteroid_radii = np.array([asteroid['radius'] for asteroid in asteroids])
-
-    map_size = np.array(game_state['map_size'])
-
-    ship_future_position = np.mod(ship_position + (forecast_seconds * ship_velocity), map_size)
-    asteroid_future_positions = np.mod(asteroid_positions + (forecast_seconds * asteroid_velocity), map_size)
-
-    centered_asteroids = center_coords(ship_position, ship_heading, asteroid_positions, map_size)
-    centered_future_asteroids = center_coords(ship_future_position, ship_heading, asteroid_future_positions, map_size)
-
-    return {
-        'ship': {
-            'ship_position': ship_position,
-            'future_position': ship_future_position,
-            'ship_heading': ship_heading,
-            'ship_velocity': ship_velocity,
-            'ship_speed': ship_speed,
-            'is_respawning': ship_state['is_respawning'],
-        },
-        'asteroids': {
-            'xy_positions': asteroid_positions,
-            'xy_future_positions': asteroid_future_positions,
-            'xy_velocity': asteroid_velocity,
-            'polar_positions': centered_asteroids,
-            'polar_future_positions': centered_future_asteroids,
-            'radii': asteroid_radii,
-            'python_obj': game_state['asteroids'],
-        },
-        'game': {
-            'map_size': map_size,
-            'time': game_state['time'],
-            'delta_time': game_state['delta_time']
-        }
-    }
+    _wrap(phi, 2 * np.pi, scratch=wrap_scratch)
+
+    return out
+
+
+def relative_offsets(ship_position, asteroid_positions, map_size, out=None, scratch=None, dtype=np.float64):
+    """
+    The cartesian (dx, dy) from the ship to each asteroid, taking the shortest way around the (wrapping) map.
+    Each offset is within [-map_size/2, map_size/2).
+    :param out: Optional, an (n,2) array to write the result into.
+    :param scratch: Optional, an (n,) scratch array of the same dtype. Pass both out and scratch to avoid allocating.
+    :return: An (n,2) numpy array of offsets. See center_coords for the other parameters.
+    """
+    if out is None:
+        out = np.empty(_broadcast_shape(ship_position, asteroid_positions), dtype=dtype)
+    if scratch is None:
+        scratch = np.empty(out.shape[:-1], dtype=out.dtype)
+    asteroid_positions = np.asarray(asteroid_positions)
+    ship_position = np.asarray(ship_position)
+    if ship_position.ndim == 1:
+        # Plain python floats are noticeably cheaper than 0-d arrays, which matters with only a few asteroids
+        ship_coords = ship_position.tolist()
+    else:
+        ship_coords = [ship_position[..., 0], ship_position[..., 1]]
+
+    # Minimum image: shift so the ship is at the center of the map, wrap, then shift back.
+    # The ship is in the middle, so the shortest path from ship <--> asteroid can never wrap around edges.
+    # Going one axis at a time is much faster than broadcasting (n,2) against (2,), which loops over the short axis.
+    for axis in range(2):
+        size = float(map_size[axis])
+        half_map = 0.5 * size
+        offset = out[..., axis]
+        np.subtract(asteroid_positions[..., axis], ship_coords[axis] - half_map, out=offset)
+        _wrap(offset, size, scratch=scratch)
+        offset -= half_map
+    return out
+
+
+def closest_approach(offsets, relative_velocities):
+    """
+    When, and how close, each asteroid passes the ship, if both keep going in a straight line.
+    :param offsets: An (n,2) numpy array of the (dx, dy) from the ship to each asteroid, e.g. from relative_offsets
+    :param relative_velocities: An (n,2) numpy array of each asteroid's velocity minus the ship's velocity
+    :return: (time, distance): two (n,) arrays, the time of the closest approach (zero if the asteroid is already
+             moving away, or not moving at all relative to the ship) and the distance between the two at that time.
+             The time is in the units of the velocities, i.e. seconds for Kessler.
+    """
+    dx, dy = offsets[..., 0], offsets[..., 1]
+    vx, vy = relative_velocities[..., 0], relative_velocities[..., 1]
+    speed_squared = vx * vx + vy * vy
+    closing = -(dx * vx + dy * vy)
+    time = np.divide(closing, speed_squared, out=np.zeros_like(closing), where=speed_squared > 0)
+    np.maximum(time, 0, out=time)
+    distance = np.hypot(dx + vx * time, dy + vy * time)
+    return time, distance
+
+
+def time_to_collision(offsets, relative_velocities, collision_distance, max_time=np.inf):
+    """
+    How long until each asteroid comes within collision_distance of the ship, if both keep going in a straight line.
+    This is the first root of |offset + velocity * t| = collision_distance, which has a closed form.
+    !! Like center_coords, this takes the shortest way around the map at the current frame, so an asteroid which only
+       comes round the edge of the map later is missed. That takes about half a map width of relative movement, which
+       is well beyond any useful horizon.
+    :param offsets: An (n,2) numpy array of the (dx, dy) from the ship to each asteroid, e.g. from relative_offsets
+    :param relative_velocities: An (n,2) numpy array of each asteroid's velocity minus the ship's velocity
+    :param collision_distance: The distance counting as a collision, e.g. the asteroid radii plus the ship radius.
+                               Anything that broadcasts against (n,).
+    :param max_time: Times beyond this (including "never") are given as max_time
+    :return: An (n,) array of the time to collision. Zero if they already overlap.
+    """
+    dx, dy = offsets[..., 0], offsets[..., 1]
+    vx, vy = relative_velocities[..., 0], relative_velocities[..., 1]
+    # a t^2 + 2 b t + c = 0
+    a = vx * vx + vy * vy
+    b = dx * vx + dy * vy
+    c = dx * dx + dy * dy - np.square(collision_distance)
+    discriminant = b * b - a * c
+    # Only approaching asteroids (b < 0) with a real root ever collide. The earlier root is -(b + sqrt(disc)) / a,
+    # written as c / (-b + sqrt(disc)) so it stays accurate when a is tiny.
+    hits = (b < 0) & (discriminant >= 0)
+    np.sqrt(np.maximum(discriminant, 0), out=discriminant)
+    discriminant -= b
+    time = np.divide(c, discriminant, out=np.full_like(c, max_time), where=hits)
+    time[c <= 0] = 0
+    np.minimum(time, max_time, out=time)
+    return time
+
+
+def _broadcast_shape(ship_position, asteroid_positions):
+    if np.ndim(ship_position) == 1:
+        return np.shape(asteroid_positions)
+    return np.broadcast_shapes(np.shape(asteroid_positions), np.shape(ship_position))
+
+
+def _wrap(values, period, scratch):
+    # In place: values mod period, as values - period * floor(values / period). Quite a bit faster than np.mod.
+    np.multiply(values, 1 / period, out=scratch)
+    np.floor(scratch, out=scratch)
+    scratch *= period
+    values -= scratch
+
+
+class AsteroidColumns:
+    """
+    A reusable, structure-of-arrays copy of game_state['asteroids'].
+    Calling update() walks the list of asteroid dicts exactly once, and writes the positions, velocities and radii
+    into a preallocated array. The array only grows (it never shrinks) when there are more asteroids than ever before,
+    so after the first few frames no new storage is needed.
+    Extract once per frame, then share the same object with all of the code that needs it (observation, reward, etc.)
+
+    !! The positions/velocities/radii properties are *views* into the storage, so they get overwritten on the next
+       update() call. Copy them if you need to hold on to them across frames.
+    """
+
+    def __init__(self, capacity=64):
+        self._storage = np.zeros((capacity, ASTEROID_COLUMNS), dtype=np.float64)
+        self.n = 0
+
+    def update(self, asteroids):
+        """
+        :param asteroids: The game_state['asteroids'] list of dicts
+        :return: self, for convenience
+        """
+        n = len(asteroids)
+        if n > len(self._storage):
+            self._storage = np.zeros((max(n, 2 * len(self._storage)), ASTEROID_COLUMNS), dtype=np.float64)
+        values = chain.from_iterable((*asteroid['position'], *asteroid['velocity'], asteroid['radius'])
+                                     for asteroid in asteroids)
+        self._storage[:n].reshape(-1)[:] = np.fromiter(values, dtype=np.float64, count=n * ASTEROID_COLUMNS)
+        self.n = n
+        return self
+
+    @property
+    def columns(self):
+        """An (n,5) array of every column: x, y, vx, vy, radius"""
+        return self._storage[:self.n]
+
+    @property
+    def positions(self):
+        """An (n,2) array of the asteroid (x, y) positions"""
+        return self._storage[:self.n, 0:2]
+
+    @property
+    def velocities(self):
+        """An (n,2) array of the asteroid (x, y) velocities"""
+        return self._storage[:self.n, 2:4]
+
+    @property
+    def radii(self):
+        """An (n,) array of the asteroid radii"""
+        return self._storage[:self.n, 4]
+
+    def __len__(self):
+        return self.n
+
+
+# The ship and game fields of a ParsedState, in the order they're stored: (name, width). Width 0 is a scalar.
+_HEADER_FIELDS = (('ship_position', 2), ('future_position', 2), ('ship_heading', 0), ('ship_velocity', 2),
+                  ('ship_speed', 0), ('is_respawning', 0), ('map_size', 2), ('time', 0), ('delta_time', 0))
+# The per-asteroid fields, each stored as its own contiguous (n, width) block. Width 0 is an (n,) array.
+_ASTEROID_FIELDS = (('xy_positions', 2), ('xy_future_positions', 2), ('xy_velocity', 2), ('polar_positions', 2),
+                    ('polar_future_positions', 2), ('xy_offsets', 2), ('time_to_closest_approach', 0),
+                    ('closest_approach_distance', 0), ('radii', 0))
+# The asteroid fields which parse_game_state can be asked for, and what each one needs computed first. The ship and
+# game fields are always filled in, as are the fields which are just copied from the game state (_COPIED_FIELDS).
+PARSED_FIELDS = {
+    'xy_positions': (),
+    'xy_velocity': (),
+    'radii': (),
+    'xy_future_positions': (),
+    'polar_positions': (),
+    # The offsets come out of the same center_coords call as the polar positions
+    'xy_offsets': ('polar_positions',),
+    'time_to_closest_approach': ('xy_offsets',),
+    'closest_approach_distance': ('xy_offsets',),
+    'polar_future_positions': ('xy_future_positions',),
+}
+_COPIED_FIELDS = frozenset(['xy_positions', 'xy_velocity', 'radii'])
+
+
+def _field_offsets(fields, start=0, n=None):
+    # name -> (start, end, shape) of each field, laid out one after another
+    offsets = {}
+    for name, width in fields:
+        size = max(width, 1) if n is None else n * max(width, 1)
+        shape = (() if width == 0 else (width,)) if n is None else ((n,) if width == 0 else (n, width))
+        offsets[name] = (start, start + size, shape)
+        start += size
+    return offsets
+
+
+def resolve_dependencies(names, needs):
+    """
+    Work out everything which has to be computed to get the given names, according to a registry of what each name
+    needs first (e.g. PARSED_FIELDS).
+    :param names: The names asked for
+    :param needs: A dict of name -> the names it needs
+    :raises ValueError: If any name (or anything it needs) isn't in the registry
+    :return: The set of names, and everything they need, directly or indirectly
+    """
+    resolved = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in needs:
+            raise ValueError(f'Unknown name {name!r}, expected one of {sorted(needs)}')
+        if name not in resolved:
+            resolved.add(name)
+            pending.extend(needs[name])
+    return resolved
+
+
+_HEADER = _field_offsets(_HEADER_FIELDS)
+HEADER_SIZE = max(end for _, end, _ in _HEADER.values())
+ASTEROID_SIZE = sum(max(width, 1) for _, width in _ASTEROID_FIELDS)
+
+
+class ParsedState:
+    """
+    Everything parse_game_state extracts about one frame, as plain attributes instead of a nested dict.
+    All of it lives in a single contiguous float64 buffer: the ship and game fields first, then each per-asteroid
+    field as its own block. The array attributes are views into that buffer, so
+      - passing the same ParsedState back to parse_game_state (as out) refills it without allocating anything, once
+        it has room for the most asteroids seen so far,
+      - copy() is a single memcpy, and pickling (e.g. to send it to another process) sends just the one buffer.
+    The scalars (ship_heading, ship_speed, is_respawning, time, delta_time) are read out of the buffer as python
+    values. The ship_heading is in radians.
+
+    fields is the set of asteroid fields which hold this frame's values (see parse_game_state's fields). Reading any
+    other asteroid field raises an AttributeError, rather than handing back whatever an earlier frame left there.
+
+    !! Like AsteroidColumns, the array attributes are overwritten when the state is refilled. Use copy() to keep a
+       frame around.
+    """
+
+    __slots__ = ('n', 'fields', '_buffer', '_work', *(name for name, width in _HEADER_FIELDS if width),
+                 *(f'_{name}' for name, _ in _ASTEROID_FIELDS))
+
+    def __init__(self, n=0):
+        """
+        :param n: The number of asteroids to make room for. It grows as needed.
+        """
+        self._allocate(np.zeros(HEADER_SIZE + n * ASTEROID_SIZE, dtype=np.float64))
+        self.resize(n)
+
+    def resize(self, n):
+        """
+        Lay the buffer out for n asteroids, growing it if needed. The contents of the asteroid fields are undefined
+        afterwards, so none of them count as filled in (the ship and game fields are kept).
+        """
+        self.fields = frozenset()
+        if HEADER_SIZE + n * ASTEROID_SIZE > len(self._buffer):
+            capacity = max(n, 2 * self.capacity)
+            buffer = np.zeros(HEADER_SIZE + capacity * ASTEROID_SIZE, dtype=np.float64)
+            buffer[:HEADER_SIZE] = self._buffer[:HEADER_SIZE]
+            self._allocate(buffer)
+        elif n == self.n:
+            return self
+        self.n = n
+        for name, (start, end, shape) in _field_offsets(_ASTEROID_FIELDS, HEADER_SIZE, n).items():
+            setattr(self, f'_{name}', self._buffer[start:end].reshape(shape))
+        return self
+
+    @property
+    def capacity(self):
+        """The most asteroids the buffer has room for, without growing"""
+        return (len(self._buffer) - HEADER_SIZE) // ASTEROID_SIZE
+
+    @property
+    def buffer(self):
+        """The flat, contiguous float64 array holding every field (a view, not a copy)"""
+        return self._buffer[:HEADER_SIZE + self.n * ASTEROID_SIZE]
+
+    @property
+    def ship_heading(self):
+        return float(self._buffer[_HEADER['ship_heading'][0]])
+
+    @property
+    def ship_speed(self):
+        return float(self._buffer[_HEADER['ship_speed'][0]])
+
+    @property
+    def is_respawning(self):
+        return bool(self._buffer[_HEADER['is_respawning'][0]])
+
+    @property
+    def time(self):
+        return float(self._buffer[_HEADER['time'][0]])
+
+    @property
+    def delta_time(self):
+        return float(self._buffer[_HEADER['delta_time'][0]])
+
+    def copy(self):
+        state = ParsedState(self.n)
+        state._buffer[:] = self.buffer
+        state.fields = self.fields
+        return state
+
+    def __len__(self):
+        return self.n
+
+    def __getstate__(self):
+        return self.n, self.buffer, self.fields
+
+    def __setstate__(self, state):
+        n, buffer, fields = state
+        self._allocate(np.ascontiguousarray(buffer, dtype=np.float64))
+        self.resize(n)
+        self.fields = fields
+
+    def _allocate(self, buffer):
+        # Every view points into the old buffer, so the next resize() has to lay them out again
+        self.n = None
+        self._buffer = buffer
+        self._work = np.empty((self.capacity, 2), dtype=np.float64)
+        for name, (start, end, shape) in _HEADER.items():
+            if shape:
+                setattr(self, name, buffer[start:end])
+
+
+def _asteroid_field(name):
+    attribute = f'_{name}'
+
+    def get(self):
+        if name not in self.fields:
+            raise AttributeError(f'{name} was not computed for this frame (see the fields of parse_game_state)')
+        return getattr(self, attribute)
+    return property(get, doc=f'The {name} of each asteroid, if it is in fields')
+
+
+for _name, _ in _ASTEROID_FIELDS:
+    setattr(ParsedState, _name, _asteroid_field(_name))
+
+
+def parse_game_state(ship_state, game_state, forecast_seconds=1, asteroids=None, out=None, fields=None):
+    """
+    Collect everything a controller might need about the ship, asteroids, and game into numpy arrays.
+    :param asteroids: Optional, an AsteroidColumns which has already been updated for this frame. Otherwise, the
+                      asteroids are extracted from scratch.
+    :param out: Optional, a ParsedState to refill (e.g. the one returned last frame), instead of making a new one
+    :param fields: Optional, the names of the asteroid fields which are actually needed (see PARSED_FIELDS). Only
+                   those, and whatever they need, are computed. Default: all of them.
+                   Reading any other asteroid field of the result raises an AttributeError (see ParsedState.fields).
+    :return: A ParsedState
+    """
+    needed = PARSED_FIELDS.keys() if fields is None else resolve_dependencies(fields, PARSED_FIELDS)
+    if asteroids is None:
+        asteroids = AsteroidColumns(len(game_state['asteroids'])).update(game_state['asteroids'])
+    state = (out if out is not None else ParsedState()).resize(asteroids.n)
+    # Everything which gets filled in below, including the fields which come out of the same calls as needed ones
+    filled = set(_COPIED_FIELDS).union(needed)
+    if 'polar_positions' in filled:
+        filled.add('xy_offsets')
+    if 'time_to_closest_approach' in filled or 'closest_approach_distance' in filled:
+        filled.update(['time_to_closest_approach', 'closest_approach_distance'])
+    state.fields = frozenset(filled)
+
+    # The ship and game fields all go in with one write
+    header = state._buffer[:HEADER_SIZE]
+    header[:] = (*ship_state['position'], 0., 0., np.radians(ship_state['heading']), *ship_state['velocity'],
+                 ship_state['speed'], ship_state['is_respawning'], *game_state['map_size'], game_state['time'],
+                 game_state['delta_time'])
+    ship_position, map_size, ship_heading = state.ship_position, state.map_size, state.ship_heading
+    np.multiply(state.ship_velocity, forecast_seconds, out=state.future_position)
+    state.future_position += ship_position
+    np.mod(state.future_position, map_size, out=state.future_position)
+
+    state.xy_positions[:] = asteroids.positions
+    state.xy_velocity[:] = asteroids.velocities
+    state.radii[:] = asteroids.radii
+    if 'xy_future_positions' in needed:
+        np.multiply(state.xy_velocity, forecast_seconds, out=state.xy_future_positions)
+        np.add(state.xy_future_positions, state.xy_positions, out=state.xy_future_positions)
+        np.mod(state.xy_future_positions, map_size, out=state.xy_future_positions)
+
+    work = state._work[:state.n]
+    if 'polar_positions' in needed:
+        center_coords(ship_position, ship_heading, state.xy_positions, map_size, out=state.polar_positions,
+                      work=work, offsets=state.xy_offsets)
+    if 'time_to_closest_approach' in needed or 'closest_approach_distance' in needed:
+        np.subtract(state.xy_velocity, state.ship_velocity, out=work)
+        state.time_to_closest_approach[:], state.closest_approach_distance[:] = closest_approach(state.xy_offsets, work)
+    if 'polar_future_positions' in needed:
+        center_coords(state.future_position, ship_heading, state.xy_future_positions, map_size,
+                      out=state.polar_future_positions, work=work)
+    return state
 
 
 def c2p(x, y):
@@ -0,0 +1,341 @@
+import numpy as np
+from gymnasium import spaces
+
+from src.coverage import CoverageTable
+from src.lib import AsteroidColumns, center_coords, resolve_dependencies, time_to_collision
+from src.radar import DEFAULT_RADAR_SECTORS, RadarGeometry, get_radar_batch
+from src.spatial import TorusGrid
+from src.tracking import AsteroidTracker
+
+DEFAULT_RADAR_ZONES = [100, 250, 400]
+DEFAULT_FORECAST_FRAMES = 30
+
+# The features the engine can observe, in the order they're laid out in the observation
+FEATURES = ['radar', 'forecast', 'ttc', 'nearest']
+# What each feature needs, and what each intermediate result needs in turn. Only what the selected features need is
+# computed, and each intermediate is computed once per frame, however many features share it.
+FEATURE_GRAPH = {
+    'radar': ('present_polar',),
+    'forecast': ('future_polar',),
+    'ttc': ('present_offsets', 'present_sectors'),
+    'nearest': ('present_sectors',),
+    # The asteroids relative to each ship (rho, phi): now, and projected to each forecast horizon
+    'present_polar': (),
+    'future_polar': (),
+    # The cartesian offsets to each asteroid now, a by-product of the polar coordinates
+    'present_offsets': ('present_polar',),
+    # The radar sector each asteroid is in now
+    'present_sectors': ('present_polar',),
+}
+
+
+class ObservationEngine:
+    """
+    Turns a Kessler game_state into the radar observation that the policy sees.
+    Build it once (e.g. in the env, or in the controller's __init__), then call observe() every frame. Training and
+    deployment should both go through this class, so the policy always sees exactly the same features.
+    The observation is made up of the selected FEATURES, and the engine only does the work those features need.
+    """
+
+    def __init__(self, radar_zones=None, n_sectors=DEFAULT_RADAR_SECTORS, forecast_frames=DEFAULT_FORECAST_FRAMES,
+                 spatial_index=False, dtype=np.float64, flatten=False, exact_coverage=False, ttc_horizon=None,
+                 track_asteroids=False, features=None, radar_normalization='slice'):
+        """
+        :param radar_zones: Optional, the outer distance of each radar ring. Default: DEFAULT_RADAR_ZONES
+        :param n_sectors: The number of angular sectors of the radar
+        :param forecast_frames: How far ahead to project the asteroids (and ship) for the "forecast" radar.
+                                Either a single horizon, giving a (rings, sectors) forecast, or a list of K horizons
+                                (e.g. [10, 30, 60, 120]), giving a (K, rings, sectors) forecast. Or None, for no
+                                forecast at all (e.g. with the "ttc" channel instead).
+        :param spatial_index: If True, build a TorusGrid of the asteroids every frame (available as self.index, e.g.
+                              for the reward), and skip any asteroids that can't possibly reach the radar.
+                              Only worth it on dense maps.
+        :param dtype: The dtype of the observations (and the observation space). The radar is computed in float64
+                      either way, and written straight into the observation buffer.
+        :param flatten: If True, the observation is a single 1-D array instead of a dict: each feature flattened, in
+                        the order of FEATURES (e.g. the present radar, followed by the forecast radar(s)).
+        :param exact_coverage: If True, split each asteroid's area over every zone it overlaps, instead of putting it
+                               all in the zone holding its center (see CoverageTable). The lookup table is loaded from
+                               the cache, or built and cached the first time a radar layout is used. Can also be a
+                               CoverageTable (built for the same radar layout) to use.
+        :param ttc_horizon: If given, add a (sectors,) "ttc" channel: how soon the first asteroid in each sector will
+                            hit the ship if everything keeps going straight, as 1 - time / ttc_horizon. So 1 is a
+                            collision right now, and 0 is nothing within ttc_horizon (in the same time units as
+                            forecast_frames).
+                            Unlike the forecast, this sees collisions at any time up to the horizon, and it's one
+                            closed-form pass over the present radar's relative positions (see time_to_collision).
+        :param track_asteroids: If True, self.asteroids is an AsteroidTracker, which gives each asteroid a stable ID
+                                from frame to frame. Call reset() at the start of every episode.
+        :param features: Optional, which of FEATURES to observe. Default: "radar", plus "forecast" unless
+                         forecast_frames is None, plus "ttc" if ttc_horizon is given. The features are:
+                           "radar": (rings, sectors), the density of asteroids in each zone
+                           "forecast": the radar forecast_frames ahead (see forecast_frames)
+                           "ttc": (sectors,), the time-to-collision channel (see ttc_horizon)
+                           "nearest": (sectors,), how close the nearest asteroid in each sector is (the edge of it),
+                                      as 1 - distance / the outer radar radius. 0 is nothing within the radar.
+                         e.g. a ship which only needs to dodge might want just ["ttc", "nearest"], which skips the
+                         radar kernel and the forecast projections altogether.
+        :param radar_normalization: How the radar densities are normalized, see zone_areas. Only the models trained
+                                    before every zone was normalized by its own area need 'legacy'.
+        """
+        if radar_zones is None:
+            radar_zones = DEFAULT_RADAR_ZONES
+        self.radar_zones = radar_zones
+        self.forecast_frames = forecast_frames
+        self.geometry = RadarGeometry(radar_zones, n_sectors, normalization=radar_normalization)
+        self.coverage = None
+        if isinstance(exact_coverage, CoverageTable):
+            self.coverage = exact_coverage
+        elif exact_coverage:
+            self.coverage = CoverageTable.load_or_build(self.geometry)
+
+        if features is None:
+            features = (['radar'] + (['forecast'] if forecast_frames is not None else [])
+                        + (['ttc'] if ttc_horizon is not None else []))
+        unknown = set(features) - set(FEATURES)
+        if unknown or not features:
+            raise ValueError(f'features must be a non-empty list out of {FEATURES}, got {list(features)}')
+        if 'forecast' in features and forecast_frames is None:
+            raise ValueError('The "forecast" feature needs forecast_frames')
+        if 'ttc' in features and ttc_horizon is None:
+            raise ValueError('The "ttc" feature needs a ttc_horizon')
+        self.features = [name for name in FEATURES if name in features]
+        self._needs = resolve_dependencies(self.features, FEATURE_GRAPH)
+
+        # The present radar is just a forecast zero frames ahead, so everything goes through the same projection
+        self.has_forecast = 'forecast' in self.features
+        self.multi_horizon = np.ndim(forecast_frames) > 0
+        present = [0] if 'present_polar' in self._needs else []
+        future = np.ravel(forecast_frames) if 'future_polar' in self._needs else []
+        self.horizons = np.concatenate([present, future]).astype(np.float64)
+        self.ttc_horizon = ttc_horizon
+        forecast_shape = self.geometry.shape
+        if self.multi_horizon:
+            forecast_shape = (np.size(forecast_frames),) + forecast_shape
+
+        # Reused from frame to frame
+        self.track_asteroids = track_asteroids
+        self.asteroids = AsteroidTracker() if track_asteroids else AsteroidColumns()
+        self.spatial_index = spatial_index
+        self.index = None
+        self._allocate(64, 1)
+
+        # The observation is written into the same buffer every frame, so observe() doesn't allocate it
+        self.dtype = dtype
+        self.flatten = flatten
+        self._forecast_shape = forecast_shape
+        # Each ship's buffer holds the radars (the present one, then each forecast horizon), followed by the
+        # per-sector channels. The radars are those of self.horizons[self._first_radar:].
+        n_forecasts = np.size(forecast_frames) if self.has_forecast else 0
+        self._first_radar = 0 if 'radar' in self.features else len(self.horizons) - n_forecasts
+        self._radar_size = (len(self.horizons) - self._first_radar) * self.geometry.n_zones
+        self._channels = {}
+        self._size = self._radar_size
+        for name in ['ttc', 'nearest']:
+            if name in self.features:
+                self._channels[name] = slice(self._size, self._size + self.geometry.n_sectors)
+                self._size += self.geometry.n_sectors
+        self._buffer = np.zeros((1, self._size), dtype=dtype)
+        self._obs = self._views(self._buffer[0])
+        self.observation_space = self.ship_observation_space(None)
+        # observe_ships() has its own buffers, sized for the number of ships
+        self._ship_buffer = self._buffer[:0]
+        self._ship_obs = None
+
+    def ship_observation_space(self, n_ships):
+        """
+        :param n_ships: The number of ships, or None for a single ship's observation_space
+        :return: The observation space of observe_ships() with this many ships: observation_space, with an extra
+                 leading (ships,) axis
+        """
+        leading = () if n_ships is None else (n_ships,)
+        if self.flatten:
+            return spaces.Box(low=0, high=1, shape=leading + (self._size,), dtype=self.dtype)
+        obs_spaces = {}
+        if 'radar' in self.features:
+            # Radar: Density of asteroids in each zone
+            obs_spaces["radar"] = spaces.Box(low=0, high=1, shape=leading + self.geometry.shape, dtype=self.dtype)
+        if self.has_forecast:
+            obs_spaces["forecast"] = spaces.Box(low=0, high=1, shape=leading + self._forecast_shape, dtype=self.dtype)
+        for name in self._channels:
+            obs_spaces[name] = spaces.Box(low=0, high=1, shape=leading + (self.geometry.n_sectors,), dtype=self.dtype)
+        return spaces.Dict(obs_spaces)
+
+    def reset(self):
+        """
+        Forget anything carried over from earlier frames (i.e. the asteroid tracking), e.g. at the start of an episode.
+        """
+        if self.track_asteroids:
+            self.asteroids.reset()
+
+    def update(self, game_state):
+        """
+        Extract the asteroids from this frame's game state. observe() does this for you, unless told otherwise.
+        :return: The AsteroidColumns, which can be shared with any other code that needs the asteroids this frame.
+        """
+        if self.track_asteroids:
+            self.asteroids.update(game_state['asteroids'], game_state['map_size'], game_state['delta_time'],
+                                  game_state['time'])
+        else:
+            self.asteroids.update(game_state['asteroids'])
+        if self.spatial_index:
+            if self.index is None or not np.array_equal(self.index.map_size, game_state['map_size']):
+                self.index = TorusGrid(game_state['map_size'])
+            self.index.build(self.asteroids.positions)
+        return self.asteroids
+
+    def observe(self, game_state, ship_state=None, update=True):
+        """
+        :param game_state: The Kessler game state
+        :param ship_state: Optional, the state of the ship to observe from. Default: the first ship in the game state.
+        :param update: If False, reuse the asteroids from the last call to update() instead of extracting them again.
+        :return: The observation, matching observation_space.
+                 !! The arrays are the engine's own buffers, so they get overwritten on the next call to observe().
+                    Copy them if you need to hold on to them.
+        """
+        if update:
+            self.update(game_state)
+        if ship_state is None:
+            ship_state = game_state['ships'][0]
+        self._observe([ship_state], game_state['map_size'], self._buffer)
+        return self._obs
+
+    def observe_ships(self, game_state, ship_states=None, update=True):
+        """
+        Observe from several ships at once. All the ships share one pass over the asteroids, so adding ships costs
+        much less than calling observe() once per ship.
+        :param ship_states: Optional, the states of the ships to observe from. Default: every ship in the game state.
+        :return: The observations of all the ships, matching ship_observation_space(len(ship_states)).
+                 The same as observe(), these are the engine's own buffers.
+        """
+        if update:
+            self.update(game_state)
+        if ship_states is None:
+            ship_states = game_state['ships']
+        n_ships = len(ship_states)
+        if len(self._ship_buffer) != n_ships:
+            self._ship_buffer = np.zeros((n_ships, self._size), dtype=self.dtype)
+            self._ship_obs = self._views(self._ship_buffer)
+        self._observe(ship_states, game_state['map_size'], self._ship_buffer)
+        return self._ship_obs
+
+    def _observe(self, ship_states, map_size, out):
+        positions, velocities, radii = self.asteroids.positions, self.asteroids.velocities, self.asteroids.radii
+        n_ships = len(ship_states)
+
+        # (ships, 5): x, y, heading, vx, vy
+        ships = np.array([(*ship_state['position'], ship_state['heading'], *ship_state['velocity'])
+                          for ship_state in ship_states], dtype=np.float64).reshape(n_ships, 5)
+        ship_positions, ship_velocities = ships[:, 0:2], ships[:, 3:5]
+        ship_headings = np.radians(ships[:, 2])[:, None, None]
+        map_size = np.array(map_size, dtype=np.float64)
+
+        if self.index is not None and n_ships == 1 and len(positions):
+            # An asteroid can't get closer to the ship than (distance now) - (relative speed * time), so anything
+            # further away than this can never show up on any of the radars
+            max_speed = np.sqrt(np.max(np.einsum('ij,ij->i', velocities, velocities))) + np.linalg.norm(ship_velocities)
+            # (With exact coverage, the edge of an asteroid can reach the radar before its center does)
+            reach = self.geometry.outer_radius + self.horizons.max() * max_speed + radii.max()
+            if 'ttc' in self._needs:
+                reach = max(reach, self.ttc_horizon * max_speed + radii.max() + ship_states[0]['radius'])
+            if reach < np.linalg.norm(map_size / 2):
+                nearby, _ = self.index.query_radius(ship_positions[0], reach)
+                positions, velocities, radii = positions[nearby], velocities[nearby], radii[nearby]
+        n = len(positions)
+
+        capacity = self._projected.shape[1]
+        if n > capacity or n_ships != self._polar.shape[0]:
+            # Only grow for more asteroids: switching between observe() and observe_ships() keeps the same capacity
+            self._allocate(max(n, 2 * capacity) if n > capacity else capacity, n_ships)
+        projected, polar, work = self._projected[:, :n], self._polar[:, :, :n], self._work[:, :, :n]
+
+        # Project the asteroids to every horizon at once: (horizons, n, 2). These are shared by all of the ships.
+        horizons = self.horizons[:, None, None]
+        np.multiply(horizons, velocities, out=projected)
+        projected += positions
+        # ... and the ships: (ships, horizons, 1, 2)
+        ship_positions = ship_positions[:, None, None, :] + horizons * ship_velocities[:, None, None, :]
+
+        # center_coords takes care of the map wrapping, and the radar kernel does all ships and horizons in one batch.
+        # Only the present offsets are ever needed, so when they are, the present horizon gets a call of its own.
+        future = 0
+        if 'present_offsets' in self._needs:
+            offsets = self._offsets[:, :, :n]
+            center_coords(ship_positions[:, :1], ship_headings, projected[:1], map_size, out=polar[:, :1],
+                          work=work[:, :1], offsets=offsets)
+            future = 1
+        if future < len(self.horizons):
+            center_coords(ship_positions[:, future:], ship_headings, projected[future:], map_size,
+                          out=polar[:, future:], work=work[:, future:])
+        if self._radar_size:
+            self._observe_radars(polar[:, self._first_radar:], radii, out)
+
+        # The per-sector channels all work from the present (horizons = 0) positions: (ships, n, 2)
+        if 'present_sectors' in self._needs:
+            # Each (ship, sector) gets its own bin, for the per-sector minimums
+            sectors = self.geometry.sector(polar[:, 0, :, 1])
+            sectors += np.arange(n_ships)[:, None] * self.geometry.n_sectors
+        if 'ttc' in self._needs:
+            self._observe_ttc(ship_states, velocities, ship_velocities, radii, offsets[:, 0], sectors,
+                              out[:, self._channels['ttc']])
+        if 'nearest' in self._needs:
+            self._observe_nearest(polar[:, 0, :, 0], radii, sectors, out[:, self._channels['nearest']])
+
+    def _observe_radars(self, polar, radii, out):
+        n_ships, n_radars, n = polar.shape[:3]
+        batch_size = n_ships * n_radars
+        batch_radii = np.broadcast_to(radii, (batch_size, n))
+        radars = out[:, :self._radar_size].reshape((n_ships, n_radars) + self.geometry.shape)
+        # With channels after each ship's radars, several ships' radars aren't one block, so this is a copy
+        batch_radars = radars.reshape((batch_size,) + self.geometry.shape)
+        # (As is polar, when the present radar was only needed for the channels)
+        batch_polar = polar.reshape(batch_size, n, 2)
+        if self.coverage is not None:
+            self.coverage.radar_batch(batch_polar, batch_radii, out=batch_radars)
+        else:
+            get_radar_batch(batch_polar, batch_radii, geometry=self.geometry, out=batch_radars)
+        if not np.shares_memory(batch_radars, out):
+            radars[:] = batch_radars.reshape(radars.shape)
+
+    def _observe_ttc(self, ship_states, velocities, ship_velocities, radii, offsets, sectors, out):
+        n_ships = len(offsets)
+        ship_radii = np.array([ship_state['radius'] for ship_state in ship_states], dtype=np.float64)
+        ttc = time_to_collision(offsets, velocities - ship_velocities[:, None, :], radii + ship_radii[:, None],
+                                max_time=self.ttc_horizon)
+
+        # The soonest collision in each (ship, sector)
+        soonest = np.full(n_ships * self.geometry.n_sectors, self.ttc_horizon, dtype=np.float64)
+        np.minimum.at(soonest, sectors.ravel(), ttc.ravel())
+        np.divide(soonest.reshape(out.shape), -self.ttc_horizon, out=out)
+        out += 1
+
+    def _observe_nearest(self, rho, radii, sectors, out):
+        # The distance to the edge of the nearest asteroid in each (ship, sector)
+        outer_radius = self.geometry.outer_radius
+        nearest = np.full(out.size, outer_radius, dtype=np.float64)
+        np.minimum.at(nearest, sectors.ravel(), np.maximum(rho - radii, 0).ravel())
+        np.divide(nearest.reshape(out.shape), -outer_radius, out=out)
+        out += 1
+
+    def _views(self, buffer):
+        # The observation, as views of a (..., size) buffer
+        if self.flatten:
+            return buffer
+        n_radars = len(self.horizons) - self._first_radar
+        radars = buffer[..., :self._radar_size].reshape(buffer.shape[:-1] + (n_radars,) + self.geometry.shape)
+        obs = {}
+        if 'radar' in self.features:
+            obs["radar"] = radars[..., 0, :, :]
+        if self.has_forecast:
+            first = 1 if 'radar' in self.features else 0
+            obs["forecast"] = radars[..., first:, :, :] if self.multi_horizon else radars[..., first, :, :]
+        for name, channel in self._channels.items():
+            obs[name] = buffer[..., channel]
+        return obs
+
+    def _allocate(self, capacity, n_ships):
+        self._projected = np.zeros((len(self.horizons), capacity, 2))
+        self._polar = np.zeros((n_ships, len(self.horizons), capacity, 2))
+        self._work = np.zeros((n_ships, len(self.horizons), capacity, 2))
+        # Just the present horizon's
+        self._offsets = np.zeros((n_ships, 1, capacity, 2)) if 'present_offsets' in self._needs else None
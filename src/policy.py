@@ -0,0 +1,146 @@
+"""
+A numpy-only copy of a trained stable-baselines MultiInputPolicy, for fast inference inside a controller.
+Export a saved model once, from the repository root:
+    python -m src.policy out/100k
+which writes out/100k.npz. Then load it with NumpyPolicy.load("out/100k.npz") -- no torch (or stable-baselines)
+needed at game time.
+"""
+import argparse
+
+import numpy as np
+
+ACTIVATIONS = {
+    'Tanh': np.tanh,
+    'ReLU': lambda x, out: np.maximum(x, 0, out=out),
+    'Identity': lambda x, out: x,
+}
+
+
+class NumpyPolicy:
+    """
+    The deterministic action of an actor-critic policy (a stack of linear layers and activations on top of the
+    flattened, concatenated observation), computed with plain numpy. The activations are preallocated, so acting on a
+    single observation doesn't allocate anything apart from the returned action.
+    """
+
+    def __init__(self, keys, key_sizes, weights, biases, activation, action_low, action_high):
+        """
+        :param keys: The observation keys, in the order the policy concatenates them
+        :param key_sizes: The flattened size of each observation
+        :param weights: The (out, in) weight matrix of each layer, the last one being the action layer
+        :param biases: The (out,) bias of each layer
+        :param activation: The name of the torch activation between the layers, e.g. "Tanh" (see ACTIVATIONS)
+        :param action_low: The lower bounds of the action space, which the actions are clipped to
+        :param action_high: The upper bounds of the action space
+        """
+        if activation not in ACTIVATIONS:
+            raise ValueError(f'Unsupported activation {activation}, expected one of {list(ACTIVATIONS)}')
+        self.keys = list(keys)
+        self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32) for b in biases]
+        self.activation = activation
+        self._activation = ACTIVATIONS[activation]
+        self.action_low = np.asarray(action_low, dtype=np.float32)
+        self.action_high = np.asarray(action_high, dtype=np.float32)
+
+        # Where each observation goes in the input vector
+        ends = np.cumsum(key_sizes)
+        self.slices = [slice(int(end - size), int(end)) for end, size in zip(ends, key_sizes)]
+        if ends[-1] != self.weights[0].shape[1]:
+            raise ValueError(f'The observations have {ends[-1]} values, but the first layer expects '
+                             f'{self.weights[0].shape[1]}')
+
+        # Reused on every call to act()
+        self._input = np.zeros(self.weights[0].shape[1], dtype=np.float32)
+        self._activations = [np.zeros(len(b), dtype=np.float32) for b in self.biases]
+
+    def act(self, obs):
+        """
+        :param obs: A single observation dict, e.g. from ObservationEngine.observe
+        :return: The (clipped) deterministic action, the same as model.predict(obs, deterministic=True)[0]
+        """
+        for key, key_slice in zip(self.keys, self.slices):
+            self._input[key_slice] = obs[key].ravel()
+        x = self._input
+        last = len(self.weights) - 1
+        for i, (w, b, out) in enumerate(zip(self.weights, self.biases, self._activations)):
+            np.dot(w, x, out=out)
+            out += b
+            if i < last:
+                out = self._activation(out, out=out)
+            x = out
+        return np.clip(x, self.action_low, self.action_high)
+
+    def act_batch(self, obs):
+        """
+        :param obs: A dict of stacked observations, each with a leading (B,) batch axis
+        :return: A (B, actions) array of the deterministic actions
+        """
+        x = np.concatenate([np.reshape(obs[key], (len(obs[key]), -1)) for key in self.keys], axis=1)
+        x = x.astype(np.float32, copy=False)
+        last = len(self.weights) - 1
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ w.T
+            x += b
+            if i < last:
+                x = self._activation(x, out=x)
+        return np.clip(x, self.action_low, self.action_high)
+
+    def save(self, path):
+        arrays = {f'weight_{i}': w for i, w in enumerate(self.weights)}
+        arrays.update({f'bias_{i}': b for i, b in enumerate(self.biases)})
+        np.savez(path, keys=np.array(self.keys), key_sizes=np.array([s.stop - s.start for s in self.slices]),
+                 activation=np.array(self.activation), action_low=self.action_low, action_high=self.action_high,
+                 n_layers=np.array(len(self.weights)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            n_layers = int(data['n_layers'])
+            return cls(data['keys'].tolist(), data['key_sizes'].tolist(),
+                       [data[f'weight_{i}'] for i in range(n_layers)], [data[f'bias_{i}'] for i in range(n_layers)],
+                       str(data['activation']), data['action_low'], data['action_high'])
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        :param model: A stable-baselines model (e.g. PPO) with a MultiInputPolicy, using the default flattening
+                      feature extractor and a continuous (Box) action space
+        """
+        policy = model.policy
+        extractors = policy.pi_features_extractor.extractors
+        if any(type(extractor).__name__ != 'Flatten' for extractor in extractors.values()):
+            raise ValueError('Only the default (flattening) feature extractor is supported')
+        keys = list(extractors.keys())
+        key_sizes = [int(np.prod(policy.observation_space[key].shape)) for key in keys]
+
+        layers = [layer for layer in policy.mlp_extractor.policy_net if hasattr(layer, 'weight')]
+        layers.append(policy.action_net)
+        activations = {type(layer).__name__ for layer in policy.mlp_extractor.policy_net
+                       if not hasattr(layer, 'weight')}
+        if len(activations) > 1:
+            raise ValueError(f'Mixed activations are not supported: {activations}')
+        activation = activations.pop() if activations else 'Identity'
+
+        def to_numpy(tensor):
+            return tensor.detach().cpu().numpy()
+        return cls(keys, key_sizes, [to_numpy(layer.weight) for layer in layers],
+                   [to_numpy(layer.bias) for layer in layers], activation,
+                   policy.action_space.low, policy.action_space.high)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', help='The saved stable-baselines model, e.g. out/100k')
+    parser.add_argument('--out', help='Where to write the exported policy. Default: the model path, as .npz')
+    args = parser.parse_args()
+
+    from stable_baselines3 import PPO
+    model = PPO.load(args.model, device='cpu')
+    out = args.out or args.model.removesuffix('.zip') + '.npz'
+    NumpyPolicy.from_model(model).save(out)
+    print(f'Wrote {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import multiprocessing as mp
+import queue
+import time
+
+import numpy as np
+
+from src.policy import NumpyPolicy
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT = 0.001  # seconds
+DEFAULT_TIMEOUT = 60  # seconds
+
+
+class PolicyServer:
+    """
+    One process holding one copy of a policy, answering the observations of many controllers (e.g. one per concurrent
+    KesslerGame process). Requests which arrive within max_wait of each other are stacked into a single batched
+    forward pass, so throughput grows with the number of games, rather than the number of model copies.
+
+        server = PolicyServer("out/100k.npz", n_clients=8)
+        # Hand server.clients[i] to game process i (as a Process argument), and use it like a NumpyPolicy:
+        #     action = client.act(obs)
+        ...
+        server.close()
+    """
+
+    def __init__(self, policy_path, n_clients, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT,
+                 start_method=None, timeout=DEFAULT_TIMEOUT):
+        """
+        :param policy_path: An exported policy, see NumpyPolicy
+        :param n_clients: The number of clients to create. Each client should only be used by one thread at a time.
+        :param max_batch: The most observations to put through the policy at once
+        :param max_wait: How long (in seconds) to wait for more requests after the first one, before running the batch
+        :param start_method: The multiprocessing start method. Defaults to 'forkserver' where available.
+        :param timeout: How long (in seconds) a client waits for its action before giving up with a TimeoutError, in
+                        case the server hangs. None waits forever. (If the server process dies, clients find out
+                        straight away, see PolicyClient.act.)
+        """
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+        ctx = mp.get_context(start_method)
+
+        self.requests = ctx.Queue()
+        receivers, senders = zip(*[ctx.Pipe(duplex=False) for _ in range(n_clients)])
+        self.clients = [PolicyClient(client_id, self.requests, receiver, timeout)
+                        for client_id, receiver in enumerate(receivers)]
+
+        # daemon=True: if the main process crashes, we should not cause things to hang
+        self.process = ctx.Process(target=_serve, args=(policy_path, self.requests, senders, max_batch, max_wait),
+                                   daemon=True)
+        self.process.start()
+        for sender in senders:
+            sender.close()
+
+    def close(self):
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PolicyClient:
+    """
+    The controller's side of a PolicyServer. Has the same act() as NumpyPolicy, so a controller can use either one.
+    """
+
+    def __init__(self, client_id, requests, responses, timeout=DEFAULT_TIMEOUT):
+        self.client_id = client_id
+        self.requests = requests
+        self.responses = responses
+        self.timeout = timeout
+
+    def act(self, obs):
+        """
+        :param obs: A single observation dict, e.g. from ObservationEngine.observe
+        :raises RuntimeError: If the server process has stopped (e.g. crashed, or was closed)
+        :raises TimeoutError: If no action arrives within the server's timeout. The late action could still turn up
+                              as the answer to the next call, so don't keep using the client after this.
+        :return: The deterministic action, see NumpyPolicy.act
+        """
+        self.requests.put((self.client_id, obs))
+        # Only the server process holds the sending end of the pipe, so if it dies, the pipe is closed and poll()
+        # returns straight away
+        if not self.responses.poll(self.timeout):
+            raise TimeoutError(f'No action from the policy server within {self.timeout} seconds')
+        try:
+            return self.responses.recv()
+        except EOFError:
+            raise RuntimeError('The policy server has stopped') from None
+
+
+def _serve(policy_path, requests, senders, max_batch, max_wait):
+    policy = NumpyPolicy.load(policy_path)
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+
+        # Micro-batching: keep collecting until the batch is full, or nothing more turns up in time
+        batch = [request]
+        deadline = time.perf_counter() + max_wait
+        while len(batch) < max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Answer what we have, then stop
+                requests.put(None)
+                break
+            batch.append(request)
+
+        client_ids, observations = zip(*batch)
+        stacked = {key: np.stack([obs[key] for obs in observations]) for key in policy.keys}
+        for client_id, action in zip(client_ids, policy.act_batch(stacked)):
+            senders[client_id].send(action)
@@ -1,9 +1,12 @@
 import numpy as np
 
 DEFAULT_RADAR_ZONES = [100, 300, 500]
+DEFAULT_RADAR_SECTORS = 4
+# How each zone's total asteroid area is turned into a density, see zone_areas
+NORMALIZATIONS = ('slice', 'legacy')
 
 
-def get_radar(centered_asteroids, asteroid_radii, radar_zones=None):
+def get_radar(centered_asteroids, asteroid_radii, radar_zones=None, out=None, normalization='slice'):
     """
     Given a list of asteroid positions **relative to some point** (e.g. the ship) and asteroid sizes,
     return a "radar" like view of the region surrounding the reference point.
@@ -11,6 +14,8 @@ def get_radar(centered_asteroids, asteroid_radii, radar_zones=None):
                                some reference point (e.g. the ship) and in polar (rho, phi) format.
     :param asteroid_radii: An (n,) numpy array of asteroid radii.
     :param radar_zones: Optional, a (3,) array of the distances that are considered "near", "middle", and "far".
+    :param out: Optional, a (3,4) array to write the radar into, e.g. a float32 observation buffer.
+    :param normalization: 'slice' or 'legacy', see zone_areas
     :return: A (3,4) numpy array representing the radar. The radar is divided into twelve zones, i.e.:
                 (Near, Middle, Far) X (Right, Front, Left, Rear)
              An index of [1, 2] would refer to "Middle-Left", while [0, 3] refers to "Near-Rear".
@@ -22,32 +27,135 @@ def get_radar(centered_asteroids, asteroid_radii, radar_zones=None):
              certain cases, the total sum of asteroid areas might exceed the area of the radar zone itself -- however,
              we artificially cap the output of each radar value at 1.
     """
-    asteroid_areas = np.pi * asteroid_radii * asteroid_radii
-    rho, phi = centered_asteroids[:, 0], centered_asteroids[:, 1]
     if radar_zones is None:
         radar_zones = DEFAULT_RADAR_ZONES
+    centered_asteroids = np.asarray(centered_asteroids, dtype=np.float64).reshape(-1, 2)
+    asteroid_radii = np.asarray(asteroid_radii, dtype=np.float64)
+    return get_radar_batch(centered_asteroids[None], asteroid_radii[None],
+                           geometry=RadarGeometry(radar_zones, normalization=normalization),
+                           out=None if out is None else out[None])[0]
 
-    is_near = rho < radar_zones[0]
-    is_medium = np.logical_and(rho < radar_zones[1], rho >= radar_zones[0])
-    is_far = np.logical_and(rho < radar_zones[2], rho >= radar_zones[1])
-
-    is_front = np.logical_or(phi < 0.25 * np.pi, phi >= 1.75 * np.pi)
-    is_left = np.logical_and(phi < 0.75 * np.pi, phi >= 0.25 * np.pi)
-    is_behind = np.logical_and(phi < 1.25 * np.pi, phi >= 0.75 * np.pi)
-    is_right = np.logical_and(phi < 1.75 * np.pi, phi >= 1.25 * np.pi)
-
-    inner_area = np.pi * radar_zones[0] * radar_zones[0]
-    middle_area = np.pi * radar_zones[1] * radar_zones[1]
-    outer_area = np.pi * radar_zones[2] * radar_zones[2]
-    # The area of one slice in the outer, middle, and inner donuts
-    slice_areas = [(outer_area - (middle_area + inner_area)) / 4, (middle_area - inner_area) / 4, inner_area / 4]
-
-    radar_info = np.zeros(shape=(3,4))
-    for idx, distance_mask in enumerate([is_near, is_medium, is_far]):
-        slice_area = slice_areas[idx]
-        for jdx, angle_mask in enumerate([is_right, is_front, is_left, is_behind]):
-            mask = np.logical_and(distance_mask, angle_mask)
-            total_asteroid_area = np.sum(asteroid_areas[mask])
-            radar_info[idx, jdx] = min(1, total_asteroid_area / slice_area)
 
+def get_radar_batch(centered_asteroids, asteroid_radii, valid=None, radar_zones=None,
+                    n_sectors=DEFAULT_RADAR_SECTORS, geometry=None, out=None):
+    """
+    Batched version of get_radar, for many ships (or many environments) in one call.
+    Asteroid lists of different lengths should be padded to a common length n, and the padding marked as invalid.
+    :param centered_asteroids: A (B,n,2) numpy array of asteroid positions in polar (rho, phi) format, each batch
+                               entry relative to its own reference point (see get_radar).
+    :param asteroid_radii: A (B,n) numpy array of asteroid radii.
+    :param valid: Optional, a (B,n) boolean array. False entries (e.g. padding) are ignored. Default: all valid.
+    :param radar_zones: Optional, the outer distance of each ring, in increasing order. Any number of rings is allowed.
+    :param n_sectors: The number of angular sectors. Sector 0 is centered directly to the right of the reference
+                      point (phi = 3pi/2), and the sectors continue counter-clockwise. With the default of 4 sectors,
+                      this gives the same (Right, Front, Left, Rear) layout as get_radar.
+    :param geometry: Optional, a precomputed RadarGeometry. If given, radar_zones and n_sectors are ignored.
+    :param out: Optional, a (B, rings, sectors) array to write the radars into. It can be of any float dtype.
+    :return: A (B, rings, sectors) numpy array of radars. See get_radar for the meaning of each entry.
+    """
+    if geometry is None:
+        geometry = RadarGeometry(radar_zones, n_sectors)
+    batch_size = centered_asteroids.shape[0]
+    batch_index = np.broadcast_to(np.arange(batch_size).reshape(-1, 1), centered_asteroids.shape[:-1])
+    return _radar_bincount(centered_asteroids, asteroid_radii, batch_index, batch_size, geometry, valid, out)
+
+
+def get_radar_ragged(centered_asteroids, asteroid_radii, batch_index, batch_size, radar_zones=None,
+                     n_sectors=DEFAULT_RADAR_SECTORS, geometry=None):
+    """
+    Like get_radar_batch, but for asteroid lists of different lengths stored back to back (e.g. many recorded frames),
+    so nothing needs to be padded.
+    :param centered_asteroids: An (N,2) numpy array of asteroid positions in polar (rho, phi) format, each relative to
+                               the reference point of its own batch entry.
+    :param asteroid_radii: An (N,) numpy array of asteroid radii.
+    :param batch_index: An (N,) integer array, which batch entry each asteroid belongs to.
+    :param batch_size: The number of batch entries. Entries without any asteroids get an empty radar.
+    :return: A (batch_size, rings, sectors) numpy array of radars. See get_radar for the meaning of each entry.
+    """
+    if geometry is None:
+        geometry = RadarGeometry(radar_zones, n_sectors)
+    return _radar_bincount(centered_asteroids, asteroid_radii, batch_index, batch_size, geometry)
+
+
+def _radar_bincount(centered_asteroids, asteroid_radii, batch_index, batch_size, geometry, valid=None, out=None):
+    ring, sector = geometry.bin(centered_asteroids[..., 0], centered_asteroids[..., 1])
+    in_range = ring < geometry.n_rings
+    if valid is not None:
+        in_range &= valid
+
+    # Flatten (batch, ring, sector) into a single bin index, and let bincount do the summing
+    bins = (batch_index * geometry.n_zones + ring * geometry.n_sectors + sector)[in_range]
+    asteroid_areas = (np.pi * asteroid_radii * asteroid_radii)[in_range]
+    total_areas = np.bincount(bins, weights=asteroid_areas, minlength=batch_size * geometry.n_zones)
+
+    radar_info = np.divide(total_areas.reshape((batch_size,) + geometry.shape), geometry.zone_areas[:, None], out=out)
+    np.minimum(radar_info, 1, out=radar_info)
     return radar_info
+
+
+class RadarGeometry:
+    """
+    Everything about the radar layout which doesn't change from frame to frame: the ring distances, the sector width,
+    and the area of each zone. Build it once and pass it to get_radar_batch, instead of recomputing it every call.
+    """
+
+    def __init__(self, radar_zones=None, n_sectors=DEFAULT_RADAR_SECTORS, normalization='slice'):
+        """
+        :param radar_zones: Optional, the outer distance of each ring, in increasing order.
+        :param n_sectors: The number of angular sectors (see get_radar_batch for the layout).
+        :param normalization: 'slice' or 'legacy', see zone_areas
+        """
+        if radar_zones is None:
+            radar_zones = DEFAULT_RADAR_ZONES
+        self.radar_zones = np.asarray(radar_zones, dtype=np.float64)
+        self.n_rings = len(self.radar_zones)
+        self.n_sectors = n_sectors
+        self.n_zones = self.n_rings * self.n_sectors
+        self.shape = (self.n_rings, self.n_sectors)
+        self.sector_width = 2 * np.pi / n_sectors
+        # Shifting the angles by this much makes sector 0 start at zero
+        self.sector_offset = 0.5 * np.pi + 0.5 * self.sector_width
+        self.normalization = normalization
+        self.zone_areas = zone_areas(self.radar_zones, n_sectors, normalization)
+
+    @property
+    def outer_radius(self):
+        return self.radar_zones[-1]
+
+    def bin(self, rho, phi):
+        """
+        :return: The (ring, sector) index of each polar position. Anything past the outer ring gets ring index n_rings.
+        """
+        # Rings: index i holds radar_zones[i-1] <= rho < radar_zones[i]
+        ring = np.searchsorted(self.radar_zones, rho, side='right')
+        return ring, self.sector(phi)
+
+    def sector(self, phi):
+        """
+        :return: The sector index of each angle
+        """
+        # Shift the angles so sector 0 starts at zero, then it's just integer division
+        sector = np.floor(np.mod(phi + self.sector_offset, 2 * np.pi) / self.sector_width).astype(np.intp)
+        # Floating point rounding can land exactly on 2pi, which is really sector 0
+        np.mod(sector, self.n_sectors, out=sector)
+        return sector
+
+
+def zone_areas(radar_zones, n_sectors=DEFAULT_RADAR_SECTORS, normalization='slice'):
+    """
+    :param normalization: 'slice': every zone is normalized by its own area (the area of one sector of its ring).
+                          'legacy': the original, three-ring normalization, which the models in src/examples/out were
+                          trained with. The near ring is divided by the area of a far slice *minus* an inner slice, the
+                          far ring by the area of an inner slice, and only the middle ring by its own slice area.
+                          Only use it to run those old models.
+    :return: A (rings,) numpy array of what each ring's total asteroid area is divided by, from the inside out.
+    """
+    circle_areas = np.pi * np.square(np.asarray(radar_zones, dtype=np.float64))
+    if normalization == 'legacy':
+        if len(circle_areas) != 3:
+            raise ValueError(f'The legacy normalization only supports 3 radar zones, got {len(circle_areas)}')
+        inner_area, middle_area, outer_area = circle_areas
+        return np.array([outer_area - (middle_area + inner_area), middle_area - inner_area, inner_area]) / n_sectors
+    if normalization != 'slice':
+        raise ValueError(f'normalization must be one of {NORMALIZATIONS}, got {normalization!r}')
+    return np.diff(circle_areas, prepend=0) / n_sectors
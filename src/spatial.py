@@ -0,0 +1,113 @@
+import numpy as np
+
+from src.lib import relative_offsets
+
+DEFAULT_CELL_SIZE = 100
+
+
+class TorusGrid:
+    """
+    A uniform-grid spatial index over the (wrapping) Kessler map.
+    Build it once per frame from the asteroid positions, then ask for the asteroids near a point. Each query only looks
+    at the grid cells the query can reach, instead of every asteroid on the map. All distances are toroidal, i.e. they
+    take the shortest way around the edges of the map, the same as center_coords.
+
+    With only a handful of asteroids, a brute-force numpy pass is just as fast -- this pays off on dense maps.
+    """
+
+    def __init__(self, map_size, cell_size=DEFAULT_CELL_SIZE):
+        """
+        :param map_size: A (2,) array of the map size in (x, y) units
+        :param cell_size: The (approximate) width of each grid cell. Cells are stretched slightly so that a whole
+                          number of them fits across the map.
+        """
+        self.map_size = np.asarray(map_size, dtype=np.float64)
+        self.grid_shape = np.maximum(1, (self.map_size // cell_size).astype(np.intp))
+        self.cell_size = self.map_size / self.grid_shape
+        self.n_cells = int(np.prod(self.grid_shape))
+
+        self.positions = np.zeros((0, 2))
+        self.order = np.zeros(0, dtype=np.intp)
+        self.cell_starts = np.zeros(self.n_cells + 1, dtype=np.intp)
+
+    def build(self, positions):
+        """
+        (Re-)index a set of positions, by sorting them by grid cell. For typical grid sizes this is a radix sort, O(n).
+        :param positions: An (n,2) array of (x, y) positions, e.g. AsteroidColumns.positions
+        :return: self, for convenience
+        """
+        self.positions = positions
+        cells = self._cell_index(positions)
+        if self.n_cells <= np.iinfo(np.uint16).max:
+            # numpy uses a radix sort for small integer types, which is much faster than sorting intp
+            self.order = np.argsort(cells.astype(np.uint16), kind='stable')
+        else:
+            self.order = np.argsort(cells, kind='stable')
+        counts = np.bincount(cells, minlength=self.n_cells)
+        self.cell_starts = np.concatenate([[0], np.cumsum(counts)])
+        return self
+
+    def query_radius(self, point, radius):
+        """
+        :param point: The (x, y) to search around, e.g. the ship position
+        :param radius: The search distance
+        :return: (indices, distances) of every position within radius of the point, in no particular order.
+                 The indices refer to the positions passed to build().
+        """
+        candidates = self._candidates(point, radius)
+        distances = self._distances(point, candidates)
+        mask = distances <= radius
+        return candidates[mask], distances[mask]
+
+    def nearest(self, point, k=1):
+        """
+        :param point: The (x, y) to search around, e.g. the ship position
+        :param k: The number of neighbours to find
+        :return: (indices, distances) of the k nearest positions (or fewer, if there aren't k positions in total),
+                 sorted from nearest to furthest.
+        """
+        k = min(k, len(self.positions))
+        # Search a growing radius, until it holds at least k points. Anything within the radius is found, so once
+        # there are k of them, the k nearest are guaranteed to be among them.
+        radius = self.cell_size.max()
+        max_radius = np.linalg.norm(self.map_size / 2)
+        while True:
+            indices, distances = self.query_radius(point, radius)
+            if len(indices) >= k or radius >= max_radius:
+                break
+            radius *= 2
+        nearest = np.argsort(distances, kind='stable')[:k]
+        return indices[nearest], distances[nearest]
+
+    def _cell_index(self, positions):
+        # One axis at a time, since broadcasting (n,2) against (2,) is slow
+        cells = np.zeros(len(positions), dtype=np.intp)
+        for axis in (1, 0):
+            cell = np.floor(positions[:, axis] * (1 / self.cell_size[axis])).astype(np.intp)
+            cell %= self.grid_shape[axis]
+            cells *= self.grid_shape[axis]
+            cells += cell
+        return cells
+
+    def _candidates(self, point, radius):
+        # The range of cells the search circle touches, along each axis (wrapping around the map)
+        axis_cells = []
+        for axis in range(2):
+            low = int(np.floor((point[axis] - radius) / self.cell_size[axis]))
+            high = int(np.floor((point[axis] + radius) / self.cell_size[axis]))
+            if high - low + 1 >= self.grid_shape[axis]:
+                axis_cells.append(np.arange(self.grid_shape[axis]))
+            else:
+                axis_cells.append(np.arange(low, high + 1) % self.grid_shape[axis])
+        cells = (axis_cells[1][:, None] * self.grid_shape[0] + axis_cells[0][None, :]).ravel()
+
+        # Gather the (contiguous) runs of sorted indices for every cell, without a python loop
+        starts = self.cell_starts[cells]
+        lengths = self.cell_starts[cells + 1] - starts
+        run_offsets = np.cumsum(lengths) - lengths
+        positions_in_runs = np.arange(lengths.sum()) - np.repeat(run_offsets - starts, lengths)
+        return self.order[positions_in_runs]
+
+    def _distances(self, point, indices):
+        offsets = relative_offsets(point, self.positions[indices], self.map_size)
+        return np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
@@ -0,0 +1,132 @@
+"""
+Stand-ins for the Kessler game, shared by the tests and the benchmarks. The real (modified) Kessler game isn't needed
+for any of them.
+"""
+from unittest import mock
+
+import numpy as np
+
+MAP_SIZE = (1000, 800)
+DELTA_TIME = 1 / 30
+
+
+def make_game_state(n, seed=0, map_size=(1000, 800), n_ships=1):
+    # Same layout as the game: a list of asteroid dicts, and a list of ship dicts
+    rng = np.random.default_rng(seed)
+    asteroids = [{
+        'position': (rng.uniform(0, map_size[0]), rng.uniform(0, map_size[1])),
+        'velocity': tuple(rng.uniform(-50, 50, size=2)),
+        'radius': float(rng.choice([8, 16, 24, 32])),
+    } for _ in range(n)]
+    ships = [{
+        'position': (rng.uniform(0, map_size[0]), rng.uniform(0, map_size[1])),
+        'heading': rng.uniform(0, 360),
+        'velocity': tuple(rng.uniform(-5, 5, size=2)),
+        'speed': 1.,
+        'radius': 20.,
+        'is_respawning': False,
+    } for _ in range(n_ships)]
+    return {'asteroids': asteroids, 'ships': ships, 'map_size': map_size, 'time': 0., 'delta_time': 1 / 30}
+
+
+class FakeTrainerEnvironment:
+    """Stands in for the Kessler TrainerEnvironment: run_step just plays back random game states."""
+
+    def run_step(self, scenario, controllers):
+        # Like the real game, every frame after the first takes one action from each controller
+        n_ships = scenario.get('ships', 1)
+        for frame in range(scenario['frames']):
+            if frame > 0:
+                for controller in controllers:
+                    controller.actions({}, {})
+            yield 0, [], make_game_state(20, seed=frame, n_ships=n_ships)
+        for controller in controllers:
+            controller.actions({}, {})
+        return 0, [], make_game_state(20, seed=scenario['frames'], n_ships=n_ships)
+
+
+class FakeScenario(dict):
+    """The fake game only needs to know how many frames to play"""
+
+    def __init__(self, num_asteroids, **kwargs):
+        super().__init__(frames=num_asteroids)
+
+
+class FakeAsteroidGame:
+    """Moves asteroids the way Kessler does, and destroys/splits them the same way too, keeping the true IDs aside"""
+
+    def __init__(self, n, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.asteroids, self.true_ids = [], []
+        self.next_id = 0
+        self.time = 0.
+        for _ in range(n):
+            self.add(self.rng.uniform(0, 1, 2) * MAP_SIZE, 32.)
+
+    def add(self, position, radius):
+        self.asteroids.append({'position': tuple(position), 'velocity': tuple(self.rng.uniform(-100, 100, 2)),
+                               'radius': radius})
+        self.true_ids.append(self.next_id)
+        self.next_id += 1
+
+    def step(self, destroy=()):
+        self.time += DELTA_TIME
+        for asteroid in self.asteroids:
+            x, y = asteroid['position']
+            vx, vy = asteroid['velocity']
+            asteroid['position'] = ((x + vx * DELTA_TIME) % MAP_SIZE[0], (y + vy * DELTA_TIME) % MAP_SIZE[1])
+        children = []
+        # Swap-and-pop, in reverse index order, then add the children at the end
+        for index in sorted(destroy, reverse=True):
+            asteroid = self.asteroids[index]
+            if asteroid['radius'] > 8:
+                children += [(asteroid['position'], asteroid['radius'] - 8)] * 3
+            self.asteroids[index], self.true_ids[index] = self.asteroids[-1], self.true_ids[-1]
+            self.asteroids.pop()
+            self.true_ids.pop()
+        for position, radius in children:
+            self.add(position, radius)
+
+    def game_state(self):
+        game_state = make_game_state(0, map_size=MAP_SIZE)
+        game_state.update(asteroids=[dict(asteroid) for asteroid in self.asteroids], time=self.time,
+                          delta_time=DELTA_TIME)
+        return game_state
+
+    def update(self, tracker):
+        return tracker.update(self.asteroids, MAP_SIZE, DELTA_TIME, self.time)
+
+
+class FakeAsteroidTrainerEnvironment:
+    """Like FakeTrainerEnvironment, but plays a FakeAsteroidGame, so the same asteroids move on from frame to frame"""
+
+    def run_step(self, scenario, controllers):
+        game = FakeAsteroidGame(5)
+        for frame in range(scenario['frames']):
+            if frame > 0:
+                for controller in controllers:
+                    controller.actions({}, {})
+                game.step()
+            yield 0, [], game.game_state()
+        for controller in controllers:
+            controller.actions({}, {})
+        game.step()
+        return 0, [], game.game_state()
+
+
+# Worker processes don't see a test's mock.patch, so these play the fake game wherever they run. Patch them in place of
+# the function the workers call; they get pickled by reference, and set the fakes up again in each worker.
+
+def make_fake_env(scenario_kwargs, pool_kwargs, env_kwargs):
+    """Stands in for src.training.make_env"""
+    from src.envs import RadarEnv
+    with mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment):
+        return RadarEnv(FakeScenario(**scenario_kwargs), **env_kwargs)
+
+
+def evaluate_fake_episode(*args, **kwargs):
+    """Stands in for src.evaluation.evaluate_episode"""
+    from src import evaluation
+    with mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment), \
+            mock.patch('src.evaluation.Scenario', FakeScenario):
+        return evaluation.evaluate_episode(*args, **kwargs)
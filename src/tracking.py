@@ -0,0 +1,172 @@
+import numpy as np
+
+from src.lib import AsteroidColumns, relative_offsets
+
+NO_PARENT = -1
+DEFAULT_TOLERANCE = 1e-3
+
+
+class AsteroidTracker(AsteroidColumns):
+    """
+    An AsteroidColumns which also follows each asteroid from frame to frame, giving it a stable ID.
+    Asteroids only change when they're destroyed (and maybe split into smaller children), so an asteroid keeps its
+    exact velocity and radius, and moves by velocity * delta_time (wrapping around the map) every frame. That's what
+    frames are matched on. Given the game time, frames may be skipped between updates: asteroids are then expected to
+    have moved for however long it's been since the last update.
+
+    The game removes destroyed asteroids by swapping the last asteroid into their slot, and adds any children at the
+    end, so almost every asteroid is at the same index as in the last frame. Those are checked all at once; only the
+    few slots which changed are matched one by one. On a frame where nothing is destroyed, the IDs (and the rest of the
+    tracking state) aren't touched at all.
+
+    Use it anywhere an AsteroidColumns goes. The per-asteroid arrays are all in the same order as
+    game_state['asteroids'], and like AsteroidColumns, they are views which the next update() overwrites.
+    """
+
+    def __init__(self, capacity=64, tolerance=DEFAULT_TOLERANCE):
+        """
+        :param tolerance: How far (in map units) an asteroid may be from where it was predicted to be, and still count
+                          as the same asteroid
+        """
+        super().__init__(capacity)
+        self.tolerance = tolerance
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._parent_ids = np.zeros(capacity, dtype=np.int64)
+        self._first_seen = np.zeros(capacity, dtype=np.int64)
+        # The columns of the last frame, to match against
+        self._previous = np.zeros((capacity, 5), dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything, e.g. at the start of a new episode. The next update() gives every asteroid a new ID.
+        """
+        self.n = 0
+        self.frame = -1
+        self.time = None
+        self.next_id = 0
+        self.new_indices = np.zeros(0, dtype=np.intp)
+        self.destroyed_ids = np.zeros(0, dtype=np.int64)
+
+    def update(self, asteroids, map_size=None, delta_time=None, time=None):
+        """
+        :param asteroids: The game_state['asteroids'] list of dicts
+        :param map_size: Optional, the game_state['map_size']. With delta_time, asteroids are only matched if they're
+                         where they should be (not just moving at the same velocity), and new asteroids are linked
+                         to the asteroid they split off from.
+        :param delta_time: Optional, the game_state['delta_time']
+        :param time: Optional, the game_state['time']. Without it, every update is taken to be exactly one frame
+                     (delta_time) after the last one.
+        :return: self, for convenience
+        """
+        if map_size is None or delta_time is None:
+            map_size = delta_time = None
+        # How many frames it's been since the last update, and so how long the asteroids have been moving for
+        frames = 1
+        if delta_time is not None and time is not None and self.time is not None:
+            frames = max(1, round((time - self.time) / delta_time))
+            delta_time = time - self.time
+        self.time = time
+        n_previous = self.n
+        super().update(asteroids)
+        n = self.n
+        if n > len(self._ids):
+            self._grow(len(self._storage))
+        self.frame += frames
+
+        current = self._storage[:n]
+        previous = self._previous[:n_previous]
+        # Same slot, same velocity and radius (and in the right place): the same asteroid
+        k = min(n, n_previous)
+        same = np.all(current[:k, 2:5] == previous[:k, 2:5], axis=1)
+        if delta_time is not None and k:
+            same &= self._moved_to(previous[:k], current[:k, 0:2], map_size, delta_time)
+
+        if k == n == n_previous and same.all():
+            self.new_indices = np.zeros(0, dtype=np.intp)
+            self.destroyed_ids = np.zeros(0, dtype=np.int64)
+        else:
+            self._match(current, previous, same, map_size, delta_time)
+        self._previous[:n] = current
+        return self
+
+    @property
+    def ids(self):
+        """An (n,) array of each asteroid's ID. IDs are never reused (until reset())."""
+        return self._ids[:self.n]
+
+    @property
+    def parent_ids(self):
+        """An (n,) array of the ID of the asteroid each one split off from, or NO_PARENT"""
+        return self._parent_ids[:self.n]
+
+    @property
+    def ages(self):
+        """An (n,) array of how many frames each asteroid has been tracked for (0 on its first frame)"""
+        return self.frame - self._first_seen[:self.n]
+
+    def _match(self, current, previous, same, map_size, delta_time):
+        n, n_previous = len(current), len(previous)
+        old_ids, old_parents, old_first_seen = (self._ids[:n_previous].copy(), self._parent_ids[:n_previous].copy(),
+                                                self._first_seen[:n_previous].copy())
+        # For each current asteroid, the index of the same asteroid in the last frame (or -1)
+        source = np.full(n, -1, dtype=np.intp)
+        source[:len(same)][same] = np.flatnonzero(same)
+
+        # Everything else should only be a handful of asteroids, so just look them up one by one
+        unmatched = np.setdiff1d(np.arange(n_previous), source[source >= 0])
+        candidates = {}
+        for i in unmatched.tolist():
+            candidates.setdefault(tuple(previous[i, 2:5].tolist()), []).append(i)
+        for j in np.flatnonzero(source < 0).tolist():
+            options = candidates.get(tuple(current[j, 2:5].tolist()))
+            for option_index, i in enumerate(options or []):
+                if delta_time is None or self._moved_to(previous[i:i + 1], current[j:j + 1, 0:2], map_size,
+                                                        delta_time)[0]:
+                    source[j] = options.pop(option_index)
+                    break
+
+        matched = source >= 0
+        self._ids[:n][matched] = old_ids[source[matched]]
+        self._parent_ids[:n][matched] = old_parents[source[matched]]
+        self._first_seen[:n][matched] = old_first_seen[source[matched]]
+
+        destroyed = np.setdiff1d(np.arange(n_previous), source[matched])
+        self.destroyed_ids = old_ids[destroyed]
+        self.new_indices = np.flatnonzero(~matched)
+        new = self.new_indices
+        self._ids[new] = self.next_id + np.arange(len(new))
+        self.next_id += len(new)
+        self._first_seen[new] = self.frame
+        self._parent_ids[new] = self._find_parents(current[new], previous[destroyed], old_ids[destroyed], map_size,
+                                                   delta_time)
+
+    def _find_parents(self, children, destroyed, destroyed_ids, map_size, delta_time):
+        # Children start out where their parent was destroyed, and are smaller than it
+        parents = np.full(len(children), NO_PARENT, dtype=np.int64)
+        if not len(children) or not len(destroyed) or map_size is None:
+            return parents
+        where = destroyed[:, 0:2] + destroyed[:, 2:4] * delta_time
+        for j, child in enumerate(children):
+            offsets = relative_offsets(child[0:2], where, map_size)
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+            possible = (distances <= destroyed[:, 4] + self.tolerance) & (destroyed[:, 4] > child[4])
+            if possible.any():
+                parents[j] = destroyed_ids[np.argmin(np.where(possible, distances, np.inf))]
+        return parents
+
+    def _moved_to(self, previous, positions, map_size, delta_time):
+        # Is each asteroid where it should be, after moving for delta_time from its previous position?
+        predicted = previous[:, 0:2] + previous[:, 2:4] * delta_time
+        offsets = relative_offsets(predicted, positions, map_size)
+        return np.all(np.abs(offsets) <= self.tolerance, axis=1)
+
+    def _grow(self, capacity):
+        for name in ['_ids', '_parent_ids', '_first_seen']:
+            grown = np.zeros(capacity, dtype=np.int64)
+            old = getattr(self, name)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+        previous = np.zeros((capacity, 5), dtype=np.float64)
+        previous[:len(self._previous)] = self._previous
+        self._previous = previous
@@ -0,0 +1,267 @@
+"""
+Train PPO on RadarEnv from a JSON config, over a pool of worker processes, checkpointing as it goes. Running the same
+command again picks up from the latest checkpoint. From the repository root, e.g.:
+    python -m src.training src/examples/train_config.json
+Anything not in the config file takes its value from DEFAULT_CONFIG.
+"""
+import argparse
+import copy
+import csv
+import functools
+import json
+import os
+import re
+import time
+
+from kesslergame import Scenario
+from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from src.envs import RadarEnv, ScenarioPool
+from src.envs.shm_vec_env import make_shm_vec_env
+from src.evaluation import AsyncEvaluator, print_report, scenario_grid
+
+DEFAULT_CONFIG = {
+    'out_dir': 'out/ppo',
+    'total_steps': 1_000_000,
+    # Checkpoints are saved every this many env steps (rounded up to a whole rollout)
+    'checkpoint_every': 50_000,
+    # How many of the most recent checkpoints to keep. None keeps them all. Any still being evaluated are kept until
+    # they're done.
+    'keep_checkpoints': None,
+    # The number of environments, each in its own process. None: one per CPU.
+    'n_envs': None,
+    # 'shm' for ShmVecEnv, or 'dummy' to run every environment in this process (handy for debugging)
+    'vec_env': 'shm',
+    'seed': 0,
+    # Scenario keyword arguments ...
+    'scenario': {'num_asteroids': 10, 'map_size': [600, 600]},
+    # ... or, if given, ScenarioPool.generate keyword arguments, to train on a pool of scenarios instead
+    'pool': None,
+    # RadarEnv keyword arguments
+    'env': {},
+    # PPO keyword arguments
+    'ppo': {'policy': 'MultiInputPolicy', 'device': 'cpu'},
+    # If given, evaluate every checkpoint in the background: {'scenarios': scenario_grid keyword arguments,
+    # 'n_workers': ...}. See AsyncEvaluator.
+    'evaluation': None,
+}
+
+CHECKPOINT_PATTERN = re.compile(r'^checkpoint_(\d+)\.zip$')
+THROUGHPUT_LOG = 'throughput.csv'
+
+
+def load_config(path):
+    """
+    :return: The config in the JSON file at path, with DEFAULT_CONFIG filling in anything missing
+    """
+    with open(path) as f:
+        overrides = json.load(f)
+    unknown = set(overrides) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f'Unknown config keys: {sorted(unknown)}')
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config.update(overrides)
+    if config['keep_checkpoints'] is not None and config['keep_checkpoints'] < 1:
+        raise ValueError(f"keep_checkpoints must be at least 1 (or None to keep them all), "
+                         f"got {config['keep_checkpoints']}")
+    return config
+
+
+def checkpoint_path(out_dir, steps):
+    return os.path.join(out_dir, f'checkpoint_{steps:012d}.zip')
+
+
+def list_checkpoints(out_dir):
+    """
+    :return: A list of (steps, path) of every checkpoint in out_dir, oldest first
+    """
+    if not os.path.isdir(out_dir):
+        return []
+    matches = [CHECKPOINT_PATTERN.match(name) for name in os.listdir(out_dir)]
+    return sorted((int(match.group(1)), os.path.join(out_dir, match.group(0))) for match in matches if match)
+
+
+def latest_checkpoint(out_dir):
+    """
+    :return: The path of the most recent checkpoint in out_dir, or None if there isn't one yet
+    """
+    checkpoints = list_checkpoints(out_dir)
+    return checkpoints[-1][1] if checkpoints else None
+
+
+def save_checkpoint(model, out_dir, keep=None, in_use=()):
+    """
+    Save the model (including the optimizer state) as a checkpoint named after its step count. The file is written
+    under a temporary name first, so a crash while saving never leaves a broken "latest" checkpoint behind.
+    :param keep: Optional, delete all but this many of the most recent checkpoints (see prune_checkpoints)
+    :param in_use: Paths of checkpoints not to delete yet, e.g. the ones still being evaluated
+    :return: The path of the checkpoint
+    """
+    path = checkpoint_path(out_dir, model.num_timesteps)
+    tmp_path = f'{path}.tmp'
+    model.save(tmp_path)
+    os.replace(tmp_path, path)
+    if keep is not None:
+        prune_checkpoints(out_dir, keep, in_use)
+    return path
+
+
+def prune_checkpoints(out_dir, keep, in_use=()):
+    """
+    Delete all but the keep most recent checkpoints in out_dir. Anything in in_use is left alone for now, and goes
+    the next time round.
+    """
+    for _, path in list_checkpoints(out_dir)[:-keep]:
+        if path not in in_use:
+            os.remove(path)
+
+
+class ThroughputCallback(BaseCallback):
+    """
+    Logs the training throughput after every rollout, both to the stable-baselines logger and as a row of a CSV file
+    (appended to, so resumed runs carry on in the same file):
+        env_steps_per_second: env steps collected per second of rollout collection, i.e. the speed of the simulation
+        samples_per_second: env steps per second overall, including the time spent updating the policy
+    """
+
+    FIELDS = ['timesteps', 'wall_time', 'env_steps_per_second', 'samples_per_second']
+
+    def __init__(self, path, verbose=0):
+        super().__init__(verbose)
+        self.path = path
+        self._rollout = None
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        self._log(now)
+        self._rollout = (now, self.num_timesteps, None)
+
+    def _on_rollout_end(self):
+        start, steps, _ = self._rollout
+        self._rollout = (start, steps, time.perf_counter())
+
+    def _on_training_end(self):
+        self._log(time.perf_counter())
+        self._rollout = None
+
+    def _on_step(self):
+        return True
+
+    def _log(self, now):
+        # A rollout runs from its own start to the start of the next one, which includes its policy update
+        if self._rollout is None or self._rollout[2] is None:
+            return
+        start, steps, collected = self._rollout
+        n_steps = self.num_timesteps - steps
+        row = {
+            'timesteps': self.num_timesteps,
+            'wall_time': time.time(),
+            'env_steps_per_second': n_steps / (collected - start),
+            'samples_per_second': n_steps / (now - start),
+        }
+        self.logger.record('throughput/env_steps_per_second', row['env_steps_per_second'])
+        self.logger.record('throughput/samples_per_second', row['samples_per_second'])
+
+        new_file = not os.path.exists(self.path)
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+
+
+def make_env(scenario_kwargs, pool_kwargs, env_kwargs):
+    """
+    Build one (unwrapped) RadarEnv. This is what each worker process runs, so it only takes plain config data.
+    """
+    if pool_kwargs is not None:
+        scenario = ScenarioPool.generate(**_tuple_map_size(pool_kwargs))
+    else:
+        scenario = Scenario(**_tuple_map_size(scenario_kwargs))
+    return RadarEnv(scenario, **env_kwargs)
+
+
+def make_vec_env(config):
+    n_envs = config['n_envs'] or os.cpu_count()
+    env_fn = functools.partial(make_env, config['scenario'], config['pool'], config['env'])
+    if config['vec_env'] == 'shm':
+        vec_env = make_shm_vec_env(env_fn, n_envs)
+    elif config['vec_env'] == 'dummy':
+        vec_env = DummyVecEnv([lambda: Monitor(env_fn()) for _ in range(n_envs)])
+    else:
+        raise ValueError(f"vec_env must be 'shm' or 'dummy', got {config['vec_env']}")
+    return vec_env
+
+
+def train(config):
+    """
+    Train until config['total_steps'], resuming from the latest checkpoint in config['out_dir'] if there is one.
+    :return: The trained model
+    """
+    out_dir = config['out_dir']
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'config.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+
+    vec_env = make_vec_env(config)
+    evaluator = None
+    try:
+        resume_from = latest_checkpoint(out_dir)
+        if resume_from is not None:
+            model = PPO.load(resume_from, env=vec_env, device=config['ppo'].get('device', 'auto'))
+            print(f'Resuming from {resume_from} ({model.num_timesteps} steps)')
+            # Offset the seed by the steps already taken, so a resumed run doesn't replay the episodes it started with
+            model.set_random_seed(config['seed'] + model.num_timesteps)
+        else:
+            model = PPO(env=vec_env, seed=config['seed'], **config['ppo'])
+
+        if config['evaluation'] is not None:
+            scenarios = scenario_grid(**_tuple_map_size(config['evaluation'].get('scenarios', {})))
+            evaluator = AsyncEvaluator(scenarios, n_workers=config['evaluation'].get('n_workers'),
+                                       env_kwargs=config['env'])
+
+        callback = ThroughputCallback(os.path.join(out_dir, THROUGHPUT_LOG))
+        every = config['checkpoint_every']
+        while model.num_timesteps < config['total_steps']:
+            # Stop at the next multiple of checkpoint_every, so checkpoints land at the same steps after a resume
+            target = min((model.num_timesteps // every + 1) * every, config['total_steps'])
+            model.learn(target - model.num_timesteps, callback=callback, reset_num_timesteps=False)
+            # The evaluator loads each checkpoint in its workers, so it mustn't be deleted while it's still queued
+            in_use = evaluator.pending if evaluator is not None else ()
+            path = save_checkpoint(model, out_dir, keep=config['keep_checkpoints'], in_use=in_use)
+            if evaluator is not None:
+                evaluator.submit(path)
+                print_report(evaluator.poll())
+        if evaluator is not None:
+            print_report(evaluator.wait())
+            if config['keep_checkpoints'] is not None:
+                prune_checkpoints(out_dir, config['keep_checkpoints'])
+        return model
+    finally:
+        if evaluator is not None:
+            evaluator.close()
+        vec_env.close()
+
+
+def _tuple_map_size(kwargs):
+    # JSON has no tuples, but Scenario wants its map_size as one
+    kwargs = dict(kwargs)
+    if 'map_size' in kwargs:
+        kwargs['map_size'] = tuple(kwargs['map_size'])
+    if 'map_sizes' in kwargs:
+        kwargs['map_sizes'] = [tuple(map_size) for map_size in kwargs['map_sizes']]
+    return kwargs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config', help='A JSON config file, see DEFAULT_CONFIG')
+    args = parser.parse_args()
+    train(load_config(args.config))
+
+
+if __name__ == '__main__':
+    main()
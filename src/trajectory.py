@@ -0,0 +1,185 @@
+import os
+
+import numpy as np
+
+from src.lib import ASTEROID_COLUMNS, AsteroidColumns, center_coords
+from src.observation import DEFAULT_FORECAST_FRAMES, DEFAULT_RADAR_ZONES
+from src.radar import DEFAULT_RADAR_SECTORS, RadarGeometry, get_radar_ragged
+
+DEFAULT_CHUNK_FRAMES = 10_000
+SHIP_COLUMNS = 5  # x, y, heading (degrees, as in the game), vx, vy
+CHUNK_FILES = ['ships', 'map_sizes', 'episodes', 'offsets', 'asteroids']
+
+
+class TrajectoryWriter:
+    """
+    Streams the raw ship and asteroid state of every frame to disk, so observations can be recomputed later (e.g. with
+    different radar zones) without re-running the simulation.
+
+    The recording is a directory of chunks, each holding up to chunk_frames frames. A chunk is a directory of .npy
+    files, one per column, which the TrajectoryReader memory-maps:
+        ships.npy      (F,5)   x, y, heading, vx, vy of the observed ship
+        map_sizes.npy  (F,2)
+        episodes.npy   (F,)    which episode each frame belongs to
+        offsets.npy    (F+1,)  the asteroids of frame i are asteroids[offsets[i]:offsets[i+1]]
+        asteroids.npy  (N,5)   x, y, vx, vy, radius of every asteroid of every frame, back to back
+    """
+
+    def __init__(self, path, chunk_frames=DEFAULT_CHUNK_FRAMES, dtype=np.float64):
+        """
+        :param path: The directory to record into. If it already holds a recording, new chunks are added after it.
+        :param chunk_frames: How many frames to buffer in memory before writing them out as a chunk
+        :param dtype: The dtype to store the ship and asteroid columns as. np.float32 halves the size on disk.
+        """
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.dtype = dtype
+        os.makedirs(path, exist_ok=True)
+        existing = _chunk_dirs(path)
+        self.n_chunks = len(existing)
+        self.episode = 0
+        if existing:
+            self.episode = int(np.load(os.path.join(existing[-1], 'episodes.npy'))[-1]) + 1
+
+        # Reused from frame to frame
+        self.asteroids = AsteroidColumns()
+        self._clear()
+
+    def append(self, game_state, ship_state=None, asteroids=None):
+        """
+        Record one frame.
+        :param ship_state: Optional, the state of the observed ship. Default: the first ship in the game state.
+        :param asteroids: Optional, an AsteroidColumns which has already been updated for this frame.
+        """
+        if ship_state is None:
+            ship_state = game_state['ships'][0]
+        if asteroids is None:
+            asteroids = self.asteroids.update(game_state['asteroids'])
+        self._ships.append((*ship_state['position'], ship_state['heading'], *ship_state['velocity']))
+        self._map_sizes.append(game_state['map_size'])
+        self._episodes.append(self.episode)
+        self._asteroids.append(asteroids.columns.astype(self.dtype))
+        if len(self._ships) >= self.chunk_frames:
+            self.flush()
+
+    def end_episode(self):
+        """
+        Mark the end of an episode: any frames recorded from now on belong to the next one.
+        """
+        self.episode += 1
+
+    def flush(self):
+        """
+        Write any buffered frames out as a new chunk.
+        """
+        if not self._ships:
+            return
+        n_frames = len(self._ships)
+        counts = np.fromiter((len(asteroids) for asteroids in self._asteroids), dtype=np.int64, count=n_frames)
+        columns = {
+            'ships': np.array(self._ships, dtype=self.dtype).reshape(n_frames, SHIP_COLUMNS),
+            'map_sizes': np.array(self._map_sizes, dtype=np.float64).reshape(n_frames, 2),
+            'episodes': np.array(self._episodes, dtype=np.int64),
+            'offsets': np.concatenate([[0], np.cumsum(counts)]),
+            'asteroids': np.concatenate(self._asteroids).reshape(-1, ASTEROID_COLUMNS),
+        }
+
+        # Write to a temporary directory first, so a crash never leaves a half-written chunk behind
+        chunk_dir = os.path.join(self.path, f'chunk_{self.n_chunks:05d}')
+        tmp_dir = chunk_dir + '.tmp'
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name, values in columns.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), values)
+        os.replace(tmp_dir, chunk_dir)
+        self.n_chunks += 1
+        self._clear()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _clear(self):
+        self._ships, self._map_sizes, self._episodes, self._asteroids = [], [], [], []
+
+
+class TrajectoryReader:
+    """
+    Reads a recording made by TrajectoryWriter, and recomputes the radar observations from it in bulk.
+    """
+
+    def __init__(self, path, mmap=True):
+        """
+        :param path: The recording directory
+        :param mmap: If True, memory-map the chunks instead of reading them into memory
+        """
+        mmap_mode = 'r' if mmap else None
+        self.chunks = [{name: np.load(os.path.join(chunk_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+                        for name in CHUNK_FILES}
+                       for chunk_dir in _chunk_dirs(path)]
+
+    def __len__(self):
+        return sum(len(chunk['ships']) for chunk in self.chunks)
+
+    @property
+    def episodes(self):
+        """An (F,) array, which episode each frame belongs to"""
+        return np.concatenate([chunk['episodes'] for chunk in self.chunks] or [np.zeros(0, dtype=np.int64)])
+
+    def featurize(self, radar_zones=None, n_sectors=DEFAULT_RADAR_SECTORS, forecast_frames=DEFAULT_FORECAST_FRAMES,
+                  radar_normalization='slice'):
+        """
+        Recompute the observation of every recorded frame, exactly as an ObservationEngine with these settings would
+        have seen it. All the frames of a chunk are processed together, in one vectorized pass per forecast horizon.
+        :return: A dict of arrays, like ObservationEngine.observe, but with an extra leading (frames,) axis
+        """
+        if radar_zones is None:
+            radar_zones = DEFAULT_RADAR_ZONES
+        geometry = RadarGeometry(radar_zones, n_sectors, normalization=radar_normalization)
+        multi_horizon = np.ndim(forecast_frames) > 0
+        horizons = np.concatenate([[0], np.ravel(forecast_frames)]).astype(np.float64)
+
+        radars = [self._featurize_chunk(chunk, geometry, horizons) for chunk in self.chunks]
+        radars = np.concatenate(radars) if radars else np.zeros((0, len(horizons)) + geometry.shape)
+        return {
+            "radar": radars[:, 0],
+            "forecast": radars[:, 1:] if multi_horizon else radars[:, 1],
+        }
+
+    @staticmethod
+    def _featurize_chunk(chunk, geometry, horizons):
+        ships = np.asarray(chunk['ships'], dtype=np.float64)
+        asteroids = np.asarray(chunk['asteroids'], dtype=np.float64)
+        n_frames = len(ships)
+        frame_index = np.repeat(np.arange(n_frames), np.diff(chunk['offsets']))
+        radars = np.zeros((n_frames, len(horizons)) + geometry.shape)
+
+        # center_coords wants a single map size, so take each map size in turn (usually there is only one)
+        map_sizes, map_index = np.unique(chunk['map_sizes'], axis=0, return_inverse=True)
+        map_index = map_index.ravel()
+        for i, map_size in enumerate(map_sizes):
+            if len(map_sizes) == 1:
+                frames, selected = np.arange(n_frames), slice(None)
+            else:
+                frames, selected = np.flatnonzero(map_index == i), map_index[frame_index] == i
+            # Renumber the frames, so they run 0..len(frames)-1 for the radar kernel
+            local_index = np.searchsorted(frames, frame_index[selected])
+            positions, velocities, radii = asteroids[selected, 0:2], asteroids[selected, 2:4], asteroids[selected, 4]
+            ship_positions = ships[frames, 0:2][local_index]
+            ship_headings = np.radians(ships[frames, 2])[local_index]
+            ship_velocities = ships[frames, 3:5][local_index]
+
+            for k, horizon in enumerate(horizons):
+                centered = center_coords(ship_positions + horizon * ship_velocities, ship_headings,
+                                         positions + horizon * velocities, map_size)
+                radars[frames, k] = get_radar_ragged(centered, radii, local_index, len(frames), geometry=geometry)
+        return radars
+
+
+def _chunk_dirs(path):
+    names = sorted(name for name in os.listdir(path) if name.startswith('chunk_') and not name.endswith('.tmp'))
+    return [os.path.join(path, name) for name in names]
@@ -0,0 +1,152 @@
+import pickle
+import unittest
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from src.lib import PARSED_FIELDS, AsteroidColumns, ParsedState, center_coords, parse_game_state, resolve_dependencies
+
+
+def make_asteroids(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{
+        'position': tuple(rng.uniform(0, 500, size=2)),
+        'velocity': tuple(rng.uniform(-50, 50, size=2)),
+        'radius': float(rng.choice([8, 16, 24, 32])),
+    } for _ in range(n)]
+
+
+class TestAsteroidColumns(unittest.TestCase):
+    def test_columns(self):
+        asteroids = make_asteroids(5)
+        columns = AsteroidColumns().update(asteroids)
+
+        self.assertEqual(len(columns), 5)
+        assert_allclose(columns.positions, [asteroid['position'] for asteroid in asteroids])
+        assert_allclose(columns.velocities, [asteroid['velocity'] for asteroid in asteroids])
+        assert_allclose(columns.radii, [asteroid['radius'] for asteroid in asteroids])
+
+    def test_grow_and_shrink(self):
+        columns = AsteroidColumns(capacity=2)
+        for n in [0, 1, 3, 10, 4, 0, 7]:
+            asteroids = make_asteroids(n, seed=n)
+            columns.update(asteroids)
+            self.assertEqual(columns.positions.shape, (n, 2))
+            self.assertEqual(columns.velocities.shape, (n, 2))
+            self.assertEqual(columns.radii.shape, (n,))
+            assert_allclose(columns.positions.reshape(-1, 2), np.reshape([a['position'] for a in asteroids], (-1, 2)))
+
+    def test_storage_is_reused(self):
+        columns = AsteroidColumns(capacity=10)
+        positions = columns.update(make_asteroids(10, seed=1)).positions
+        columns.update(make_asteroids(10, seed=2))
+        self.assertTrue(np.shares_memory(positions, columns.positions))
+
+    def test_parse_game_state(self):
+        asteroids = make_asteroids(6)
+        ship_state, game_state = make_states(asteroids)
+
+        expected = parse_game_state(ship_state, game_state)
+        shared = parse_game_state(ship_state, game_state, asteroids=AsteroidColumns().update(asteroids))
+        for key in ['xy_positions', 'xy_velocity', 'polar_positions', 'polar_future_positions', 'radii']:
+            assert_allclose(getattr(shared, key), getattr(expected, key))
+
+
+def make_states(asteroids, velocity=(0., 0.)):
+    ship_state = {'position': (250., 250.), 'heading': 90., 'velocity': velocity, 'speed': float(np.hypot(*velocity)),
+                  'is_respawning': False}
+    game_state = {'asteroids': asteroids, 'map_size': (500, 500), 'time': 2., 'delta_time': 1 / 30}
+    return ship_state, game_state
+
+
+class TestParsedState(unittest.TestCase):
+    def test_fields(self):
+        asteroids = make_asteroids(4)
+        ship_state, game_state = make_states(asteroids, velocity=(3., -4.))
+        state = parse_game_state(ship_state, game_state, forecast_seconds=2)
+
+        self.assertEqual(len(state), 4)
+        assert_allclose(state.ship_position, [250, 250])
+        assert_allclose(state.future_position, [256, 242])
+        self.assertAlmostEqual(state.ship_heading, np.pi / 2)
+        self.assertEqual(state.ship_speed, 5.)
+        self.assertIs(state.is_respawning, False)
+        assert_allclose(state.map_size, [500, 500])
+        self.assertEqual((state.time, state.delta_time), (2., 1 / 30))
+
+        positions = np.array([asteroid['position'] for asteroid in asteroids])
+        velocities = np.array([asteroid['velocity'] for asteroid in asteroids])
+        assert_allclose(state.xy_positions, positions)
+        assert_allclose(state.xy_future_positions, np.mod(positions + 2 * velocities, 500))
+        assert_allclose(state.polar_positions, center_coords([250, 250], np.pi / 2, positions, np.array([500, 500])))
+        assert_allclose(state.radii, [asteroid['radius'] for asteroid in asteroids])
+        self.assertEqual(state.time_to_closest_approach.shape, (4,))
+
+    def test_one_buffer(self):
+        state = parse_game_state(*make_states(make_asteroids(5)))
+        for name in ['ship_position', 'map_size', 'xy_positions', 'polar_future_positions', 'radii']:
+            self.assertTrue(np.shares_memory(getattr(state, name), state.buffer), name)
+        self.assertTrue(state.buffer.flags.c_contiguous)
+
+    def test_reuse(self):
+        state = ParsedState()
+        for n in [3, 10, 2, 0, 7]:
+            asteroids = make_asteroids(n, seed=n)
+            ship_state, game_state = make_states(asteroids)
+            self.assertIs(parse_game_state(ship_state, game_state, out=state), state)
+            expected = parse_game_state(ship_state, game_state)
+            self.assertEqual(len(state), n)
+            for name in ['xy_positions', 'polar_positions', 'closest_approach_distance', 'radii']:
+                assert_allclose(getattr(state, name), getattr(expected, name))
+
+        # Once it has room, refilling doesn't allocate a new buffer
+        buffer = state.buffer
+        parse_game_state(*make_states(make_asteroids(9)), out=state)
+        self.assertTrue(np.shares_memory(buffer, state.buffer))
+
+    def test_copy_and_pickle(self):
+        state = parse_game_state(*make_states(make_asteroids(6)))
+        for other in [state.copy(), pickle.loads(pickle.dumps(state))]:
+            self.assertFalse(np.shares_memory(other.buffer, state.buffer))
+            assert_allclose(other.buffer, state.buffer)
+            assert_allclose(other.polar_positions, state.polar_positions)
+            self.assertEqual(other.ship_heading, state.ship_heading)
+
+        copied = state.copy()
+        parse_game_state(*make_states(make_asteroids(6, seed=1)), out=state)
+        self.assertFalse(np.allclose(copied.xy_positions, state.xy_positions))
+
+    def test_selected_fields(self):
+        ship_state, game_state = make_states(make_asteroids(8), velocity=(3., -4.))
+        expected = parse_game_state(ship_state, game_state)
+        for fields in [['polar_positions'], ['closest_approach_distance'], ['polar_future_positions'], []]:
+            state = parse_game_state(ship_state, game_state, fields=fields)
+            for name in resolve_dependencies(fields, PARSED_FIELDS) | {'xy_positions', 'xy_velocity', 'radii'}:
+                assert_allclose(getattr(state, name), getattr(expected, name), err_msg=name)
+            assert_allclose(state.future_position, expected.future_position)
+
+        self.assertEqual(resolve_dependencies(['time_to_closest_approach'], PARSED_FIELDS),
+                         {'time_to_closest_approach', 'xy_offsets', 'polar_positions'})
+        with self.assertRaises(ValueError):
+            parse_game_state(ship_state, game_state, fields=['ship_heading'])
+
+    def test_stale_fields(self):
+        ship_state, game_state = make_states(make_asteroids(8), velocity=(3., -4.))
+        state = parse_game_state(ship_state, game_state)
+        self.assertEqual(state.fields, set(PARSED_FIELDS))
+        # Refilled with fewer fields, the others still hold the last frame's values, so they can't be read
+        parse_game_state(ship_state, game_state, out=state, fields=['polar_positions'])
+        self.assertEqual(state.fields, {'xy_positions', 'xy_velocity', 'radii', 'polar_positions', 'xy_offsets'})
+        for other in [state, state.copy(), pickle.loads(pickle.dumps(state))]:
+            self.assertEqual(other.fields, state.fields)
+            assert_allclose(other.polar_positions, state.polar_positions)
+            for name in ['xy_future_positions', 'polar_future_positions', 'time_to_closest_approach']:
+                with self.assertRaises(AttributeError):
+                    getattr(other, name)
+        self.assertFalse(hasattr(ParsedState(3), 'xy_positions'))
+        # Resizing (even to the same size) leaves nothing filled in
+        self.assertEqual(state.resize(len(state)).fields, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
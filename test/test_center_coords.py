@@ -1,7 +1,7 @@
 import unittest
 import numpy as np
 from numpy.testing import assert_allclose
-from src.lib import center_coords
+from src.lib import center_coords, relative_offsets
 
 
 class TestCenterCoords(unittest.TestCase):
@@ -90,6 +90,54 @@ class TestCenterCoords(unittest.TestCase):
         output = center_coords(ship_coords, angle, asteroid_coords, map_size)
         assert_allclose(output, expected_coords, atol=1e-7)
 
+    # The output (and scratch) buffers can be passed in, and are filled in place
+    def test_out_buffers(self):
+        ship_coords = np.array([400., 400.])
+        map_size = np.array([500, 500])
+        asteroid_coords = np.array([[100, 400], [400, 100], [0, 300]])
+        out, work = np.zeros((3, 2)), np.zeros((3, 2))
+
+        output = center_coords(ship_coords, 0, asteroid_coords, map_size, out=out, work=work)
+        self.assertIs(output, out)
+        assert_allclose(out, center_coords(ship_coords, 0, asteroid_coords, map_size), atol=1e-7)
+
+    def test_float32(self):
+        rng = np.random.default_rng(0)
+        map_size = np.array([1000, 800])
+        ship_coords = np.array([900., 50.])
+        asteroid_coords = rng.uniform(0, 1, size=(1000, 2)) * map_size
+
+        expected = center_coords(ship_coords, 1., asteroid_coords, map_size)
+        output = center_coords(ship_coords, 1., asteroid_coords, map_size, dtype=np.float32)
+        self.assertEqual(output.dtype, np.float32)
+        assert_allclose(output[:, 0], expected[:, 0], rtol=1e-5)
+        angle_error = np.abs(output[:, 1] - expected[:, 1])
+        assert_allclose(np.minimum(angle_error, 2 * np.pi - angle_error), 0, atol=1e-4)
+
+    # Several ship positions at once, each against its own set of asteroids
+    def test_batched_ships(self):
+        rng = np.random.default_rng(1)
+        map_size = np.array([500, 500])
+        ship_coords = rng.uniform(0, 500, size=(3, 1, 2))
+        headings = rng.uniform(0, 2 * np.pi, size=(3, 1))
+        asteroid_coords = rng.uniform(0, 500, size=(3, 20, 2))
+
+        output = center_coords(ship_coords, headings, asteroid_coords, map_size)
+        self.assertEqual(output.shape, (3, 20, 2))
+        for k in range(3):
+            expected = center_coords(ship_coords[k, 0], headings[k, 0], asteroid_coords[k], map_size)
+            assert_allclose(output[k], expected, atol=1e-7)
+
+
+class TestRelativeOffsets(unittest.TestCase):
+    def test_minimum_image(self):
+        map_size = np.array([1000, 1000])
+        ship_coords = np.array([900., 0.])
+        asteroid_coords = np.array([[0, 0], [900, 900], [400, 500], [950, 50]])
+
+        output = relative_offsets(ship_coords, asteroid_coords, map_size)
+        assert_allclose(output, [[100, 0], [0, -100], [-500, -500], [50, 50]], atol=1e-7)
+
 
 if __name__ == '__main__':
     unittest.main()
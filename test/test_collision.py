@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from src.lib import closest_approach, relative_offsets, time_to_collision
+
+
+class TestClosestApproach(unittest.TestCase):
+    def test_closest_approach(self):
+        # Passing 30 units above the ship, 10 units/s to the left; moving away; not moving
+        offsets = np.array([[100., 30.], [100., 0.], [50., 50.]])
+        velocities = np.array([[-10., 0.], [10., 0.], [0., 0.]])
+        time, distance = closest_approach(offsets, velocities)
+        assert_allclose(time, [10, 0, 0])
+        assert_allclose(distance, [30, 100, np.hypot(50, 50)])
+
+
+class TestTimeToCollision(unittest.TestCase):
+    def test_head_on(self):
+        # 100 units away, closing at 20 units/s, colliding at 10 units apart
+        ttc = time_to_collision(np.array([[100., 0.]]), np.array([[-20., 0.]]), 10.)
+        assert_allclose(ttc, [4.5])
+
+    def test_misses_and_overlaps(self):
+        offsets = np.array([[100., 30.], [100., 0.], [5., 0.], [100., 0.]])
+        velocities = np.array([[-10., 0.], [10., 0.], [10., 0.], [0., 0.]])
+        # Passes 30 units away; moving away; already overlapping; not moving
+        ttc = time_to_collision(offsets, velocities, 20., max_time=60.)
+        assert_allclose(ttc, [60, 60, 0, 60])
+
+    def test_matches_simulation(self):
+        rng = np.random.default_rng(0)
+        offsets = rng.uniform(-300, 300, size=(200, 2))
+        velocities = rng.uniform(-100, 100, size=(200, 2))
+        radii = rng.choice([28., 36., 44., 52.], size=200)
+        ttc = time_to_collision(offsets, velocities, radii, max_time=5.)
+
+        # Step everything forward in small increments, and note the first time each one is within range
+        times = np.arange(0, 5, 1e-3)
+        positions = offsets[None] + times[:, None, None] * velocities[None]
+        hit = np.linalg.norm(positions, axis=-1) <= radii
+        expected = np.where(hit.any(axis=0), times[np.argmax(hit, axis=0)], 5.)
+        assert_allclose(ttc, expected, atol=2e-3)
+
+    def test_wrapped_map(self):
+        # Across the edge of the map, the asteroid is only 50 units away
+        map_size = np.array([1000., 800.])
+        offsets = relative_offsets(np.array([980., 400.]), np.array([[30., 400.]]), map_size)
+        ttc = time_to_collision(offsets, np.array([[-10., 0.]]), 30.)
+        assert_allclose(ttc, [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
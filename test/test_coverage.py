@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from src.coverage import CoverageTable
+from src.observation import ObservationEngine
+from src.radar import RadarGeometry, get_radar_batch
+from src.testing import make_game_state
+
+
+class TestCoverageTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.geometry = RadarGeometry([100, 300, 500])
+        cls.coverage = CoverageTable.build(cls.geometry)
+
+    def covered(self, polar, radius):
+        # The fraction of one asteroid's area in each zone
+        radar = self.coverage.radar_batch(np.array([[polar]], dtype=np.float64), np.array([[radius]], dtype=np.float64))
+        return radar[0] * self.geometry.zone_areas[:, None] / (np.pi * radius * radius)
+
+    def test_inside_one_zone(self):
+        # Well inside a zone, it's the same as the usual radar
+        rng = np.random.default_rng(0)
+        polar = np.stack([rng.uniform(0, 700, (3, 50)), rng.uniform(-np.pi, np.pi, (3, 50))], axis=-1)
+        polar[..., 0] = np.where(np.abs(polar[..., 0, None] - [100, 300, 500]).min(-1) < 40, 200, polar[..., 0])
+        radii = np.full((3, 50), 8.)
+        ring, sector = self.geometry.bin(polar[..., 0], polar[..., 1])
+        offset = np.mod(polar[..., 1] + self.geometry.sector_offset, 2 * np.pi) - sector * self.geometry.sector_width
+        gap = np.minimum(offset, self.geometry.sector_width - offset)
+        valid = polar[..., 0] * np.sin(gap) > 10
+
+        assert_allclose(self.coverage.radar_batch(polar, radii, valid=valid),
+                        get_radar_batch(polar, radii, valid=valid, geometry=self.geometry), atol=1e-12)
+
+    def test_ring_edge(self):
+        # Centered on the edge between the near and middle rings, straight ahead: half in each
+        fractions = self.covered([100, 0], 16)
+        assert_allclose(fractions[0:2, 1], [0.5, 0.5], atol=0.02)
+        self.assertAlmostEqual(fractions.sum(), 1)
+
+    def test_sector_edge(self):
+        # Centered on the edge between the front and left sectors: half in each
+        fractions = self.covered([200, 0.25 * np.pi], 24)
+        assert_allclose(fractions[1, 1:3], [0.5, 0.5], atol=0.02)
+        self.assertAlmostEqual(fractions.sum(), 1)
+
+    def test_center(self):
+        # Right on top of the reference point: a quarter in each sector of the near ring
+        assert_allclose(self.covered([0, 1.], 32)[0], [0.25] * 4, atol=0.02)
+
+    def test_outer_edge(self):
+        # Half of it is past the outer ring, so only half counts
+        self.assertAlmostEqual(self.covered([500, 0], 32).sum(), 0.5, delta=0.02)
+        self.assertEqual(self.covered([540, 0], 32).sum(), 0)
+
+    def test_interpolation(self):
+        # Between the grid points, the lookups vary smoothly
+        rho = np.linspace(280, 320, 41)
+        fractions = [self.covered([r, 0.1], 16)[1, 1] for r in rho]
+        self.assertTrue(np.all(np.diff(fractions) <= 1e-9))
+        self.assertAlmostEqual(fractions[0], 1)
+        self.assertAlmostEqual(fractions[-1], 0)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            coverage = CoverageTable.load_or_build(self.geometry, cache_dir=cache_dir, phi_steps=8)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached = CoverageTable.load_or_build(self.geometry, cache_dir=cache_dir, phi_steps=8)
+            assert_allclose(cached.table, coverage.table)
+            # A different layout gets its own table
+            CoverageTable.load_or_build(RadarGeometry([100, 200]), cache_dir=cache_dir, phi_steps=8)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+
+class TestExactCoverageEngine(unittest.TestCase):
+    def test_observe(self):
+        engine = ObservationEngine(forecast_frames=[10, 30])
+        coverage = CoverageTable.build(engine.geometry)
+        exact = ObservationEngine(forecast_frames=[10, 30], exact_coverage=coverage)
+        game_state = make_game_state(200, seed=3)
+
+        obs = engine.observe(game_state)
+        exact_obs = exact.observe(game_state)
+        # Spreading the asteroids out only moves area between neighbouring zones
+        self.assertEqual(exact_obs["radar"].shape, obs["radar"].shape)
+        self.assertFalse(np.allclose(exact_obs["radar"], obs["radar"]))
+        assert_allclose(exact_obs["radar"].sum(), obs["radar"].sum(), rtol=0.2)
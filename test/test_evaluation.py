@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from numpy.testing import assert_allclose
+from stable_baselines3 import PPO
+
+from src.envs import RadarEnv
+from src.evaluation import AsyncEvaluator, evaluate_checkpoints, run_episode, scenario_grid, summarize
+from src.testing import FakeScenario, FakeTrainerEnvironment, evaluate_fake_episode
+
+
+class ConstantPolicy:
+    def predict(self, obs, deterministic=True):
+        return np.array([0.5, -0.5]), None
+
+
+@mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+class TestEvaluation(unittest.TestCase):
+    def test_scenario_grid(self):
+        grid = scenario_grid([10, 20], [(600, 600)], range(3), time_limit=30)
+        self.assertEqual(len(grid), 6)
+        self.assertEqual(grid[0], {'num_asteroids': 10, 'map_size': (600, 600), 'seed': 0, 'time_limit': 30})
+
+    def test_run_episode(self):
+        result = run_episode(ConstantPolicy(), RadarEnv({'frames': 4}))
+        self.assertEqual(result['steps'], 4)
+        self.assertGreater(result['reward'], 0)
+        self.assertGreater(result['steps_per_second'], 0)
+
+    def test_summarize(self):
+        results = [{'checkpoint': 'a', 'reward': reward, 'survival_time': 2 * reward, 'steps_per_second': 100}
+                   for reward in [1, 2, 3]]
+        results.append({'checkpoint': 'b', 'reward': 5, 'survival_time': 1, 'steps_per_second': 50})
+        report = summarize(results)
+        self.assertEqual(list(report), ['a', 'b'])
+        self.assertEqual(report['a']['episodes'], 3)
+        assert_allclose([report['a']['reward_mean'], report['a']['reward_var']], [2, 2 / 3])
+        assert_allclose(report['a']['survival_time_mean'], 4)
+        assert_allclose(report['b']['steps_per_second_mean'], 50)
+
+    @mock.patch('src.evaluation.Scenario', FakeScenario)
+    def test_evaluate_checkpoints(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoints = [os.path.join(tmp, 'a'), os.path.join(tmp, 'b')]
+            model = PPO("MultiInputPolicy", RadarEnv({'frames': 3}), n_steps=8, batch_size=8, device='cpu')
+            for checkpoint in checkpoints:
+                model.save(checkpoint)
+
+            report, results = evaluate_checkpoints(checkpoints, scenario_grid([2, 5], seeds=[0]), n_workers=0)
+            self.assertEqual(len(results), 4)
+            self.assertEqual([result['steps'] for result in results], [2, 5, 2, 5])
+            self.assertEqual(report[checkpoints[0]]['episodes'], 2)
+
+    @mock.patch('src.evaluation.evaluate_episode', evaluate_fake_episode)
+    def test_async_evaluator_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoints = [os.path.join(tmp, 'a'), os.path.join(tmp, 'b')]
+            model = PPO("MultiInputPolicy", RadarEnv({'frames': 3}), n_steps=8, batch_size=8, device='cpu')
+            for checkpoint in checkpoints:
+                model.save(checkpoint)
+
+            with AsyncEvaluator(scenario_grid([2, 5], seeds=[0]), n_workers=2) as evaluator:
+                for checkpoint in checkpoints:
+                    evaluator.submit(checkpoint)
+                report = evaluator.wait()
+                self.assertEqual(evaluator.poll(), {})
+            self.assertEqual(list(report), checkpoints)
+            self.assertEqual([row['episodes'] for row in report.values()], [2, 2])
+            # Every episode was played out in full, in a worker process
+            self.assertTrue(all(row['steps_per_second_mean'] > 0 for row in report.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
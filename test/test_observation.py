@@ -0,0 +1,203 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from src.lib import center_coords
+from src.observation import FEATURES, ObservationEngine
+from src.radar import get_radar
+from src.testing import make_game_state
+
+
+def reference_obs(game_state, ship, forecast_frames, radar_zones):
+    # The pipeline, written out step by step
+    ship_position = np.array(ship['position'], dtype=np.float64)
+    ship_heading = np.radians(ship['heading'])
+    ship_velocity = np.array(ship['velocity'], dtype=np.float64)
+    asteroid_positions = np.array([asteroid['position'] for asteroid in game_state['asteroids']])
+    asteroid_velocity = np.array([asteroid['velocity'] for asteroid in game_state['asteroids']])
+    asteroid_radii = np.array([asteroid['radius'] for asteroid in game_state['asteroids']])
+    map_size = np.array(game_state['map_size'])
+
+    centered = center_coords(ship_position, ship_heading, asteroid_positions, map_size)
+    centered_future = center_coords(ship_position + forecast_frames * ship_velocity, ship_heading,
+                                    asteroid_positions + forecast_frames * asteroid_velocity, map_size)
+    return {
+        "radar": get_radar(centered, asteroid_radii, radar_zones),
+        "forecast": get_radar(centered_future, asteroid_radii, radar_zones),
+    }
+
+
+class TestObservationEngine(unittest.TestCase):
+    def test_matches_reference(self):
+        engine = ObservationEngine([100, 250, 400], forecast_frames=30)
+        # Several frames with different asteroid counts, so the engine's buffers have to grow
+        for seed, n in enumerate([5, 100, 20, 300]):
+            game_state = make_game_state(n, seed)
+            obs = engine.observe(game_state)
+            expected = reference_obs(game_state, game_state['ships'][0], 30, [100, 250, 400])
+            for key in expected:
+                assert_allclose(obs[key], expected[key], atol=1e-12)
+                self.assertIn(obs[key].astype(np.float32), engine.observation_space[key])
+
+    def test_ship_state(self):
+        engine = ObservationEngine()
+        game_state = make_game_state(50)
+        other_ship = make_game_state(0, seed=1)['ships'][0]
+
+        obs = engine.observe(game_state, other_ship)
+        expected = reference_obs(game_state, other_ship, engine.forecast_frames, engine.radar_zones)
+        for key in expected:
+            assert_allclose(obs[key], expected[key], atol=1e-12)
+
+    def test_multiple_horizons(self):
+        horizons = [10, 30, 60, 120]
+        engine = ObservationEngine([100, 250, 400], forecast_frames=horizons)
+        self.assertEqual(engine.observation_space["forecast"].shape, (4, 3, 4))
+
+        for seed, n in enumerate([40, 150]):
+            game_state = make_game_state(n, seed)
+            obs = engine.observe(game_state)
+            self.assertEqual(obs["forecast"].shape, (4, 3, 4))
+            for k, horizon in enumerate(horizons):
+                expected = reference_obs(game_state, game_state['ships'][0], horizon, [100, 250, 400])
+                assert_allclose(obs["radar"], expected["radar"], atol=1e-12)
+                assert_allclose(obs["forecast"][k], expected["forecast"], atol=1e-12)
+
+    def test_spatial_index(self):
+        # Short horizon on a big, dense map, so most asteroids get culled -- the result must not change
+        plain = ObservationEngine([100, 250, 400], forecast_frames=[1, 2])
+        indexed = ObservationEngine([100, 250, 400], forecast_frames=[1, 2], spatial_index=True)
+        for seed in range(5):
+            game_state = make_game_state(2000, seed, map_size=(4000, 3000))
+            expected, obs = plain.observe(game_state), indexed.observe(game_state)
+            for key in expected:
+                assert_allclose(obs[key], expected[key], atol=1e-12)
+            self.assertEqual(len(indexed.index.positions), 2000)
+
+    def test_float32_and_flatten(self):
+        plain = ObservationEngine([100, 250, 400], forecast_frames=[10, 30])
+        engine = ObservationEngine([100, 250, 400], forecast_frames=[10, 30], dtype=np.float32)
+        flat = ObservationEngine([100, 250, 400], forecast_frames=[10, 30], dtype=np.float32, flatten=True)
+        self.assertEqual(flat.observation_space.shape, (36,))
+
+        for seed, n in enumerate([40, 150]):
+            game_state = make_game_state(n, seed)
+            expected, obs, flat_obs = plain.observe(game_state), engine.observe(game_state), flat.observe(game_state)
+            for key in expected:
+                self.assertEqual(obs[key].dtype, np.float32)
+                self.assertIn(obs[key], engine.observation_space[key])
+                assert_allclose(obs[key], expected[key], rtol=1e-6)
+            assert_allclose(flat_obs, np.concatenate([expected["radar"].ravel(), expected["forecast"].ravel()]),
+                            rtol=1e-6)
+            self.assertIn(flat_obs, flat.observation_space)
+
+        # Every frame is written into the same buffers
+        self.assertIs(engine.observe(game_state)["radar"], obs["radar"])
+
+    def test_observe_ships(self):
+        for flatten in [False, True]:
+            single = ObservationEngine([100, 250, 400], forecast_frames=[10, 30], flatten=flatten)
+            engine = ObservationEngine([100, 250, 400], forecast_frames=[10, 30], flatten=flatten)
+            for seed, n_ships in enumerate([3, 1, 5]):
+                game_state = make_game_state(100, seed, n_ships=n_ships)
+                obs = engine.observe_ships(game_state)
+                self.assertIn(obs, engine.ship_observation_space(n_ships))
+                for i, ship_state in enumerate(game_state['ships']):
+                    expected = single.observe(game_state, ship_state)
+                    if flatten:
+                        assert_allclose(obs[i], expected, atol=1e-12)
+                    else:
+                        for key in expected:
+                            assert_allclose(obs[key][i], expected[key], atol=1e-12)
+
+    def test_scratch_capacity(self):
+        engine = ObservationEngine()
+        game_state = make_game_state(10, n_ships=3)
+        for _ in range(10):
+            engine.observe(game_state)
+            engine.observe_ships(game_state)
+        self.assertEqual(engine._projected.shape[1], 64)
+        engine.observe(make_game_state(100))
+        self.assertEqual(engine._projected.shape[1], 128)
+
+    def test_no_asteroids(self):
+        engine = ObservationEngine([100, 200], n_sectors=8)
+        obs = engine.observe(make_game_state(0))
+        assert_allclose(obs["radar"], np.zeros((2, 8)))
+        assert_allclose(obs["forecast"], np.zeros((2, 8)))
+
+    def test_ttc(self):
+        engine = ObservationEngine([100, 250, 400], forecast_frames=None, ttc_horizon=5.)
+        self.assertEqual(set(engine.observation_space.keys()), {"radar", "ttc"})
+        # The ship faces up, with one asteroid coming straight at it from the front, and one sitting still on its left
+        game_state = make_game_state(0)
+        game_state['asteroids'] = [{'position': (500., 600.), 'velocity': (0., -50.), 'radius': 16.},
+                                   {'position': (300., 400.), 'velocity': (0., 0.), 'radius': 16.}]
+        game_state['ships'][0].update(position=(500., 400.), heading=90., velocity=(0., 0.), radius=20.)
+
+        obs = engine.observe(game_state)
+        self.assertIn(obs, engine.observation_space)
+        # (200 - 36) / 50 = 3.28 seconds to go, out of 5. Nothing on the right, left or rear will hit.
+        assert_allclose(obs["ttc"], [0, 1 - 3.28 / 5, 0, 0], atol=1e-12)
+
+    def test_ttc_ships_and_flatten(self):
+        single = ObservationEngine([100, 250, 400], forecast_frames=[10], ttc_horizon=3.)
+        engine = ObservationEngine([100, 250, 400], forecast_frames=[10], ttc_horizon=3., flatten=True)
+        self.assertEqual(engine.ship_observation_space(3).shape, (3, 28))
+        game_state = make_game_state(300, seed=4, n_ships=3)
+        obs = engine.observe_ships(game_state)
+        for i, ship_state in enumerate(game_state['ships']):
+            expected = single.observe(game_state, ship_state)
+            self.assertGreater(expected["ttc"].max(), 0)
+            assert_allclose(obs[i], np.concatenate([expected[key].ravel() for key in ["radar", "forecast", "ttc"]]),
+                            atol=1e-12)
+
+    def test_nearest(self):
+        engine = ObservationEngine([100, 250, 400], features=["nearest"])
+        self.assertEqual(list(engine.observation_space.keys()), ["nearest"])
+        # The ship faces up, with one asteroid 200 in front of it, and one 300 to its left
+        game_state = make_game_state(0)
+        game_state['asteroids'] = [{'position': (500., 600.), 'velocity': (0., -50.), 'radius': 16.},
+                                   {'position': (200., 400.), 'velocity': (0., 0.), 'radius': 16.}]
+        game_state['ships'][0].update(position=(500., 400.), heading=90., velocity=(0., 0.), radius=20.)
+        assert_allclose(engine.observe(game_state)["nearest"], [0, 1 - 184 / 400, 1 - 284 / 400, 0])
+
+    def test_feature_selection(self):
+        full = ObservationEngine([100, 250, 400], forecast_frames=[10, 30], ttc_horizon=3.,
+                                 features=["radar", "forecast", "ttc", "nearest"])
+        game_state = make_game_state(200, seed=5, n_ships=2)
+        expected = {key: value.copy() for key, value in full.observe(game_state).items()}
+        for features in [["radar"], ["forecast"], ["nearest", "ttc"], ["forecast", "nearest"], ["forecast", "ttc"]]:
+            engine = ObservationEngine([100, 250, 400], forecast_frames=[10, 30], ttc_horizon=3., features=features)
+            obs = engine.observe(game_state)
+            self.assertEqual(set(obs), set(features))
+            self.assertIn(obs, engine.observation_space)
+            for key in features:
+                assert_allclose(obs[key], expected[key], atol=1e-12)
+
+            # The same features, and nothing else, for several ships at once, and flattened in the order of FEATURES
+            flat = ObservationEngine([100, 250, 400], forecast_frames=[10, 30], ttc_horizon=3., features=features,
+                                     flatten=True)
+            ships = flat.observe_ships(game_state)
+            for i, ship_state in enumerate(game_state['ships']):
+                obs = engine.observe(game_state, ship_state)
+                assert_allclose(ships[i], np.concatenate([obs[key].ravel() for key in FEATURES if key in obs]),
+                                atol=1e-12)
+
+        # Only what the features need is projected
+        assert_allclose(ObservationEngine(features=["ttc"], ttc_horizon=3.).horizons, [0])
+        assert_allclose(ObservationEngine(forecast_frames=[10, 30], features=["forecast"]).horizons, [10, 30])
+        # ... and the offsets are only kept for the present horizon, and only for the ttc channel
+        self.assertEqual(full._offsets.shape[:2], (1, 1))
+        self.assertIsNone(ObservationEngine(features=["radar", "nearest"])._offsets)
+
+    def test_bad_features(self):
+        for kwargs in [dict(features=[]), dict(features=["radar", "sonar"]), dict(features=["present_polar"]),
+                       dict(features=["ttc"]), dict(forecast_frames=None, features=["forecast"])]:
+            with self.assertRaises(ValueError):
+                ObservationEngine(**kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import torch
+from numpy.testing import assert_allclose
+from stable_baselines3 import PPO
+
+from src.envs import RadarEnv
+from src.policy import NumpyPolicy
+from src.testing import FakeTrainerEnvironment
+
+
+@mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+class TestNumpyPolicy(unittest.TestCase):
+    def random_obs(self, env, rng, batch_size=None):
+        shape = () if batch_size is None else (batch_size,)
+        return {key: rng.uniform(0, 1, size=shape + space.shape) for key, space in env.observation_space.items()}
+
+    def test_matches_model(self):
+        rng = np.random.default_rng(0)
+        for policy_kwargs in [None, dict(net_arch=[16, 8], activation_fn=torch.nn.ReLU)]:
+            env = RadarEnv({'frames': 3}, forecast_frames=[10, 30])
+            model = PPO("MultiInputPolicy", env, policy_kwargs=policy_kwargs, device='cpu')
+            # Large weights, so some actions need clipping
+            with torch.no_grad():
+                model.policy.action_net.weight.mul_(20)
+            policy = NumpyPolicy.from_model(model)
+
+            for _ in range(10):
+                obs = self.random_obs(env, rng)
+                expected, _ = model.predict(obs, deterministic=True)
+                assert_allclose(policy.act(obs), expected, atol=1e-5)
+
+            obs = self.random_obs(env, rng, batch_size=7)
+            expected, _ = model.predict(obs, deterministic=True)
+            assert_allclose(policy.act_batch(obs), expected, atol=1e-5)
+
+    def test_save_load(self):
+        env = RadarEnv({'frames': 3})
+        policy = NumpyPolicy.from_model(PPO("MultiInputPolicy", env, device='cpu'))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'policy.npz')
+            policy.save(path)
+            loaded = NumpyPolicy.load(path)
+
+        self.assertEqual(loaded.keys, policy.keys)
+        self.assertEqual(loaded.activation, 'Tanh')
+        obs = self.random_obs(env, np.random.default_rng(1))
+        assert_allclose(loaded.act(obs), policy.act(obs))
+
+
+if __name__ == '__main__':
+    unittest.main()
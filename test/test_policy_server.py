@@ -0,0 +1,105 @@
+import multiprocessing as mp
+import os
+import signal
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from src.policy import NumpyPolicy
+from src.policy_server import PolicyServer
+
+
+def make_policy(seed=0):
+    rng = np.random.default_rng(seed)
+    weights = [rng.normal(size=(16, 24)), rng.normal(size=(2, 16))]
+    biases = [rng.normal(size=16), rng.normal(size=2)]
+    return NumpyPolicy(['forecast', 'radar'], [12, 12], weights, biases, 'Tanh', [-1, -1], [1, 1])
+
+
+def make_obs(rng):
+    return {'forecast': rng.uniform(0, 1, size=(3, 4)), 'radar': rng.uniform(0, 1, size=(3, 4))}
+
+
+def play_in_process(client, policy_path, results):
+    # A game process: check every action against its own copy of the policy
+    policy = NumpyPolicy.load(policy_path)
+    rng = np.random.default_rng(client.client_id)
+    ok = True
+    for _ in range(10):
+        obs = make_obs(rng)
+        ok &= np.allclose(client.act(obs), policy.act(obs), atol=1e-6)
+    results.put((client.client_id, ok))
+
+
+class TestPolicyServer(unittest.TestCase):
+    def test_concurrent_clients(self):
+        policy = make_policy()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'policy.npz')
+            policy.save(path)
+
+            with PolicyServer(path, n_clients=4, max_wait=0.005) as server:
+                def play(client):
+                    rng = np.random.default_rng(client.client_id)
+                    for _ in range(25):
+                        obs = make_obs(rng)
+                        assert_allclose(client.act(obs), policy.act(obs), atol=1e-6)
+                    return True
+
+                with ThreadPoolExecutor(4) as pool:
+                    self.assertTrue(all(pool.map(play, server.clients)))
+            self.assertFalse(server.process.is_alive())
+
+    def test_client_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'policy.npz')
+            make_policy().save(path)
+
+            ctx = mp.get_context('forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn')
+            with PolicyServer(path, n_clients=2) as server:
+                results = ctx.Queue()
+                games = [ctx.Process(target=play_in_process, args=(client, path, results))
+                         for client in server.clients]
+                for game in games:
+                    game.start()
+                outcomes = dict(results.get(timeout=60) for _ in games)
+                for game in games:
+                    game.join()
+            self.assertEqual(outcomes, {0: True, 1: True})
+
+    def test_server_dies(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'policy.npz')
+            make_policy().save(path)
+
+            with PolicyServer(path, n_clients=2) as server:
+                client = server.clients[0]
+                rng = np.random.default_rng(0)
+                client.act(make_obs(rng))
+                server.process.kill()
+                server.process.join()
+                with self.assertRaises(RuntimeError):
+                    client.act(make_obs(rng))
+
+    @unittest.skipUnless(hasattr(signal, 'SIGSTOP'), 'Needs SIGSTOP to freeze the server')
+    def test_server_hangs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'policy.npz')
+            make_policy().save(path)
+
+            with PolicyServer(path, n_clients=1, timeout=0.2) as server:
+                client = server.clients[0]
+                client.act(make_obs(np.random.default_rng(0)))
+                os.kill(server.process.pid, signal.SIGSTOP)
+                try:
+                    with self.assertRaises(TimeoutError):
+                        client.act(make_obs(np.random.default_rng(1)))
+                finally:
+                    os.kill(server.process.pid, signal.SIGCONT)
+
+
+if __name__ == '__main__':
+    unittest.main()
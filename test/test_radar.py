@@ -3,7 +3,7 @@ import unittest
 import numpy as np
 from numpy.testing import assert_allclose
 
-from src.radar import get_radar
+from src.radar import RadarGeometry, get_radar, get_radar_batch, get_radar_ragged, zone_areas
 
 
 class TestRadar(unittest.TestCase):
@@ -23,3 +23,130 @@ class TestRadar(unittest.TestCase):
             [0,           0, 0, 0,], # Far
         ])
         assert_allclose(radar, expected, atol=1e-7)
+
+    def test_radar_zone_areas(self):
+        # One asteroid in each ring, each normalized by the area of its own ring
+        centered_coords = np.array([[50, 0.5 * np.pi], [250, 0], [400, np.pi]])
+        asteroid_radii = np.array([10, 10, 10])
+        radar_zones = [100, 300, 500]
+
+        radar = get_radar(centered_coords, asteroid_radii, radar_zones)
+
+        # Slice areas - 2,500pi (near), 20,000pi (middle), 40,000pi (far)
+        expected = np.array([
+            [0,           0, 100 / 2500., 0,],
+            [0, 100 / 20000.,          0, 0,],
+            [0,           0,          0, 100 / 40000.,],
+        ])
+        assert_allclose(radar, expected, atol=1e-7)
+
+    def test_radar_sector_boundaries(self):
+        # Right is [1.25pi, 1.75pi), Front wraps around zero, Left is [0.25pi, 0.75pi), Rear is [0.75pi, 1.25pi)
+        angles = np.array([0, 0.25, 0.75, 1.25, 1.75, 1.99]) * np.pi
+        centered_coords = np.stack([np.full_like(angles, 50), angles], axis=-1)
+        asteroid_radii = np.full_like(angles, 10)
+
+        radar = get_radar(centered_coords, asteroid_radii, [100, 300, 500])
+
+        assert_allclose(radar[0] * 2500 / 100, [1, 3, 1, 1])
+        assert_allclose(radar[1:], 0)
+
+    def test_radar_out_of_range_and_capped(self):
+        centered_coords = np.array([[500, 0], [1000, 0], [10, 0]])
+        asteroid_radii = np.array([30, 30, 60])
+
+        radar = get_radar(centered_coords, asteroid_radii, [100, 300, 500])
+
+        expected = np.zeros((3, 4))
+        expected[0, 1] = 1
+        assert_allclose(radar, expected, atol=1e-7)
+
+
+class TestRadarBatch(unittest.TestCase):
+    def test_batch_matches_single(self):
+        rng = np.random.default_rng(0)
+        batch_size, n = 5, 40
+        centered_coords = np.stack([
+            rng.uniform(0, 600, size=(batch_size, n)),
+            rng.uniform(0, 2 * np.pi, size=(batch_size, n)),
+        ], axis=-1)
+        asteroid_radii = rng.uniform(8, 32, size=(batch_size, n))
+        # Each batch entry has a different number of real asteroids, the rest is padding
+        counts = np.array([0, 1, 10, 25, 40])
+        valid = np.arange(n) < counts[:, None]
+
+        radars = get_radar_batch(centered_coords, asteroid_radii, valid, radar_zones=[100, 300, 500])
+
+        self.assertEqual(radars.shape, (batch_size, 3, 4))
+        for b in range(batch_size):
+            expected = get_radar(centered_coords[b, :counts[b]], asteroid_radii[b, :counts[b]], [100, 300, 500])
+            assert_allclose(radars[b], expected, atol=1e-12)
+
+    def test_batch_custom_layout(self):
+        # Two rings and eight sectors; sector 0 is centered on the right, and sectors go counter-clockwise
+        centered_coords = np.array([[
+            [50, 1.5 * np.pi],   # Near, right
+            [50, 0],             # Near, front
+            [150, 1.75 * np.pi], # Far, front-right
+            [150, 0.75 * np.pi], # Far, rear-left
+        ]])
+        asteroid_radii = np.array([[10, 10, 10, 10]])
+
+        radars = get_radar_batch(centered_coords, asteroid_radii, radar_zones=[100, 200], n_sectors=8)
+
+        near_area, far_area = 10000 / 8, 30000 / 8
+        expected = np.zeros((1, 2, 8))
+        expected[0, 0, 0] = 100 / near_area
+        expected[0, 0, 2] = 100 / near_area
+        expected[0, 1, 1] = 100 / far_area
+        expected[0, 1, 5] = 100 / far_area
+        assert_allclose(radars, expected, atol=1e-12)
+
+    def test_ragged_matches_batch(self):
+        rng = np.random.default_rng(1)
+        counts = np.array([3, 0, 12, 7])
+        centered_coords = np.stack([rng.uniform(0, 600, size=counts.sum()),
+                                    rng.uniform(0, 2 * np.pi, size=counts.sum())], axis=-1)
+        asteroid_radii = rng.uniform(8, 32, size=counts.sum())
+        batch_index = np.repeat(np.arange(len(counts)), counts)
+
+        radars = get_radar_ragged(centered_coords, asteroid_radii, batch_index, len(counts),
+                                  radar_zones=[100, 300, 500])
+
+        self.assertEqual(radars.shape, (4, 3, 4))
+        for b in range(len(counts)):
+            expected = get_radar(centered_coords[batch_index == b], asteroid_radii[batch_index == b], [100, 300, 500])
+            assert_allclose(radars[b], expected, atol=1e-12)
+
+    def test_out(self):
+        rng = np.random.default_rng(2)
+        centered_coords = np.stack([rng.uniform(0, 600, size=(2, 30)), rng.uniform(0, 2 * np.pi, size=(2, 30))], -1)
+        asteroid_radii = rng.uniform(8, 32, size=(2, 30))
+        out = np.zeros((2, 3, 4), dtype=np.float32)
+
+        radars = get_radar_batch(centered_coords, asteroid_radii, radar_zones=[100, 300, 500], out=out)
+
+        self.assertIs(radars, out)
+        assert_allclose(out, get_radar_batch(centered_coords, asteroid_radii, radar_zones=[100, 300, 500]), rtol=1e-6)
+
+    def test_zone_areas(self):
+        assert_allclose(zone_areas([100, 300, 500], 4), np.pi * np.array([2500, 20000, 40000]))
+
+    def test_legacy_normalization(self):
+        # One asteroid (of area 100pi) in each ring. The original radar divided the near ring by a far slice minus an
+        # inner slice (37,500pi), and the far ring by an inner slice (2,500pi); now each ring is divided by its own.
+        centered_coords = np.array([[50, 0.5 * np.pi], [250, 0], [400, np.pi]])
+        asteroid_radii = np.array([10, 10, 10])
+        zones = [[0, 2], [1, 1], [2, 3]]
+
+        legacy = get_radar(centered_coords, asteroid_radii, [100, 300, 500], normalization='legacy')
+        radar = get_radar(centered_coords, asteroid_radii, [100, 300, 500])
+        assert_allclose([legacy[ring, sector] for ring, sector in zones], [100 / 37500, 100 / 20000, 100 / 2500])
+        assert_allclose([radar[ring, sector] for ring, sector in zones], [100 / 2500, 100 / 20000, 100 / 40000])
+
+        assert_allclose(zone_areas([100, 300, 500], 4, 'legacy'), np.pi * np.array([37500, 20000, 2500]))
+        self.assertEqual(RadarGeometry([100, 300, 500], normalization='legacy').normalization, 'legacy')
+        with self.assertRaises(ValueError):
+            zone_areas([100, 300, 500, 700], 4, 'legacy')
+        with self.assertRaises(ValueError):
+            zone_areas([100, 300, 500], 4, 'ring')
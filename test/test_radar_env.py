@@ -0,0 +1,166 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+from gymnasium import spaces
+from gymnasium.utils.env_checker import check_env
+from numpy.testing import assert_allclose
+
+from src.envs import RadarEnv, ScenarioPool
+from src.envs.radar_env import get_reward, get_ship_rewards
+from src.lib import AsteroidColumns
+from src.observation import ObservationEngine
+from src.spatial import TorusGrid
+from src.testing import FakeAsteroidTrainerEnvironment, FakeTrainerEnvironment, make_game_state
+
+
+@mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+class TestSpaces(unittest.TestCase):
+    def test_spaces(self):
+        env = RadarEnv({'frames': 7})
+        self.assertEqual(env.action_space, spaces.Box(low=-1, high=1, shape=(2,)))
+        self.assertEqual(set(env.observation_space.keys()), {"radar", "forecast"})
+        self.assertEqual(env.observation_space["radar"].shape, (3, 4))
+        # Also steps through reset() and step(), checking every observation against the spaces
+        check_env(env, skip_render_check=True)
+
+
+@mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+class TestActionRepeat(unittest.TestCase):
+    def test_repeat(self):
+        # Frames 1-3 and 4-6 are full steps, then the game ends on the very next frame
+        env = RadarEnv({'frames': 7}, action_repeat=3)
+        engine = ObservationEngine(env.radar_zones, forecast_frames=env.forecast_frames)
+        env.reset()
+        for frames, expect_terminated in [([1, 2, 3], False), ([4, 5, 6], False), ([7], True)]:
+            obs, reward, terminated, _, _ = env.step(np.array([0.5, -0.5]))
+            self.assertEqual(terminated, expect_terminated)
+            self.assertEqual(len(env.controller.action_queue), 0)
+
+            expected_reward = sum(get_reward(make_game_state(20, seed=frame)) for frame in frames)
+            self.assertAlmostEqual(reward, expected_reward)
+            expected_obs = engine.observe(make_game_state(20, seed=frames[-1]))
+            for key in expected_obs:
+                assert_allclose(obs[key], expected_obs[key])
+
+    def test_final_reward(self):
+        env = RadarEnv({'frames': 7}, action_repeat=3, repeat_reward='final')
+        env.reset()
+        _, reward, _, _, _ = env.step(np.zeros(2))
+        self.assertAlmostEqual(reward, 3 * get_reward(make_game_state(20, seed=3)))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RadarEnv({'frames': 7}, action_repeat=0)
+        with self.assertRaises(ValueError):
+            RadarEnv({'frames': 7}, repeat_reward='mean')
+
+
+@mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+class TestObservationBuffers(unittest.TestCase):
+    def test_copy_obs(self):
+        env = RadarEnv({'frames': 7})
+        obs, _ = env.reset()
+        next_obs, _, _, _, _ = env.step(np.zeros(2))
+        self.assertEqual(next_obs["radar"].dtype, np.float32)
+        self.assertIn(next_obs, env.observation_space)
+        self.assertFalse(np.shares_memory(obs["radar"], next_obs["radar"]))
+
+    def test_shared_flat_obs(self):
+        env = RadarEnv({'frames': 7}, flatten_obs=True, copy_obs=False)
+        obs, _ = env.reset()
+        next_obs, _, _, _, _ = env.step(np.zeros(2))
+        self.assertIs(obs, next_obs)
+        self.assertEqual(obs.shape, env.observation_space.shape)
+        self.assertEqual(obs.dtype, np.float32)
+
+
+class TestMultiShip(unittest.TestCase):
+    def test_ship_rewards(self):
+        game_state = make_game_state(50, seed=3, n_ships=4)
+        asteroids = AsteroidColumns().update(game_state['asteroids'])
+        index = TorusGrid(game_state['map_size']).build(asteroids.positions)
+        expected = [get_reward(dict(game_state, ships=[ship])) for ship in game_state['ships']]
+
+        assert_allclose(get_ship_rewards(game_state), expected)
+        assert_allclose(get_ship_rewards(game_state, asteroids=asteroids, index=index), expected)
+
+    @mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+    def test_env(self):
+        env = RadarEnv({'frames': 4, 'ships': 3}, n_ships=3)
+        self.assertEqual(env.action_space.shape, (3, 2))
+        self.assertEqual(env.observation_space["radar"].shape, (3, 3, 4))
+        engine = ObservationEngine(env.radar_zones, forecast_frames=env.forecast_frames)
+
+        obs, _ = env.reset()
+        self.assertIn(obs, env.observation_space)
+        obs, reward, _, _, _ = env.step(np.zeros((3, 2)))
+        self.assertEqual(reward.shape, (3,))
+        self.assertTrue(all(len(controller.action_queue) == 0 for controller in env.controllers))
+
+        game_state = make_game_state(20, seed=1, n_ships=3)
+        for i, ship_state in enumerate(game_state['ships']):
+            self.assertAlmostEqual(reward[i], get_reward(dict(game_state, ships=[ship_state])))
+            expected = engine.observe(game_state, ship_state)
+            for key in expected:
+                assert_allclose(obs[key][i], expected[key], rtol=1e-6)
+
+
+class TestScenarioPool(unittest.TestCase):
+    def test_generate(self):
+        pool = ScenarioPool.generate(size=4, num_asteroids=5, map_size=(600, 400), seed=3, time_limit=30)
+        again = ScenarioPool.generate(size=4, num_asteroids=5, map_size=(600, 400), seed=3, time_limit=30)
+        self.assertEqual(len(pool), 4)
+        for scenario, other in zip(pool.scenarios, again.scenarios):
+            self.assertEqual(scenario.asteroid_states, other.asteroid_states)
+            self.assertEqual(scenario.seed, other.seed)
+            self.assertEqual(scenario.time_limit, 30)
+            self.assertEqual(len(scenario.asteroid_states), 5)
+        positions = np.array([state['position'] for state in pool[0].asteroid_states])
+        self.assertTrue(np.all((positions >= 0) & (positions < (600, 400))))
+        self.assertNotEqual(pool[0].asteroid_states, pool[1].asteroid_states)
+
+    @mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+    def test_reset(self):
+        env = RadarEnv(ScenarioPool([{'frames': frames} for frames in range(2, 12)]))
+
+        indices = [env.reset(seed=seed)[1]['scenario_index'] for seed in range(10)]
+        self.assertEqual(indices, [env.reset(seed=seed)[1]['scenario_index'] for seed in range(10)])
+        self.assertGreater(len(set(indices)), 1)
+
+        _, info = env.reset(options={'scenario_index': 4})
+        self.assertEqual(info['scenario_index'], 4)
+        self.assertIs(env.scenario, env.scenario_pool[4])
+        # Scenario 4 plays 6 frames, so the 6th step ends the episode
+        terminated = [env.step(np.zeros(2))[2] for _ in range(6)]
+        self.assertEqual(terminated, [False] * 5 + [True])
+
+
+@mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+class TestAsteroidTracking(unittest.TestCase):
+    def test_reset(self):
+        env = RadarEnv({'frames': 5}, track_asteroids=True)
+        env.reset()
+        assert_allclose(env.asteroids.ids, np.arange(20))
+        env.step(np.zeros(2))
+        # The fake game plays unrelated random frames, so every asteroid is new
+        self.assertEqual(env.asteroids.ids.min(), 20)
+        # ... and a new episode starts counting again
+        env.reset()
+        assert_allclose(env.asteroids.ids, np.arange(20))
+        self.assertEqual(env.asteroids.frame, 0)
+
+    def test_action_repeat(self):
+        # Only the last of each action's frames updates the tracker, but the asteroids are still followed across
+        with mock.patch('src.envs.radar_env.TrainerEnvironment', FakeAsteroidTrainerEnvironment):
+            env = RadarEnv({'frames': 20}, track_asteroids=True, action_repeat=3, repeat_reward='final')
+        env.reset()
+        for step in range(1, 4):
+            env.step(np.zeros(2))
+            assert_allclose(env.asteroids.ids, np.arange(5))
+            self.assertEqual(len(env.asteroids.destroyed_ids), 0)
+            self.assertEqual(env.asteroids.frame, 3 * step)
+
+
+if __name__ == '__main__':
+    unittest.main()
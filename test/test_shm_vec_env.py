@@ -0,0 +1,88 @@
+import unittest
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from numpy.testing import assert_allclose
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from src.envs.shm_vec_env import ShmVecEnv
+
+
+class CountingEnv(gym.Env):
+    """A tiny stand-in for RadarEnv: the observation is just a function of the step count and the last action."""
+
+    def __init__(self, episode_length):
+        self.episode_length = episode_length
+        self.t = 0
+        self.observation_space = spaces.Dict({
+            "radar": spaces.Box(low=0, high=100, shape=(3, 4)),
+            "forecast": spaces.Box(low=0, high=100, shape=(3, 4)),
+        })
+        self.action_space = spaces.Box(low=-1, high=1, shape=(2,))
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed, options=options)
+        self.t = 0
+        return self._obs(np.zeros(2)), {}
+
+    def step(self, action):
+        self.t += 1
+        terminated = self.t >= self.episode_length
+        return self._obs(action), float(self.t * action[0]), terminated, False, {"t": self.t}
+
+    def _obs(self, action):
+        return {
+            "radar": np.full((3, 4), self.t, dtype=np.float32),
+            "forecast": np.full((3, 4), action[1], dtype=np.float32),
+        }
+
+
+def make_env_fns():
+    return [lambda length=length: CountingEnv(length) for length in (3, 5)]
+
+
+class TestShmVecEnv(unittest.TestCase):
+    def test_matches_dummy_vec_env(self):
+        shm_env = ShmVecEnv(make_env_fns())
+        dummy_env = DummyVecEnv(make_env_fns())
+        try:
+            shm_obs, dummy_obs = shm_env.reset(), dummy_env.reset()
+            for key in dummy_obs:
+                assert_allclose(shm_obs[key], dummy_obs[key])
+
+            rng = np.random.default_rng(0)
+            for _ in range(12):
+                actions = rng.uniform(-1, 1, size=(2, 2)).astype(np.float32)
+                shm_obs, shm_rewards, shm_dones, shm_infos = shm_env.step(actions)
+                dummy_obs, dummy_rewards, dummy_dones, dummy_infos = dummy_env.step(actions)
+
+                for key in dummy_obs:
+                    assert_allclose(shm_obs[key], dummy_obs[key])
+                assert_allclose(shm_rewards, dummy_rewards, rtol=1e-6)
+                np.testing.assert_array_equal(shm_dones, dummy_dones)
+                for shm_info, dummy_info in zip(shm_infos, dummy_infos):
+                    self.assertEqual(shm_info["t"], dummy_info["t"])
+                    if "terminal_observation" in dummy_info:
+                        for key in dummy_info["terminal_observation"]:
+                            assert_allclose(shm_info["terminal_observation"][key],
+                                            dummy_info["terminal_observation"][key])
+                    else:
+                        self.assertNotIn("terminal_observation", shm_info)
+        finally:
+            shm_env.close()
+            dummy_env.close()
+
+    def test_attributes(self):
+        shm_env = ShmVecEnv(make_env_fns())
+        try:
+            self.assertEqual(shm_env.get_attr("episode_length"), [3, 5])
+            shm_env.set_attr("episode_length", 7, indices=[1])
+            self.assertEqual(shm_env.get_attr("episode_length"), [3, 7])
+            self.assertFalse(shm_env.has_attr("not_an_attribute"))
+        finally:
+            shm_env.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from src.envs.radar_env import get_reward
+from src.lib import AsteroidColumns
+from src.spatial import TorusGrid
+
+
+def brute_force_distances(point, positions, map_size):
+    delta = np.abs(positions - point)
+    delta = np.minimum(delta, map_size - delta)
+    return np.linalg.norm(delta, axis=1)
+
+
+class TestTorusGrid(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_query_radius(self):
+        for map_size, n, cell_size in [((1000, 800), 500, 100), ((600, 600), 20, 100), ((300, 200), 50, 500)]:
+            map_size = np.array(map_size, dtype=np.float64)
+            positions = self.rng.uniform(0, 1, size=(n, 2)) * map_size
+            grid = TorusGrid(map_size, cell_size).build(positions)
+            for _ in range(20):
+                point = self.rng.uniform(0, 1, size=2) * map_size
+                radius = self.rng.uniform(0, 600)
+
+                indices, distances = grid.query_radius(point, radius)
+                expected_distances = brute_force_distances(point, positions, map_size)
+                expected = np.flatnonzero(expected_distances <= radius)
+
+                np.testing.assert_array_equal(np.sort(indices), expected)
+                assert_allclose(distances, expected_distances[indices])
+
+    def test_nearest(self):
+        map_size = np.array([1000., 800.])
+        positions = self.rng.uniform(0, 1, size=(300, 2)) * map_size
+        grid = TorusGrid(map_size).build(positions)
+        for k in [1, 5, 300, 1000]:
+            for _ in range(10):
+                point = self.rng.uniform(0, 1, size=2) * map_size
+                indices, distances = grid.nearest(point, k)
+                expected_distances = np.sort(brute_force_distances(point, positions, map_size))[:k]
+                assert_allclose(distances, expected_distances)
+                self.assertEqual(len(np.unique(indices)), len(indices))
+
+    def test_wraparound(self):
+        # Visually, the asteroid is on the other side of the map -- but it's really 20 units to the left of the ship
+        map_size = np.array([500., 500.])
+        positions = np.array([[490., 250.], [250., 250.]])
+        grid = TorusGrid(map_size).build(positions)
+
+        indices, distances = grid.nearest(np.array([10., 250.]))
+        np.testing.assert_array_equal(indices, [0])
+        assert_allclose(distances, [20])
+
+    def test_empty(self):
+        grid = TorusGrid(np.array([500., 500.])).build(np.zeros((0, 2)))
+        indices, distances = grid.nearest(np.array([10., 250.]), k=3)
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(len(grid.query_radius(np.array([10., 250.]), 100)[0]), 0)
+
+
+class TestReward(unittest.TestCase):
+    def test_reward_wraps(self):
+        game_state = {
+            'ships': [{'position': (10., 250.)}],
+            'asteroids': [{'position': (490., 250.), 'velocity': (0., 0.), 'radius': 8.},
+                          {'position': (250., 250.), 'velocity': (0., 0.), 'radius': 8.}],
+            'map_size': (500, 500),
+        }
+        self.assertAlmostEqual(get_reward(game_state), np.sqrt(20))
+
+        asteroids = AsteroidColumns().update(game_state['asteroids'])
+        grid = TorusGrid(game_state['map_size']).build(asteroids.positions)
+        self.assertAlmostEqual(get_reward(game_state, asteroids=asteroids, index=grid), np.sqrt(20))
+
+
+if __name__ == '__main__':
+    unittest.main()
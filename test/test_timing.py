@@ -0,0 +1,58 @@
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.envs import RadarEnv
+from src.envs.timing import StepTimer
+from src.testing import FakeTrainerEnvironment
+
+
+class TestStepTimer(unittest.TestCase):
+    def test_phases(self):
+        timer = StepTimer(['a', 'b'], window=3)
+        timer.mark('a')  # Not started yet, so this is ignored
+        self.assertEqual(timer.summary(), {})
+
+        timer.start()
+        for _ in range(5):
+            time.sleep(0.002)
+            timer.mark('a')
+            timer.mark('b')
+        summary = timer.summary()
+        self.assertEqual(summary['a']['count'], 3)
+        self.assertGreater(summary['a']['p50'], 0.001)
+        self.assertLess(summary['b']['p99'], summary['a']['p50'])
+        self.assertEqual(set(timer.last), {'a', 'b'})
+
+        timer.clear()
+        self.assertEqual(timer.summary(), {})
+
+
+@mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+class TestRadarEnvProfiling(unittest.TestCase):
+    def test_disabled(self):
+        env = RadarEnv({'frames': 3})
+        env.reset()
+        _, _, _, _, info = env.step(np.zeros(2))
+        self.assertEqual(info, {})
+        self.assertIsNone(env.timing_summary())
+
+    def test_enabled(self):
+        env = RadarEnv({'frames': 3}, profile=True)
+        env.reset()
+        for _ in range(2):
+            _, _, terminated, _, info = env.step(np.zeros(2))
+            self.assertFalse(terminated)
+            self.assertEqual(list(info['timing']), ['caller', 'simulate', 'extract', 'observe', 'reward'])
+        self.assertNotIn('timing_summary', info)
+
+        _, _, terminated, _, info = env.step(np.zeros(2))
+        self.assertTrue(terminated)
+        self.assertEqual(info['timing_summary']['observe']['count'], 3)
+        self.assertEqual(env.timing_summary().keys(), info['timing_summary'].keys())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from src.observation import ObservationEngine
+from src.tracking import NO_PARENT, AsteroidTracker
+from src.testing import DELTA_TIME, MAP_SIZE, FakeAsteroidGame, make_game_state
+
+
+class TestAsteroidTracker(unittest.TestCase):
+    def assert_consistent(self, tracker, game, id_map):
+        # The tracker's IDs are a consistent relabelling of the true IDs
+        for true_id, tracked_id in zip(game.true_ids, tracker.ids.tolist()):
+            self.assertEqual(id_map.setdefault(true_id, tracked_id), tracked_id)
+        self.assertEqual(len(set(tracker.ids.tolist())), len(tracker))
+
+    def test_no_changes(self):
+        game = FakeAsteroidGame(20)
+        tracker = game.update(AsteroidTracker())
+        ids = tracker.ids.copy()
+        assert_array_equal(tracker.new_indices, np.arange(20))
+        for _ in range(5):
+            game.step()
+            game.update(tracker)
+            assert_array_equal(tracker.ids, ids)
+            self.assertEqual(len(tracker.new_indices), 0)
+            self.assertEqual(len(tracker.destroyed_ids), 0)
+        assert_array_equal(tracker.ages, 5)
+        assert_allclose(tracker.positions, [asteroid['position'] for asteroid in game.asteroids])
+
+    def test_splits(self):
+        game = FakeAsteroidGame(30, seed=1)
+        tracker = game.update(AsteroidTracker(capacity=8))
+        id_map = {}
+        self.assert_consistent(tracker, game, id_map)
+        for frame in range(60):
+            destroy = game.rng.choice(len(game.asteroids), size=frame % 3, replace=False).tolist()
+            destroyed = [id_map[game.true_ids[index]] for index in destroy]
+            parent_radii = {id_map[game.true_ids[index]]: game.asteroids[index]['radius'] for index in destroy}
+            n_before = game.next_id
+            game.step(destroy)
+            game.update(tracker)
+
+            self.assertEqual(sorted(tracker.destroyed_ids.tolist()), sorted(destroyed))
+            self.assertEqual(len(tracker.new_indices), game.next_id - n_before)
+            self.assert_consistent(tracker, game, id_map)
+            # Every child knows which asteroid it split off from
+            for index in tracker.new_indices:
+                parent = tracker.parent_ids[index]
+                self.assertIn(parent, destroyed)
+                self.assertEqual(tracker.radii[index], parent_radii[parent] - 8)
+                self.assertEqual(tracker.ages[index], 0)
+
+    def test_skipped_frames(self):
+        # Only every third frame is seen, as with RadarEnv's action_repeat
+        game = FakeAsteroidGame(20, seed=2)
+        tracker = game.update(AsteroidTracker())
+        id_map = {}
+        self.assert_consistent(tracker, game, id_map)
+        for step in range(1, 6):
+            destroyed = [id_map[game.true_ids[0]]]
+            game.step([0])
+            game.step()
+            game.step()
+            game.update(tracker)
+            self.assertEqual(tracker.destroyed_ids.tolist(), destroyed)
+            self.assertEqual(len(tracker.new_indices), 3)
+            self.assert_consistent(tracker, game, id_map)
+            self.assertEqual(tracker.frame, 3 * step)
+            assert_array_equal(tracker.parent_ids[tracker.new_indices], destroyed * 3)
+
+    def test_same_velocity(self):
+        # Stationary asteroids all look alike, apart from where they are
+        asteroids = [{'position': (100. * i, 50.), 'velocity': (0., 0.), 'radius': 16.} for i in range(5)]
+        tracker = AsteroidTracker().update(asteroids, MAP_SIZE, DELTA_TIME)
+        asteroids[1] = asteroids.pop()
+        tracker.update(asteroids, MAP_SIZE, DELTA_TIME)
+        assert_array_equal(tracker.ids, [0, 4, 2, 3])
+        assert_array_equal(tracker.destroyed_ids, [1])
+        assert_array_equal(tracker.parent_ids, NO_PARENT)
+
+    def test_reset(self):
+        game = FakeAsteroidGame(5)
+        tracker = game.update(AsteroidTracker())
+        tracker.reset()
+        game.step()
+        game.update(tracker)
+        assert_array_equal(tracker.ids, np.arange(5))
+        assert_array_equal(tracker.ages, 0)
+
+
+class TestTrackingEngine(unittest.TestCase):
+    def test_observe(self):
+        engine = ObservationEngine(forecast_frames=[10, 30])
+        tracking = ObservationEngine(forecast_frames=[10, 30], track_asteroids=True)
+        game_state = make_game_state(50)
+        expected = engine.observe(game_state)
+        obs = tracking.observe(game_state)
+        for key in expected:
+            assert_allclose(obs[key], expected[key])
+        assert_array_equal(tracking.asteroids.ids, np.arange(50))
+
+
+if __name__ == '__main__':
+    unittest.main()
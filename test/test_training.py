@@ -0,0 +1,121 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import torch
+from stable_baselines3 import PPO
+
+from src.training import DEFAULT_CONFIG, THROUGHPUT_LOG, latest_checkpoint, list_checkpoints, load_config, train
+from src.testing import FakeScenario, FakeTrainerEnvironment, evaluate_fake_episode, make_fake_env
+
+
+def make_config(out_dir, **overrides):
+    config = dict(DEFAULT_CONFIG, out_dir=out_dir, total_steps=48, checkpoint_every=16, n_envs=2, vec_env='dummy',
+                  scenario={'num_asteroids': 5},
+                  ppo={'policy': 'MultiInputPolicy', 'device': 'cpu', 'n_steps': 8, 'batch_size': 8, 'n_epochs': 1})
+    config.update(overrides)
+    return config
+
+
+@mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+@mock.patch('src.training.Scenario', FakeScenario)
+class TestTraining(unittest.TestCase):
+    def test_checkpoints(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            model = train(make_config(tmp))
+            self.assertEqual(model.num_timesteps, 48)
+            self.assertEqual([steps for steps, _ in list_checkpoints(tmp)], [16, 32, 48])
+            self.assertFalse([name for name in os.listdir(tmp) if name.endswith('.tmp')])
+
+            with open(os.path.join(tmp, THROUGHPUT_LOG)) as f:
+                rows = list(csv.DictReader(f))
+            # One row per rollout of 2 envs x 8 steps
+            self.assertEqual([int(row['timesteps']) for row in rows], [16, 32, 48])
+            self.assertTrue(all(float(row['samples_per_second']) <= float(row['env_steps_per_second'])
+                                for row in rows))
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            train(make_config(tmp, total_steps=32))
+            # As if the run had crashed after the first checkpoint
+            os.remove(latest_checkpoint(tmp))
+            saved = PPO.load(latest_checkpoint(tmp), device='cpu')
+
+            with mock.patch.object(PPO, 'learn', autospec=True, side_effect=PPO.learn) as learn, \
+                    mock.patch.object(PPO, 'set_random_seed', autospec=True,
+                                      side_effect=PPO.set_random_seed) as set_random_seed:
+                model = train(make_config(tmp, seed=3))
+            # Picked up at 16 steps, and only trained the remaining two chunks
+            self.assertEqual([call.args[1] for call in learn.call_args_list], [16, 16])
+            # Reseeded past the episodes the first run already played (after PPO.load restored the saved seed)
+            self.assertEqual(set_random_seed.call_args.args[1], 3 + 16)
+            self.assertEqual(model.num_timesteps, 48)
+            self.assertEqual([steps for steps, _ in list_checkpoints(tmp)], [16, 32, 48])
+
+            with open(os.path.join(tmp, THROUGHPUT_LOG)) as f:
+                self.assertEqual([int(row['timesteps']) for row in csv.DictReader(f)], [16, 32, 32, 48])
+
+            # The checkpoints hold the optimizer state too
+            restored = PPO.load(os.path.join(tmp, 'checkpoint_000000000016.zip'), device='cpu')
+            self.assertTrue(restored.policy.optimizer.state_dict()['state'])
+            for saved_state, restored_state in zip(saved.policy.optimizer.state_dict()['state'].values(),
+                                                   restored.policy.optimizer.state_dict()['state'].values()):
+                self.assertTrue(torch.equal(saved_state['exp_avg'], restored_state['exp_avg']))
+
+    @mock.patch('src.training.make_env', make_fake_env)
+    def test_shm(self):
+        # The workers don't see mock.patch, so they build their envs with make_fake_env instead
+        with tempfile.TemporaryDirectory() as tmp:
+            model = train(make_config(tmp, total_steps=16, vec_env='shm'))
+            self.assertEqual(model.num_timesteps, 16)
+            self.assertEqual([steps for steps, _ in list_checkpoints(tmp)], [16])
+
+    def test_keep_checkpoints(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            train(make_config(tmp, keep_checkpoints=2))
+            self.assertEqual([steps for steps, _ in list_checkpoints(tmp)], [32, 48])
+
+    @mock.patch('src.evaluation.evaluate_episode', evaluate_fake_episode)
+    def test_keep_checkpoints_with_evaluation(self):
+        # The evaluation workers still need the older checkpoints after the next ones are saved
+        with tempfile.TemporaryDirectory() as tmp:
+            evaluation = {'scenarios': {'num_asteroids': [3], 'seeds': [0, 1]}, 'n_workers': 2}
+            with mock.patch('src.training.print_report') as print_report:
+                train(make_config(tmp, keep_checkpoints=1, evaluation=evaluation))
+            self.assertEqual([steps for steps, _ in list_checkpoints(tmp)], [48])
+            # Every checkpoint was evaluated in full
+            reports = {}
+            for call in print_report.call_args_list:
+                reports.update(call.args[0])
+            self.assertEqual(sorted(os.path.basename(path) for path in reports),
+                             [f'checkpoint_{steps:012d}.zip' for steps in [16, 32, 48]])
+            self.assertEqual([row['episodes'] for row in reports.values()], [2, 2, 2])
+
+    def test_load_config(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'config.json')
+            with open(path, 'w') as f:
+                json.dump({'total_steps': 100, 'env': {'action_repeat': 2}}, f)
+            config = load_config(path)
+            self.assertEqual(config['total_steps'], 100)
+            self.assertEqual(config['env'], {'action_repeat': 2})
+            self.assertEqual(config['checkpoint_every'], DEFAULT_CONFIG['checkpoint_every'])
+
+            with open(path, 'w') as f:
+                json.dump({'total_step': 100}, f)
+            with self.assertRaises(ValueError):
+                load_config(path)
+
+            # list[:-0] is empty, so keeping 0 would quietly keep everything
+            for keep in [0, -1]:
+                with open(path, 'w') as f:
+                    json.dump({'keep_checkpoints': keep}, f)
+                with self.assertRaises(ValueError):
+                    load_config(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
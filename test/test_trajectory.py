@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from src.envs import RadarEnv
+from src.envs.recording import RecordingWrapper
+from src.observation import ObservationEngine
+from src.trajectory import TrajectoryReader, TrajectoryWriter
+from src.testing import FakeTrainerEnvironment, make_game_state
+
+
+def make_frames():
+    # Varying asteroid counts (including none at all), and a change of map size part way through
+    return [make_game_state(n, seed, map_size=(1000, 800) if seed < 4 else (600, 600))
+            for seed, n in enumerate([5, 0, 30, 12, 40, 1, 25])]
+
+
+class TestTrajectory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_featurize_matches_engine(self):
+        frames = make_frames()
+        with TrajectoryWriter(self.path, chunk_frames=3) as writer:
+            for frame, game_state in enumerate(frames):
+                writer.append(game_state)
+                if frame == 2:
+                    writer.end_episode()
+
+        reader = TrajectoryReader(self.path)
+        self.assertEqual(len(reader.chunks), 3)
+        self.assertEqual(len(reader), len(frames))
+        np.testing.assert_array_equal(reader.episodes, [0, 0, 0, 1, 1, 1, 1])
+
+        # Any radar configuration can be replayed, not just the one used while recording
+        for radar_zones, n_sectors, forecast_frames in [([100, 250, 400], 4, 30), ([50, 150], 8, [10, 60])]:
+            engine = ObservationEngine(radar_zones, n_sectors=n_sectors, forecast_frames=forecast_frames)
+            features = reader.featurize(radar_zones, n_sectors=n_sectors, forecast_frames=forecast_frames)
+            for frame, game_state in enumerate(frames):
+                expected = engine.observe(game_state)
+                for key in expected:
+                    assert_allclose(features[key][frame], expected[key], atol=1e-12)
+
+    def test_append_to_existing(self):
+        frames = make_frames()
+        with TrajectoryWriter(self.path) as writer:
+            writer.append(frames[0])
+        with TrajectoryWriter(self.path, dtype=np.float32) as writer:
+            writer.append(frames[2])
+
+        reader = TrajectoryReader(self.path, mmap=False)
+        np.testing.assert_array_equal(reader.episodes, [0, 1])
+        self.assertEqual(reader.chunks[1]['asteroids'].dtype, np.float32)
+        engine = ObservationEngine()
+        assert_allclose(reader.featurize()['radar'][1], engine.observe(frames[2])['radar'], atol=1e-6)
+
+    def test_empty(self):
+        features = TrajectoryReader(self.path).featurize([100, 200], n_sectors=8)
+        self.assertEqual(features['radar'].shape, (0, 2, 8))
+
+    @mock.patch('src.envs.radar_env.TrainerEnvironment', FakeTrainerEnvironment)
+    def test_recording_wrapper(self):
+        env = RecordingWrapper(RadarEnv({'frames': 3}), self.path)
+        observations = []
+        for _ in range(2):
+            obs, _ = env.reset()
+            observations.append(obs)
+            terminated = False
+            while not terminated:
+                obs, _, terminated, _, _ = env.step(np.zeros(2))
+                observations.append(obs)
+        env.close()
+
+        reader = TrajectoryReader(self.path)
+        np.testing.assert_array_equal(reader.episodes, [0, 0, 0, 0, 1, 1, 1, 1])
+        features = reader.featurize(env.unwrapped.radar_zones, forecast_frames=env.unwrapped.forecast_frames)
+        for frame, obs in enumerate(observations):
+            for key in obs:
+                assert_allclose(features[key][frame], obs[key], atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()